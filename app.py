@@ -5,18 +5,25 @@ Aplicación para conversar con documentos PDF usando RAG + Mistral AI
 
 import os
 import gc
+import uuid
 from typing import List, Tuple, Optional
-from io import BytesIO
 
 import streamlit as st
 from dotenv import load_dotenv
 from langchain_mistralai import ChatMistralAI
-from pypdf import PdfReader
 
+from src.answer_cache import AnswerCache, get_answer_cache, get_semantic_answer_cache
+from src.answer_streaming import AnswerTiming, stream_answer
+from src.context_assembler import AssembledContext, assemble_context
 from src.rag_engine import (
-    ingest_pdf_from_buffer,
-    similarity_search,
-    DEFAULT_MODEL_NAME
+    compute_document_hash,
+    ingest_pdf_shared,
+    release_shared_index,
+    touch_shared_index,
+    warmup_embeddings,
+    RetrievalCache,
+    DEFAULT_MODEL_NAME,
+    RETRIEVAL_MAX_K
 )
 
 # Cargar variables de entorno
@@ -60,42 +67,84 @@ def get_mistral_llm(model: str = "mistral-small-latest") -> Optional[ChatMistral
         return None
 
 
-def generate_answer_with_mistral(
-    llm: ChatMistralAI,
+@st.cache_resource(show_spinner=False)
+def warmup_embeddings_model(model_name: str) -> bool:
+    """
+    Precarga el modelo de embeddings una sola vez por proceso del servidor.
+    Así la primera subida de PDF no paga el tiempo de carga del modelo.
+
+    Args:
+        model_name: Modelo de embeddings a precargar
+
+    Returns:
+        True si el modelo quedó cargado en el registro
+    """
+    try:
+        warmup_embeddings([model_name])
+        return True
+    except Exception as e:
+        st.warning(f"⚠️ No se pudo precargar el modelo de embeddings: {e}")
+        return False
+
+
+def render_indexing_progress(index) -> None:
+    """
+    Muestra cuánto del documento está indexado mientras la ingesta sigue en segundo plano.
+    Solo mientras hay una indexación en curso se refresca cada 2 segundos.
+
+    Args:
+        index: Índice progresivo de la sesión
+    """
+    if index is None:
+        return
+
+    if index.is_building:
+        _render_live_indexing_progress(index)
+    elif index.error is not None:
+        st.warning(
+            f"⚠️ La indexación se detuvo en {index.pages_indexed} de {index.total_pages} páginas. "
+            "Las respuestas se basan solo en esa parte del documento."
+        )
+
+
+@st.fragment(run_every=2)
+def _render_live_indexing_progress(index) -> None:
+    """
+    Barra de progreso que se re-ejecuta cada 2 segundos sin recargar el resto de la página.
+    Al terminar la indexación recarga la página una vez para actualizar las estadísticas.
+    """
+    if not index.is_building:
+        st.rerun(scope="app")
+
+    st.progress(
+        index.coverage,
+        text=f"🔄 Indexado {index.pages_indexed} de {index.total_pages} páginas — ya puedes hacer preguntas"
+    )
+
+
+def build_mistral_messages(
     query: str,
     context_chunks: List[Tuple[str, float]],
     detail_level: str = "Balanceado"
-) -> str:
+) -> Tuple[List[dict], AssembledContext]:
     """
-    Genera una respuesta usando Mistral AI con el contexto recuperado.
+    Construye los mensajes para Mistral AI con el contexto recuperado.
 
     MEJORAS DE PRECISIÓN:
     - Re-ranking de chunks por score de relevancia
     - Prompt mejorado con ejemplos (few-shot learning)
     - Metadata de relevancia en cada fragmento
     - Instrucciones específicas para respuestas estructuradas
+    - Presupuesto de tokens (MISTRAL_CONTEXT_TOKEN_BUDGET) sin solapamientos repetidos
 
     Args:
-        llm: Instancia de ChatMistralAI
         query: Pregunta del usuario
         context_chunks: Lista de (chunk_text, score) del RAG
+        detail_level: Nivel de detalle de la respuesta
 
     Returns:
-        Respuesta generada por el LLM
+        Tupla (mensajes del chat (system + user), contexto ensamblado)
     """
-    # Re-ranking: ordenar chunks por score (menor score = mayor relevancia)
-    sorted_chunks = sorted(context_chunks, key=lambda x: x[1])
-
-    # Construir contexto con metadata de relevancia
-    context_parts = []
-    for i, (chunk, score) in enumerate(sorted_chunks, start=1):
-        relevance_pct = (1 - score) * 100  # Convertir distancia a %
-        context_parts.append(
-            f"[Fragmento {i} - Relevancia: {relevance_pct:.1f}%]\n{chunk}"
-        )
-
-    context = "\n\n---\n\n".join(context_parts)
-
     # Ajustar instrucciones según nivel de detalle
     detail_instructions = {
         "Conciso": "Sé MUY breve y directo. Responde en 1-2 oraciones máximo, solo lo esencial.",
@@ -135,7 +184,7 @@ Respuesta (si no hay info): "No encuentro información sobre el autor en el docu
 Pregunta: "¿Cuándo se publicó?"
 Respuesta (info parcial): "El documento menciona el año 2023 [Fragmento 1], pero no especifica el mes o día exacto de publicación."""
 
-    user_prompt = f"""**Contexto del documento:**
+    user_prompt_template = """**Contexto del documento:**
 
 {context}
 
@@ -144,11 +193,39 @@ Respuesta (info parcial): "El documento menciona el año 2023 [Fragmento 1], per
 
 **Tu respuesta (siguiendo el formato estructurado):**"""
 
-    # Invocar Mistral
+    # Re-ranking por score y selección de fragmentos dentro del presupuesto de tokens
+    context = assemble_context(
+        context_chunks,
+        fixed_prompt=system_prompt + user_prompt_template.format(context="", query=query)
+    )
+    user_prompt = user_prompt_template.format(context=context.text, query=query)
+
     messages = [
         {"role": "system", "content": system_prompt},
         {"role": "user", "content": user_prompt}
     ]
+    return messages, context
+
+
+def generate_answer_with_mistral(
+    llm: ChatMistralAI,
+    query: str,
+    context_chunks: List[Tuple[str, float]],
+    detail_level: str = "Balanceado"
+) -> str:
+    """
+    Genera una respuesta usando Mistral AI con el contexto recuperado (llamada bloqueante).
+
+    Args:
+        llm: Instancia de ChatMistralAI
+        query: Pregunta del usuario
+        context_chunks: Lista de (chunk_text, score) del RAG
+        detail_level: Nivel de detalle de la respuesta
+
+    Returns:
+        Respuesta generada por el LLM
+    """
+    messages, _ = build_mistral_messages(query, context_chunks, detail_level)
 
     try:
         response = llm.invoke(messages)
@@ -157,6 +234,22 @@ Respuesta (info parcial): "El documento menciona el año 2023 [Fragmento 1], per
         return f"❌ Error generando respuesta: {e}"
 
 
+def render_answer(container, answer: str, cursor: bool = False) -> None:
+    """
+    Muestra la respuesta en un contenedor destacado.
+
+    Args:
+        container: Contenedor de Streamlit (st.empty()) que se sobrescribe en cada token
+        answer: Texto de la respuesta hasta el momento
+        cursor: Si True, añade un cursor al final (respuesta en curso)
+    """
+    container.markdown(f"""
+        <div style='background-color: #f0f2f6; padding: 1.5rem; border-radius: 10px; border-left: 4px solid #FF4B4B;'>
+            {answer}{"▌" if cursor else ""}
+        </div>
+    """, unsafe_allow_html=True)
+
+
 def main():
     """Función principal de la aplicación Streamlit"""
 
@@ -273,8 +366,8 @@ def main():
             top_k = st.slider(
                 "Fragmentos a recuperar",
                 min_value=1,
-                max_value=10,
-                value=5,
+                max_value=RETRIEVAL_MAX_K,
+                value=min(5, RETRIEVAL_MAX_K),
                 help="Número de fragmentos relevantes del documento (más fragmentos = más contexto pero puede incluir info menos relevante)"
             )
 
@@ -290,10 +383,15 @@ def main():
 
         # Botón para limpiar sesión
         if st.button("🗑️ Limpiar sesión", help="Elimina el documento actual y libera la memoria"):
-            # Eliminar referencias
+            # Liberar el índice compartido y eliminar referencias
+            if st.session_state.get("doc_hash") and st.session_state.get("session_id"):
+                release_shared_index(st.session_state.doc_hash, st.session_state.session_id)
             st.session_state.faiss_db = None
+            st.session_state.parsed_document = None
             st.session_state.uploaded_filename = None
+            st.session_state.doc_hash = None
             st.session_state.session_id = None
+            st.session_state.retrieval_cache = None
 
             # Forzar garbage collection para liberar memoria
             gc.collect()
@@ -337,6 +435,10 @@ def main():
                 [GitHub](https://github.com/antuansabe/PaperWhisper) • [Docs](./QUICKSTART.md)
             """)
 
+    # Precargar modelo de embeddings (solo la primera vez en el proceso)
+    with st.spinner("🧬 Cargando modelo de embeddings..."):
+        warmup_embeddings_model(embeddings_model)
+
     # Main content con diseño mejorado
     st.markdown('<h3 style="margin-bottom: 0.5rem;">📤 Paso 1: Sube tu documento</h3>', unsafe_allow_html=True)
 
@@ -350,26 +452,47 @@ def main():
     # Inicializar session_state para el índice FAISS (aislamiento por usuario)
     if "faiss_db" not in st.session_state:
         st.session_state.faiss_db = None
+    if "parsed_document" not in st.session_state:
+        st.session_state.parsed_document = None
     if "uploaded_filename" not in st.session_state:
         st.session_state.uploaded_filename = None
+    if "doc_hash" not in st.session_state:
+        st.session_state.doc_hash = None
+    if not st.session_state.get("session_id"):
+        st.session_state.session_id = uuid.uuid4().hex
+    # Búsquedas de esta sesión: cambiar top_k, el nivel de detalle o el modelo no repite FAISS
+    if st.session_state.get("retrieval_cache") is None:
+        st.session_state.retrieval_cache = RetrievalCache()
 
     # Procesar PDF si se sube
     db = None
     if uploaded_file is not None:
-        # Si es un archivo nuevo, recrear el índice
-        if st.session_state.uploaded_filename != uploaded_file.name:
-            # PRIVACIDAD: Procesar PDF directamente desde memoria (BytesIO)
+        # Identificar el documento por su contenido, no por su nombre
+        pdf_bytes = uploaded_file.getvalue()
+        doc_hash = compute_document_hash(pdf_bytes)
+
+        # Si es un documento nuevo, obtener su índice (compartido si otra sesión ya lo procesó)
+        if st.session_state.doc_hash != doc_hash:
+            # Liberar el índice del documento anterior de esta sesión
+            if st.session_state.doc_hash:
+                release_shared_index(st.session_state.doc_hash, st.session_state.session_id)
+                st.session_state.faiss_db = None
+                st.session_state.parsed_document = None
+                st.session_state.doc_hash = None
+                st.session_state.retrieval_cache.clear()
+
+            # PRIVACIDAD: Procesar PDF directamente desde memoria
             # No se guarda NADA en disco
-            pdf_buffer = BytesIO(uploaded_file.getvalue())
-
-            # Ingerir PDF al índice EN MEMORIA (100% privado)
             with st.spinner("🔄 Procesando tu documento en memoria..."):
                 try:
-                    db = ingest_pdf_from_buffer(
-                        pdf_buffer,
+                    doc_hash, db, parsed_document = ingest_pdf_shared(
+                        pdf_bytes,
+                        st.session_state.session_id,
                         model_name=embeddings_model
                     )
                     st.session_state.faiss_db = db
+                    st.session_state.parsed_document = parsed_document
+                    st.session_state.doc_hash = doc_hash
                     st.session_state.uploaded_filename = uploaded_file.name
                     st.success(f"✅ **{uploaded_file.name}** procesado de forma segura (solo en memoria)")
                 except Exception as e:
@@ -378,37 +501,36 @@ def main():
         else:
             # Usar índice existente de la sesión
             db = st.session_state.faiss_db
+            touch_shared_index(doc_hash, st.session_state.session_id)
             if db:
                 st.success(f"✅ **{uploaded_file.name}** listo para consultas")
 
+        # Progreso de la indexación en segundo plano (documentos grandes)
+        render_indexing_progress(db)
+
         # Vista previa del documento en un expander
-        with st.expander("👁️ Ver vista previa del documento", expanded=False):
-            try:
-                # Leer directamente del uploaded_file buffer
-                pdf_bytes = BytesIO(uploaded_file.getvalue())
-                reader = PdfReader(pdf_bytes)
-                preview_text = ""
-                for page in reader.pages[:3]:  # Primeras 3 páginas
-                    preview_text += page.extract_text()
-
-                preview_text = preview_text[:1500]
+        # Reutiliza el documento parseado durante la ingesta (sin volver a leer el PDF)
+        parsed_document = st.session_state.parsed_document
+        if parsed_document is not None:
+            with st.expander("👁️ Ver vista previa del documento", expanded=False):
                 st.text_area(
                     "Primeros 1500 caracteres",
-                    value=preview_text,
+                    value=parsed_document.preview(max_pages=3, max_chars=1500),
                     height=250,
                     disabled=True,
                     label_visibility="collapsed"
                 )
-
-                # Contar caracteres totales
-                total_text = ""
-                pdf_bytes.seek(0)
-                reader = PdfReader(pdf_bytes)
-                for page in reader.pages:
-                    total_text += page.extract_text()
-                st.caption(f"📊 Documento completo: {len(total_text):,} caracteres")
-            except Exception as e:
-                st.warning(f"⚠️ No se pudo generar vista previa: {e}")
+                st.caption(
+                    f"📊 Documento completo: {parsed_document.char_count:,} caracteres • "
+                    f"{parsed_document.page_count} páginas • "
+                    f"extraído en {parsed_document.extraction_seconds:.1f}s"
+                )
+                if db is not None and db.truncation.total_tokens:
+                    st.caption(
+                        f"✂️ Tokens truncados por el modelo de embeddings: "
+                        f"{db.truncation.truncated_tokens:,} de {db.truncation.total_tokens:,} "
+                        f"({db.truncation.truncated_ratio:.1%})"
+                    )
 
     # Sección de consulta con mejor diseño
     st.markdown('<h3 style="margin-top: 0.5rem; margin-bottom: 0.5rem;">💬 Paso 2: Haz tu pregunta</h3>', unsafe_allow_html=True)
@@ -436,7 +558,9 @@ def main():
         # Búsqueda de chunks relevantes
         with st.spinner("🔍 Buscando información relevante en el documento..."):
             try:
-                results: List[Tuple[str, float]] = similarity_search(db, query, k=top_k)
+                results: List[Tuple[str, float]] = st.session_state.retrieval_cache.search(
+                    db, query, k=top_k, doc_key=st.session_state.doc_hash
+                )
             except Exception as e:
                 st.error(f"❌ Error en búsqueda semántica: {e}")
                 return
@@ -448,16 +572,58 @@ def main():
         else:
             st.markdown("### 🤖 Respuesta")
 
+            # La respuesta se pinta a medida que llegan los tokens
+            answer_box = st.empty()
+            timing = AnswerTiming()
+            answer_cache = get_answer_cache()
+            semantic_cache = get_semantic_answer_cache()
             with st.spinner("🤖 Generando respuesta..."):
                 try:
-                    answer = generate_answer_with_mistral(llm, query, results, detail_level)
-
-                    # Mostrar respuesta en un contenedor destacado
-                    st.markdown(f"""
-                        <div style='background-color: #f0f2f6; padding: 1.5rem; border-radius: 10px; border-left: 4px solid #FF4B4B;'>
-                            {answer}
-                        </div>
-                    """, unsafe_allow_html=True)
+                    messages, context = build_mistral_messages(query, results, detail_level)
+                    # Misma pregunta, documento, fragmentos, modelo y nivel de detalle: sin llamar a Mistral
+                    cache_key = AnswerCache.make_key(
+                        st.session_state.doc_hash, query, context.fragments, mistral_model, detail_level
+                    )
+                    answer = answer_cache.get(cache_key)
+                    similar = None
+                    if answer is None:
+                        # Pregunta parafraseada: el embedding sale del modelo ya cargado (y de su caché de consultas)
+                        question_vector = db.embeddings.embed_query(query)
+                        similar = semantic_cache.get(
+                            st.session_state.doc_hash, query, question_vector, mistral_model, detail_level, top_k
+                        )
+                    if answer is not None:
+                        render_answer(answer_box, answer)
+                        st.caption(
+                            f"♻️ Respuesta en caché (sin llamar a Mistral) · "
+                            f"{answer_cache.stats()['hit_rate']:.0%} de aciertos en la caché de respuestas"
+                        )
+                    elif similar is not None:
+                        answer, similarity = similar
+                        render_answer(answer_box, answer)
+                        st.caption(
+                            f"♻️ Respuesta de una pregunta similar ({similarity:.0%} de similitud, "
+                            f"sin llamar a Mistral)"
+                        )
+                    else:
+                        answer = ""
+                        for answer in stream_answer(llm, messages, timing):
+                            render_answer(answer_box, answer, cursor=True)
+                        render_answer(answer_box, answer)
+                        # Las respuestas sobre un índice parcial no se reutilizan al completarse
+                        if not db.is_building:
+                            answer_cache.put(cache_key, answer)
+                            semantic_cache.put(
+                                st.session_state.doc_hash, query, question_vector, answer,
+                                mistral_model, detail_level, top_k
+                            )
+                        mode = "streaming" if timing.streamed else "sin streaming"
+                        dropped = f", {context.dropped} fuera de presupuesto" if context.dropped else ""
+                        st.caption(
+                            f"⚡ Primer token en {timing.time_to_first_token or 0:.2f}s · "
+                            f"respuesta completa en {timing.total_seconds:.1f}s ({mode}) · "
+                            f"🧮 {len(context.fragments)} fragmentos, ~{context.tokens:,} tokens de prompt{dropped}"
+                        )
                 except Exception as e:
                     st.error(f"❌ Error generando respuesta: {e}")
 
@@ -466,7 +632,7 @@ def main():
         with st.expander(f"📚 Ver fragmentos relevantes ({len(results)} encontrados)", expanded=False):
             st.caption("Los fragmentos más similares a tu pregunta:")
             for i, (chunk, score) in enumerate(results, start=1):
-                similarity_pct = (1 - score) * 100  # Convertir distancia a porcentaje
+                similarity_pct = score * 100  # Similitud coseno a porcentaje
                 st.markdown(f"**Fragmento {i}** — Relevancia: {similarity_pct:.1f}%")
                 st.text(chunk)
                 st.markdown("---")
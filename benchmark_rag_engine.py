@@ -0,0 +1,272 @@
+"""
+Benchmarks del RAG engine de PaperWhisper
+Ejecutar con: python benchmark_rag_engine.py [chunking] [index] [embeddings] [backends] [padding]
+"""
+
+import os
+import random
+import sys
+import textwrap
+import time
+from typing import Callable, List
+
+from dotenv import load_dotenv
+
+# Cargar variables de entorno
+load_dotenv()
+
+CHUNKING_SIZES = [10_000, 100_000, 1_000_000, 5_000_000]
+INDEX_SIZES = [10_000, 50_000]
+INDEX_DIMENSION = 384
+INDEX_QUERIES = 200
+EMBEDDING_CHUNKS = 512
+BACKEND_QUERIES = 50
+
+
+def _synthetic_text(n_chars: int, seed: int = 42) -> str:
+    """Genera texto con párrafos, líneas y frases de longitud variable (como el extraído de un paper)."""
+    rng = random.Random(seed)
+    words = (
+        "el la de que en los las un una por con para modelo datos resultados análisis "
+        "método propuesto embeddings recuperación documento sección tabla figura "
+        "significativo experimento evaluación precisión rendimiento memoria índice"
+    ).split()
+
+    paragraphs: List[str] = []
+    total = 0
+    while total < n_chars:
+        sentences = []
+        for _ in range(rng.randint(1, 8)):
+            sentence = " ".join(rng.choice(words) for _ in range(rng.randint(4, 30)))
+            sentences.append(sentence.capitalize() + rng.choice([".", ".", ".", "?", ","]))
+        # pypdf devuelve un salto de línea por cada línea visual (~90 caracteres)
+        paragraph = textwrap.fill(" ".join(sentences), width=rng.randint(70, 100))
+        paragraphs.append(paragraph)
+        total += len(paragraph) + 2
+    return "\n\n".join(paragraphs)[:n_chars]
+
+
+def _best_of(func: Callable[[], object], repeat: int) -> float:
+    """Tiempo mínimo de `repeat` ejecuciones."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def bench_chunking():
+    """Compara el chunker nativo con RecursiveCharacterTextSplitter"""
+    from src.rag_engine import split_into_chunks, DEFAULT_CHUNK_SIZE, DEFAULT_CHUNK_OVERLAP
+
+    print("\n⏱️  Chunking: nativo vs LangChain "
+          f"(chunk_size={DEFAULT_CHUNK_SIZE}, overlap={DEFAULT_CHUNK_OVERLAP})")
+    print(f"{'caracteres':>12} | {'chunker':>9} | {'chunks':>7} | {'media':>6} | {'tiempo':>9} | {'MB/s':>7}")
+    print("-" * 66)
+
+    for n_chars in CHUNKING_SIZES:
+        text = _synthetic_text(n_chars)
+        repeat = 5 if n_chars <= 100_000 else 2
+
+        for chunker in ("native", "langchain"):
+            chunks = split_into_chunks(text, chunker=chunker)
+            seconds = _best_of(lambda: split_into_chunks(text, chunker=chunker), repeat)
+            mean_len = sum(len(c) for c in chunks) / len(chunks)
+            mb_per_s = n_chars / 1_000_000 / seconds if seconds else float("inf")
+            print(f"{n_chars:>12,} | {chunker:>9} | {len(chunks):>7,} | {mean_len:>6.0f} | "
+                  f"{seconds * 1000:>7.1f}ms | {mb_per_s:>7.1f}")
+
+
+def _clustered_vectors(n: int, dimension: int, seed: int = 42):
+    """Vectores normalizados agrupados en temas (más realistas que ruido uniforme)."""
+    import faiss
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(max(10, n // 100), dimension)).astype(np.float32)
+    vectors = centers[rng.integers(0, len(centers), n)]
+    vectors = vectors + 0.5 * rng.normal(size=vectors.shape).astype(np.float32)
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+def bench_index():
+    """Compara construcción, latencia y recall@10 de flat, HNSW e IVF"""
+    import numpy as np
+    from src.rag_engine import VectorIndex
+
+    print(f"\n⏱️  Índices FAISS (dim={INDEX_DIMENSION}, {INDEX_QUERIES} queries, top-10)")
+    print(f"{'vectores':>10} | {'tipo':>6} | {'parámetros':>22} | {'build':>7} | {'ms/query':>8} | {'recall':>6}")
+    print("-" * 76)
+
+    for n in INDEX_SIZES:
+        vectors = _clustered_vectors(n + INDEX_QUERIES, INDEX_DIMENSION)
+        corpus, queries = vectors[:n], vectors[n:]
+        expected = None
+
+        for kind in ("flat", "hnsw", "ivf"):
+            db = VectorIndex(embeddings=None)
+            start = time.perf_counter()
+            db.add(corpus)
+            db.optimize(kind=kind)
+            build = time.perf_counter() - start
+
+            seconds = _best_of(lambda: db.index.search(queries, 10), 2)
+            _, found = db.index.search(queries, 10)
+            if expected is None:
+                expected = found
+            recall = np.mean([len(set(a) & set(b)) / 10 for a, b in zip(found, expected)])
+
+            spec = db.spec
+            params = {
+                "flat": "-",
+                "hnsw": f"M={spec.hnsw_m} ef={spec.ef_search}",
+                "ivf": f"nlist={spec.nlist} nprobe={spec.nprobe}",
+            }[kind]
+            print(f"{n:>10,} | {kind:>6} | {params:>22} | {build:>6.1f}s | "
+                  f"{seconds * 1000 / len(queries):>8.3f} | {recall:>6.3f}")
+
+
+def bench_embeddings():
+    """Mide chunks/segundo del modelo en un proceso frente al pool de procesos"""
+    from src.embedding_pool import EmbeddingPool
+    from src.rag_engine import generate_embeddings, split_into_chunks, DEFAULT_MODEL_NAME
+
+    chunks = split_into_chunks(_synthetic_text(EMBEDDING_CHUNKS * 800))[:EMBEDDING_CHUNKS]
+    local = generate_embeddings().embeddings
+    cores = os.cpu_count() or 1
+
+    print(f"\n⏱️  Embeddings de chunks ({len(chunks)} chunks, {DEFAULT_MODEL_NAME}, {cores} núcleos)")
+    print(f"{'procesos':>9} | {'hilos/proc':>10} | {'tiempo':>8} | {'chunks/s':>9}")
+    print("-" * 46)
+
+    seconds = _best_of(lambda: local.embed_documents(chunks), 2)
+    print(f"{'1 (local)':>9} | {'auto':>10} | {seconds:>7.2f}s | {len(chunks) / seconds:>9.1f}")
+
+    workers = 2
+    while workers <= cores:
+        pool = EmbeddingPool(DEFAULT_MODEL_NAME, fallback=local.embed_documents, workers=workers, min_texts=1)
+        try:
+            pool.embed_documents(chunks[:workers])  # arrancar procesos y cargar modelos
+            seconds = _best_of(lambda: pool.embed_documents(chunks), 2)
+        finally:
+            pool.shutdown()
+        print(f"{workers:>9} | {pool.threads:>10} | {seconds:>7.2f}s | {len(chunks) / seconds:>9.1f}")
+        workers *= 2
+
+
+def bench_backends():
+    """Compara PyTorch, ONNX y ONNX INT8: chunks/s, latencia de query y diferencia de vectores"""
+    import numpy as np
+    from src.rag_engine import get_embedding_registry, split_into_chunks, DEFAULT_MODEL_NAME
+
+    chunks = split_into_chunks(_synthetic_text(EMBEDDING_CHUNKS * 800))[:EMBEDDING_CHUNKS]
+    queries = [chunk[:80] for chunk in chunks[:BACKEND_QUERIES]]
+    registry = get_embedding_registry()
+    reference = None
+
+    print(f"\n⏱️  Backends de embeddings ({len(chunks)} chunks, {len(queries)} queries, {DEFAULT_MODEL_NAME})")
+    print(f"{'backend':>10} | {'chunks/s':>9} | {'query p50':>9} | {'query p95':>9} | {'coseno mín':>10}")
+    print("-" * 60)
+
+    for backend in ("torch", "onnx", "onnx-int8"):
+        try:
+            embeddings = registry.get(DEFAULT_MODEL_NAME, backend=backend)
+        except ImportError as e:
+            print(f"{backend:>10} | no disponible: {e}")
+            continue
+
+        vectors = np.array(embeddings.embed_documents(chunks))
+        seconds = _best_of(lambda: embeddings.embed_documents(chunks), 2)
+
+        latencies = []
+        for query in queries:
+            start = time.perf_counter()
+            embeddings.embed_query(query)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+        if reference is None:
+            reference = vectors
+        cosine = (vectors * reference).sum(axis=1).min()
+        print(f"{backend:>10} | {len(chunks) / seconds:>9.1f} | {np.percentile(latencies, 50):>7.2f}ms | "
+              f"{np.percentile(latencies, 95):>7.2f}ms | {cosine:>10.4f}")
+
+
+def _mixed_chunks(n: int) -> List[str]:
+    """Chunks como los de un paper: completos, colas de página y títulos."""
+    from src.rag_engine import split_into_chunks
+
+    rng = random.Random(7)
+    full = split_into_chunks(_synthetic_text(n * 800))
+    chunks = []
+    for chunk in full[:n]:
+        kind = rng.random()
+        if kind < 0.2:
+            chunk = chunk[:rng.randint(10, 60)]     # títulos
+        elif kind < 0.4:
+            chunk = chunk[:rng.randint(100, 400)]   # colas de página
+        chunks.append(chunk)
+    return chunks
+
+
+def bench_padding():
+    """Mide tokens reales vs relleno en orden del documento y por longitud"""
+    from src.rag_engine import get_embedding_registry, get_model_tokenizer, measure_padding, DEFAULT_MODEL_NAME
+
+    chunks = _mixed_chunks(EMBEDDING_CHUNKS)
+    registry = get_embedding_registry()
+    tokenizer, max_tokens = get_model_tokenizer(registry.get(DEFAULT_MODEL_NAME))
+
+    try:
+        onnx = registry.get(DEFAULT_MODEL_NAME, backend="onnx")
+    except ImportError:
+        onnx = None
+
+    print(f"\n⏱️  Relleno al embeber ({len(chunks)} chunks de longitud variable, lotes de 32)")
+    print(f"{'orden':>10} | {'tokens':>8} | {'relleno':>8} | {'% relleno':>9} | {'ONNX':>8}")
+    print("-" * 56)
+
+    for bucketed in (False, True):
+        report = measure_padding(chunks, tokenizer, max_tokens, batch_size=32, bucketed=bucketed)
+        timing = "-"
+        if onnx is not None:
+            onnx.length_bucketing = bucketed
+            timing = f"{_best_of(lambda: onnx.embed_documents(chunks), 2):.2f}s"
+        print(f"{'longitud' if bucketed else 'documento':>10} | {report.tokens:>8,} | "
+              f"{report.padded_tokens:>8,} | {report.padding_ratio:>8.1%} | {timing:>8}")
+    if onnx is not None:
+        onnx.length_bucketing = True
+
+
+BENCHMARKS = {
+    "chunking": bench_chunking,
+    "index": bench_index,
+    "embeddings": bench_embeddings,
+    "backends": bench_backends,
+    "padding": bench_padding,
+}
+
+
+def main():
+    """Ejecuta los benchmarks indicados (todos por defecto)"""
+    names = sys.argv[1:] or list(BENCHMARKS)
+
+    unknown = [name for name in names if name not in BENCHMARKS]
+    if unknown:
+        print(f"❌ Benchmarks desconocidos: {', '.join(unknown)}")
+        print(f"   Disponibles: {', '.join(BENCHMARKS)}")
+        return 1
+
+    print("=" * 66)
+    print("📈 BENCHMARKS - PaperWhisper RAG Engine")
+    print("=" * 66)
+
+    for name in names:
+        BENCHMARKS[name]()
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
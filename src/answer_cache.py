@@ -0,0 +1,362 @@
+"""
+Caché de respuestas de Mistral para PaperWhisper.
+La misma pregunta sobre el mismo documento (habitual con papers públicos
+populares) devuelve la respuesta guardada en lugar de repetir una llamada
+de pago de varios segundos a Mistral.
+
+La clave combina el hash del contenido del documento, la pregunta
+normalizada, los fragmentos enviados en el prompt, el modelo de Mistral y el
+nivel de detalle: si cambia cualquiera de ellos la respuesta se vuelve a
+generar. Las entradas caducan (TTL) y el número de entradas está acotado (LRU).
+
+La caché semántica (SemanticAnswerCache) cubre además las preguntas
+parafraseadas ("¿De qué trata el documento?" / "¿Cuál es el tema principal?"):
+guarda el embedding de cada pregunta respondida en un pequeño índice FAISS por
+documento y reutiliza la respuesta si una pregunta nueva supera el umbral de
+similitud coseno. Solo se usa con preguntas de texto distinto: si la misma
+pregunta no está en la caché exacta es porque cambió su contexto (fragmentos,
+top_k), y entonces la respuesta se vuelve a generar.
+
+PRIVACIDAD: Todo vive en RAM, nunca se escribe en disco. La pregunta y los
+fragmentos solo se guardan como hash (o como vector, en la caché semántica);
+la respuesta se comparte únicamente con sesiones que hacen la misma pregunta
+(o una equivalente) sobre el mismo documento.
+"""
+
+import os
+import time
+import hashlib
+import logging
+import threading
+import unicodedata
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+import faiss
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Segundos que una respuesta sigue siendo válida
+ANSWER_CACHE_TTL_SECONDS = int(os.getenv("ANSWER_CACHE_TTL_SECONDS", "3600"))
+
+# Respuestas guardadas como máximo (0 = caché desactivada)
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "512"))
+
+# Similitud coseno mínima para reutilizar la respuesta de una pregunta parecida
+# (1.0 = solo preguntas prácticamente idénticas)
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.9"))
+
+# Preguntas recordadas por documento y documentos con caché semántica
+SEMANTIC_CACHE_MAX_PER_DOCUMENT = int(os.getenv("SEMANTIC_CACHE_MAX_PER_DOCUMENT", "256"))
+SEMANTIC_CACHE_MAX_DOCUMENTS = int(os.getenv("SEMANTIC_CACHE_MAX_DOCUMENTS", "64"))
+
+
+def normalize_question(question: str) -> str:
+    """
+    Normaliza una pregunta para compararla (Unicode NFC, mayúsculas y espacios).
+
+    Args:
+        question: Pregunta del usuario
+
+    Returns:
+        Pregunta normalizada
+    """
+    return unicodedata.normalize("NFC", " ".join(question.split())).casefold()
+
+
+class AnswerCache:
+    """
+    Caché en memoria de respuestas con caducidad (TTL) y límite de entradas (LRU).
+    Es segura para usarla desde varias sesiones (hilos) a la vez.
+    """
+
+    def __init__(self, ttl_seconds: int = ANSWER_CACHE_TTL_SECONDS, max_entries: int = ANSWER_CACHE_MAX_ENTRIES):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+
+    @staticmethod
+    def make_key(
+        doc_hash: str,
+        question: str,
+        fragments: List[Tuple[str, float]],
+        model: str,
+        detail_level: str
+    ) -> str:
+        """
+        Clave de una respuesta.
+
+        Args:
+            doc_hash: Hash del contenido del documento
+            question: Pregunta del usuario (se normaliza)
+            fragments: Fragmentos (texto, score) enviados en el prompt
+            model: Modelo de Mistral
+            detail_level: Nivel de detalle solicitado
+
+        Returns:
+            Hash SHA-256 (hexadecimal)
+        """
+        digest = hashlib.sha256()
+        for part in (doc_hash, normalize_question(question), model, detail_level):
+            digest.update(part.encode("utf-8") + b"\0")
+        for text, _ in fragments:
+            digest.update(hashlib.sha256(text.encode("utf-8")).digest())
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        Devuelve la respuesta guardada (None si no existe o caducó).
+
+        Args:
+            key: Clave de make_key
+
+        Returns:
+            Respuesta o None
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] < time.monotonic():
+                del self._entries[key]
+                self.expired += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: str, answer: str):
+        """
+        Guarda una respuesta (descarta la menos usada si se supera el límite).
+
+        Args:
+            key: Clave de make_key
+            answer: Respuesta generada
+        """
+        if self.max_entries <= 0 or not answer:
+            return
+        with self._lock:
+            self._entries[key] = (answer, time.monotonic() + self.ttl_seconds)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """Elimina todas las respuestas (los contadores se conservan)."""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, object]:
+        """
+        Devuelve entradas, aciertos, fallos, caducadas y tasa de aciertos.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "expired": self.expired,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+_answer_cache = AnswerCache()
+
+
+def get_answer_cache() -> AnswerCache:
+    """
+    Devuelve la caché de respuestas del proceso (compartida entre sesiones).
+    """
+    return _answer_cache
+
+
+@dataclass
+class _SemanticScope:
+    """Preguntas respondidas de un documento (con un modelo, nivel de detalle y top_k)."""
+    index: faiss.IndexFlatIP
+    vectors: List[np.ndarray] = field(default_factory=list)
+    questions: List[str] = field(default_factory=list)
+    answers: List[str] = field(default_factory=list)
+    expires: List[float] = field(default_factory=list)
+
+    def rebuild(self, keep: List[int]):
+        """Reconstruye el índice solo con las posiciones indicadas."""
+        self.vectors = [self.vectors[i] for i in keep]
+        self.questions = [self.questions[i] for i in keep]
+        self.answers = [self.answers[i] for i in keep]
+        self.expires = [self.expires[i] for i in keep]
+        self.index.reset()
+        if self.vectors:
+            self.index.add(np.stack(self.vectors))
+
+
+class SemanticAnswerCache:
+    """
+    Caché de respuestas para preguntas parafraseadas.
+
+    Cada documento (junto con el modelo de Mistral, el nivel de detalle y el
+    número de fragmentos recuperados) tiene un índice FAISS de producto
+    interno con los embeddings normalizados de las preguntas ya respondidas;
+    una pregunta nueva reutiliza la respuesta de la más parecida si la
+    similitud coseno supera el umbral.
+    """
+
+    def __init__(
+        self,
+        threshold: float = SEMANTIC_CACHE_THRESHOLD,
+        ttl_seconds: int = ANSWER_CACHE_TTL_SECONDS,
+        max_per_document: int = SEMANTIC_CACHE_MAX_PER_DOCUMENT,
+        max_documents: int = SEMANTIC_CACHE_MAX_DOCUMENTS
+    ):
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_per_document = max_per_document
+        self.max_documents = max_documents
+        self._scopes: "OrderedDict[Tuple[str, str, str, int], _SemanticScope]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _normalize(vector) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32).reshape(1, -1).copy()
+        faiss.normalize_L2(vector)
+        return vector
+
+    @staticmethod
+    def _question_key(question: str) -> str:
+        return hashlib.sha256(normalize_question(question).encode("utf-8")).hexdigest()
+
+    def get(
+        self,
+        doc_hash: str,
+        question: str,
+        question_vector,
+        model: str,
+        detail_level: str,
+        top_k: int
+    ) -> Optional[Tuple[str, float]]:
+        """
+        Busca la respuesta de una pregunta parecida (de texto distinto) sobre el mismo documento.
+
+        Args:
+            doc_hash: Hash del contenido del documento
+            question: Pregunta del usuario (solo se compara su hash)
+            question_vector: Embedding de la pregunta
+            model: Modelo de Mistral
+            detail_level: Nivel de detalle solicitado
+            top_k: Fragmentos recuperados para la respuesta
+
+        Returns:
+            Tupla (respuesta, similitud coseno) o None si ninguna supera el umbral
+        """
+        vector = self._normalize(question_vector)
+        question_key = self._question_key(question)
+        key = (doc_hash, model, detail_level, top_k)
+        now = time.monotonic()
+        with self._lock:
+            scope = self._scopes.get(key)
+            if scope is not None and scope.index.ntotal:
+                self._scopes.move_to_end(key)
+                scores, ids = scope.index.search(vector, min(4, scope.index.ntotal))
+                for score, i in zip(scores[0], ids[0]):
+                    # La misma pregunta con otro contexto no se reutiliza
+                    if i < 0 or score < self.threshold or scope.questions[i] == question_key:
+                        continue
+                    if scope.expires[i] >= now:
+                        self.hits += 1
+                        return scope.answers[i], float(score)
+            self.misses += 1
+            return None
+
+    def put(
+        self,
+        doc_hash: str,
+        question: str,
+        question_vector,
+        answer: str,
+        model: str,
+        detail_level: str,
+        top_k: int
+    ):
+        """
+        Guarda la respuesta de una pregunta.
+
+        Args:
+            doc_hash: Hash del contenido del documento
+            question: Pregunta del usuario (solo se guarda su hash)
+            question_vector: Embedding de la pregunta
+            answer: Respuesta generada
+            model: Modelo de Mistral
+            detail_level: Nivel de detalle solicitado
+            top_k: Fragmentos recuperados para la respuesta
+        """
+        if not answer or self.max_per_document <= 0:
+            return
+        vector = self._normalize(question_vector)
+        question_key = self._question_key(question)
+        key = (doc_hash, model, detail_level, top_k)
+        now = time.monotonic()
+        with self._lock:
+            scope = self._scopes.get(key)
+            if scope is None:
+                scope = self._scopes[key] = _SemanticScope(faiss.IndexFlatIP(vector.shape[1]))
+            self._scopes.move_to_end(key)
+
+            # La respuesta nueva sustituye a la anterior de la misma pregunta
+            keep = [i for i, q in enumerate(scope.questions) if q != question_key]
+            if len(keep) < len(scope.questions):
+                scope.rebuild(keep)
+
+            scope.vectors.append(vector[0])
+            scope.questions.append(question_key)
+            scope.answers.append(answer)
+            scope.expires.append(now + self.ttl_seconds)
+            scope.index.add(vector)
+
+            # Quitar preguntas caducadas y, si sobran, las más antiguas
+            live = [i for i, expires in enumerate(scope.expires) if expires >= now]
+            live = live[-self.max_per_document:]
+            if len(live) < len(scope.vectors):
+                scope.rebuild(live)
+
+            while len(self._scopes) > self.max_documents:
+                self._scopes.popitem(last=False)
+
+    def clear(self):
+        """Elimina todas las preguntas guardadas (los contadores se conservan)."""
+        with self._lock:
+            self._scopes.clear()
+
+    def stats(self) -> Dict[str, object]:
+        """
+        Devuelve documentos, preguntas guardadas, aciertos, fallos y tasa de aciertos.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "documents": len({key[0] for key in self._scopes}),
+                "entries": sum(scope.index.ntotal for scope in self._scopes.values()),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "threshold": self.threshold,
+            }
+
+
+_semantic_answer_cache = SemanticAnswerCache()
+
+
+def get_semantic_answer_cache() -> SemanticAnswerCache:
+    """
+    Devuelve la caché semántica de respuestas del proceso (compartida entre sesiones).
+    """
+    return _semantic_answer_cache
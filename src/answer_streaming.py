@@ -0,0 +1,100 @@
+"""
+Streaming de respuestas del LLM para PaperWhisper.
+Muestra la respuesta de Mistral a medida que se genera en lugar de esperar
+a los ~1500 tokens completos, mide el tiempo hasta el primer token y vuelve
+a la llamada bloqueante si el streaming falla.
+
+PRIVACIDAD: No se registran preguntas, fragmentos ni respuestas; solo tiempos.
+"""
+
+import time
+import logging
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class AnswerTiming:
+    """
+    Tiempos de generación de una respuesta.
+
+    Attributes:
+        streamed: True si la respuesta llegó por streaming (False si se usó la llamada bloqueante)
+        time_to_first_token: Segundos hasta el primer texto recibido
+        total_seconds: Segundos hasta la respuesta completa
+        chunks: Fragmentos de texto recibidos por streaming
+        fallback_reason: Motivo por el que se usó la llamada bloqueante
+    """
+    streamed: bool = False
+    time_to_first_token: Optional[float] = None
+    total_seconds: float = 0.0
+    chunks: int = 0
+    fallback_reason: str = ""
+
+
+def _message_text(message) -> str:
+    """Texto de un mensaje o fragmento del chat model (content puede ser str o lista de partes)."""
+    content = getattr(message, "content", message)
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return "".join(part if isinstance(part, str) else part.get("text", "") for part in content)
+    return ""
+
+
+def stream_answer(
+    llm,
+    messages: List[Dict[str, str]],
+    timing: Optional[AnswerTiming] = None
+) -> Iterator[str]:
+    """
+    Genera la respuesta del LLM por streaming.
+
+    Cada valor es el texto acumulado hasta el momento, así quien lo muestra
+    solo tiene que pintar el último. Si el streaming falla (antes o a mitad
+    de la respuesta) se repite la petición con la llamada bloqueante y el
+    último valor es su respuesta completa; los errores de esa llamada se
+    propagan.
+
+    Args:
+        llm: Chat model de LangChain (stream() e invoke())
+        messages: Mensajes del chat (system + user)
+        timing: Si se indica, se rellena con los tiempos de la respuesta
+
+    Yields:
+        Texto acumulado de la respuesta
+    """
+    timing = timing if timing is not None else AnswerTiming()
+    start = time.perf_counter()
+    answer = ""
+
+    try:
+        for chunk in llm.stream(messages):
+            text = _message_text(chunk)
+            if not text:
+                continue
+            if timing.time_to_first_token is None:
+                timing.time_to_first_token = time.perf_counter() - start
+            timing.chunks += 1
+            answer += text
+            yield answer
+        if not answer:
+            raise ValueError("respuesta vacía")
+        timing.streamed = True
+    except Exception as e:
+        logger.warning(f"Streaming del LLM no disponible ({type(e).__name__}), usando llamada bloqueante")
+        timing.fallback_reason = f"{type(e).__name__}: {e}"
+        answer = _message_text(llm.invoke(messages))
+        if timing.time_to_first_token is None:
+            timing.time_to_first_token = time.perf_counter() - start
+        yield answer
+    finally:
+        timing.total_seconds = time.perf_counter() - start
+
+    logger.info(
+        f"Respuesta generada en {timing.total_seconds:.2f}s "
+        f"(primer token en {timing.time_to_first_token or 0:.2f}s, "
+        f"{'streaming' if timing.streamed else 'bloqueante'})"
+    )
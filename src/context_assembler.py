@@ -0,0 +1,194 @@
+"""
+Ensamblado del contexto para el prompt de Mistral en PaperWhisper.
+Cuenta los tokens del system prompt, de la pregunta y de cada fragmento,
+elige los fragmentos por relevancia hasta llenar un presupuesto de tokens y
+elimina el texto de solapamiento (chunk_overlap) repetido entre fragmentos
+contiguos del documento, que de otro modo se paga dos veces.
+
+PRIVACIDAD: Solo se procesan en memoria los fragmentos ya recuperados; no se
+registra su contenido.
+"""
+
+import os
+import math
+import logging
+from dataclasses import dataclass, field
+from typing import Callable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Tokens máximos del prompt (system + pregunta + fragmentos), sin contar la respuesta
+MISTRAL_CONTEXT_TOKEN_BUDGET = int(os.getenv("MISTRAL_CONTEXT_TOKEN_BUDGET", "4000"))
+
+# Caracteres por token para estimar (texto en español/inglés con el tokenizador de Mistral)
+CHARS_PER_TOKEN = 3.5
+
+# Solapamiento mínimo y máximo (caracteres) que se detecta entre dos fragmentos
+MIN_OVERLAP_CHARS = 20
+MAX_OVERLAP_CHARS = 600
+
+# Separador entre fragmentos en el prompt
+FRAGMENT_SEPARATOR = "\n\n---\n\n"
+
+TokenCounter = Callable[[str], int]
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estima los tokens de un texto sin descargar el tokenizador de Mistral.
+
+    Args:
+        text: Texto a medir
+
+    Returns:
+        Tokens aproximados (redondeando hacia arriba)
+    """
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def format_fragment(position: int, text: str, score: float) -> str:
+    """Fragmento con su cabecera de relevancia, tal como va en el prompt."""
+    return f"[Fragmento {position} - Relevancia: {score * 100:.1f}%]\n{text}"
+
+
+def _overlap_length(before: str, after: str, max_chars: int = MAX_OVERLAP_CHARS) -> int:
+    """Longitud del sufijo más largo de `before` que es prefijo de `after` (0 si es corto)."""
+    for length in range(min(len(before), len(after), max_chars), MIN_OVERLAP_CHARS - 1, -1):
+        if before.endswith(after[:length]):
+            return length
+    return 0
+
+
+def remove_overlaps(chunks: List[Tuple[str, float]]) -> Tuple[List[Tuple[str, float]], int]:
+    """
+    Elimina el texto repetido entre fragmentos ordenados por relevancia.
+
+    Si un fragmento menos relevante está contenido en otro se descarta; si
+    empieza (o termina) con el final (o el principio) de otro más relevante,
+    se recorta esa parte. El fragmento más relevante nunca se modifica.
+
+    Args:
+        chunks: Lista de (texto, score), de mayor a menor relevancia
+
+    Returns:
+        Tupla (fragmentos sin duplicados, caracteres eliminados)
+    """
+    kept: List[Tuple[str, float]] = []
+    removed = 0
+    for text, score in chunks:
+        original = len(text)
+        for other, _ in kept:
+            if text.strip() and text.strip() in other:
+                text = ""
+                break
+            # El fragmento sigue a otro ya elegido: quitar su comienzo repetido
+            overlap = _overlap_length(other, text)
+            if overlap:
+                text = text[overlap:]
+            # El fragmento precede a otro ya elegido: quitar su final repetido
+            overlap = _overlap_length(text, other)
+            if overlap:
+                text = text[:-overlap]
+        text = text.strip()
+        removed += original - len(text)
+        if text:
+            kept.append((text, score))
+    return kept, removed
+
+
+def _truncate_to_budget(text: str, score: float, available: int, count_tokens: TokenCounter) -> str:
+    """
+    Prefijo más largo del fragmento que, con su cabecera, cabe en `available` tokens.
+    Busca la longitud por bisección con el mismo contador de tokens del presupuesto.
+    """
+    low, high = 0, len(text)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if count_tokens(format_fragment(1, text[:middle], score)) <= available:
+            low = middle
+        else:
+            high = middle - 1
+    return text[:low]
+
+
+@dataclass
+class AssembledContext:
+    """
+    Fragmentos elegidos para el prompt y su coste en tokens.
+
+    Attributes:
+        fragments: (texto, score) incluidos, de mayor a menor relevancia
+        tokens: Tokens estimados del prompt completo (system + pregunta + fragmentos)
+        budget: Presupuesto de tokens aplicado
+        dropped: Fragmentos descartados por no caber en el presupuesto
+        overlap_chars: Caracteres de solapamiento eliminados
+    """
+    fragments: List[Tuple[str, float]] = field(default_factory=list)
+    tokens: int = 0
+    budget: int = MISTRAL_CONTEXT_TOKEN_BUDGET
+    dropped: int = 0
+    overlap_chars: int = 0
+
+    @property
+    def text(self) -> str:
+        """Contexto listo para el prompt (fragmentos numerados con su relevancia)."""
+        return FRAGMENT_SEPARATOR.join(
+            format_fragment(i, text, score) for i, (text, score) in enumerate(self.fragments, start=1)
+        )
+
+
+def assemble_context(
+    chunks: List[Tuple[str, float]],
+    fixed_prompt: str = "",
+    budget: int = MISTRAL_CONTEXT_TOKEN_BUDGET,
+    count_tokens: Optional[TokenCounter] = None
+) -> AssembledContext:
+    """
+    Elige los fragmentos más relevantes que caben en el presupuesto de tokens.
+
+    Los fragmentos se ordenan por score, se quita el solapamiento entre ellos
+    y se añaden de mayor a menor relevancia mientras quepan (uno que no cabe
+    se salta y se prueba con el siguiente, más corto). Si ni el más relevante
+    cabe, se incluye recortado para llenar el presupuesto.
+
+    Args:
+        chunks: Lista de (texto, score) del RAG (mayor score = más relevante)
+        fixed_prompt: Partes del prompt que siempre se envían (system prompt, pregunta...)
+        budget: Tokens máximos del prompt completo
+        count_tokens: Función que cuenta tokens (por defecto estimate_tokens)
+
+    Returns:
+        AssembledContext con los fragmentos incluidos y los tokens usados
+    """
+    count_tokens = count_tokens or estimate_tokens
+    ranked = sorted(chunks, key=lambda x: x[1], reverse=True)
+    fragments, overlap_chars = remove_overlaps(ranked)
+
+    context = AssembledContext(budget=budget, overlap_chars=overlap_chars)
+    context.tokens = count_tokens(fixed_prompt)
+    separator_tokens = count_tokens(FRAGMENT_SEPARATOR)
+
+    for text, score in fragments:
+        cost = count_tokens(format_fragment(len(context.fragments) + 1, text, score))
+        if context.fragments:
+            cost += separator_tokens
+        if context.tokens + cost <= budget:
+            context.fragments.append((text, score))
+            context.tokens += cost
+        else:
+            context.dropped += 1
+
+    if not context.fragments and fragments:
+        # Ni el fragmento más relevante cabe: incluirlo recortado
+        text, score = fragments[0]
+        text = _truncate_to_budget(text, score, budget - context.tokens, count_tokens)
+        if text:
+            context.fragments.append((text, score))
+            context.tokens += count_tokens(format_fragment(1, text, score))
+            context.dropped -= 1
+
+    logger.debug(
+        f"Contexto: {len(context.fragments)} fragmentos, ~{context.tokens}/{budget} tokens, "
+        f"{context.dropped} descartados, {overlap_chars} caracteres de solapamiento eliminados"
+    )
+    return context
@@ -0,0 +1,166 @@
+"""
+Pool de procesos para generar embeddings de chunks en CPU para PaperWhisper.
+Cada proceso carga su propia copia del modelo con un número fijo de hilos
+de PyTorch y recibe lotes de chunks; así los lotes pequeños de modelos como
+MiniLM aprovechan todos los núcleos en lugar de depender del paralelismo
+interno de PyTorch.
+
+Los procesos solo importan sentence-transformers (no LangChain ni Streamlit)
+para arrancar rápido.
+
+PRIVACIDAD: Los textos de los chunks se envían a los procesos por memoria
+(pipes), nunca se escriben en disco.
+"""
+
+import os
+import math
+import time
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Procesos para generar embeddings de chunks (1 = en el proceso principal)
+EMBEDDING_WORKERS = int(os.getenv("EMBEDDING_WORKERS", "1"))
+
+# Hilos de PyTorch por proceso del pool
+EMBEDDING_WORKER_THREADS = int(os.getenv("EMBEDDING_WORKER_THREADS", "1"))
+
+# Máximo de chunks por lote enviado a cada proceso
+EMBEDDING_POOL_BATCH_SIZE = int(os.getenv("EMBEDDING_POOL_BATCH_SIZE", "32"))
+
+# Por debajo de este número de chunks el coste del pool supera la ganancia
+EMBEDDING_POOL_MIN_TEXTS = int(os.getenv("EMBEDDING_POOL_MIN_TEXTS", "64"))
+
+# Modelo cargado en cada proceso del pool
+_worker_model = None
+_worker_normalize = True
+
+
+def _init_worker(model_name: str, normalize: bool, threads: int):
+    """Carga el modelo una vez por proceso con un número fijo de hilos."""
+    global _worker_model, _worker_normalize
+
+    os.environ["OMP_NUM_THREADS"] = str(threads)
+    os.environ["TOKENIZERS_PARALLELISM"] = "false"
+
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    torch.set_num_threads(threads)
+    _worker_model = SentenceTransformer(model_name, device="cpu")
+    _worker_normalize = normalize
+
+
+def encode_batch(texts: List[str]) -> np.ndarray:
+    """
+    Genera los embeddings de un lote de chunks dentro de un proceso del pool.
+    Aplica el mismo preprocesado que HuggingFaceEmbeddings (saltos de línea
+    como espacios) para que los vectores sean idénticos.
+
+    Args:
+        texts: Textos del lote
+
+    Returns:
+        Matriz float32 (len(texts), dimensión)
+    """
+    texts = [text.replace("\n", " ") for text in texts]
+    vectors = _worker_model.encode(
+        texts,
+        batch_size=len(texts),
+        show_progress_bar=False,
+        normalize_embeddings=_worker_normalize
+    )
+    return np.asarray(vectors, dtype=np.float32)
+
+
+def _split_batches(texts: List[str], batch_size: int) -> List[List[str]]:
+    """Divide los textos en lotes consecutivos de tamaño batch_size."""
+    batch_size = max(1, batch_size)
+    return [texts[start:start + batch_size] for start in range(0, len(texts), batch_size)]
+
+
+class EmbeddingPool:
+    """
+    Pool de procesos que reparte lotes de chunks entre copias del modelo.
+
+    Con menos de min_texts chunks, o si el pool no está disponible, los
+    embeddings se generan en el proceso principal con `fallback`.
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        fallback: Callable[[List[str]], List[List[float]]],
+        normalize: bool = True,
+        workers: int = EMBEDDING_WORKERS,
+        threads: int = EMBEDDING_WORKER_THREADS,
+        batch_size: int = EMBEDDING_POOL_BATCH_SIZE,
+        min_texts: int = EMBEDDING_POOL_MIN_TEXTS
+    ):
+        self.model_name = model_name
+        self.fallback = fallback
+        self.normalize = normalize
+        self.workers = workers
+        self.threads = threads
+        self.batch_size = batch_size
+        self.min_texts = min_texts
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        """
+        Devuelve el pool de procesos, creándolo la primera vez.
+        Usa 'spawn' para no heredar hilos de PyTorch/Streamlit del proceso padre.
+        """
+        with self._lock:
+            if self._executor is None:
+                start = time.perf_counter()
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker,
+                    initargs=(self.model_name, self.normalize, self.threads)
+                )
+                logger.info(
+                    f"Pool de embeddings iniciado con {self.workers} procesos × "
+                    f"{self.threads} hilos ({time.perf_counter() - start:.2f}s)"
+                )
+            return self._executor
+
+    def shutdown(self):
+        """Detiene los procesos del pool (si existen)."""
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """
+        Genera los embeddings de los chunks repartiendo lotes entre los procesos.
+
+        Args:
+            texts: Textos de los chunks
+
+        Returns:
+            Un vector por texto, en el mismo orden
+        """
+        if self.workers <= 1 or len(texts) < self.min_texts:
+            return self.fallback(texts)
+
+        # Lotes más pequeños si hace falta para que todos los procesos trabajen
+        batches = _split_batches(texts, min(self.batch_size, math.ceil(len(texts) / self.workers)))
+        try:
+            results = list(self._get_executor().map(encode_batch, batches))
+        except (BrokenProcessPool, OSError, RuntimeError):
+            logger.warning("Pool de embeddings no disponible, generando en el proceso principal")
+            self.shutdown()
+            return self.fallback(texts)
+
+        return np.concatenate(results).tolist()
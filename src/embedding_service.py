@@ -0,0 +1,410 @@
+"""
+Servicio local de embeddings para PaperWhisper.
+Un único proceso carga el modelo y atiende por HTTP (solo localhost) a todas
+las sesiones de Streamlit. Las peticiones que llegan a la vez se agrupan en
+micro-lotes: el primer texto espera como máximo EMBEDDING_SERVICE_MAX_WAIT_MS
+a que lleguen otros, así diez usuarios preguntando a la vez hacen una sola
+pasada del modelo en lugar de diez lotes de uno compitiendo por los núcleos.
+
+Arrancar con:  python -m src.embedding_service
+Usar desde la app:  EMBEDDINGS_BACKEND=service (y EMBEDDING_SERVICE_URL)
+
+PRIVACIDAD: El servicio escucha solo en 127.0.0.1 por defecto, no guarda
+textos ni vectores y no registra el contenido de las peticiones.
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import threading
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Tuple
+
+from langchain_core.embeddings import Embeddings
+
+logger = logging.getLogger(__name__)
+
+# Dirección del servicio (solo localhost por privacidad)
+EMBEDDING_SERVICE_HOST = os.getenv("EMBEDDING_SERVICE_HOST", "127.0.0.1")
+EMBEDDING_SERVICE_PORT = int(os.getenv("EMBEDDING_SERVICE_PORT", "8765"))
+EMBEDDING_SERVICE_URL = os.getenv(
+    "EMBEDDING_SERVICE_URL", f"http://{EMBEDDING_SERVICE_HOST}:{EMBEDDING_SERVICE_PORT}"
+)
+
+# Espera máxima (ms) del primer texto de un micro-lote a que lleguen otros
+EMBEDDING_SERVICE_MAX_WAIT_MS = float(os.getenv("EMBEDDING_SERVICE_MAX_WAIT_MS", "5"))
+
+# Máximo de textos por micro-lote
+EMBEDDING_SERVICE_MAX_BATCH = int(os.getenv("EMBEDDING_SERVICE_MAX_BATCH", "64"))
+
+# Backend con el que el servicio ejecuta el modelo ("torch", "onnx" u "onnx-int8")
+EMBEDDING_SERVICE_BACKEND = os.getenv("EMBEDDING_SERVICE_BACKEND", "torch")
+
+# Segundos máximos de espera del cliente
+EMBEDDING_SERVICE_TIMEOUT = float(os.getenv("EMBEDDING_SERVICE_TIMEOUT", "120"))
+
+
+def _histogram_bucket(size: int) -> str:
+    """Intervalo en potencias de dos de un tamaño de lote ("1", "2-3", "4-7"...)."""
+    low = 1 << (size.bit_length() - 1)
+    high = (low << 1) - 1
+    return str(low) if low == high else f"{low}-{high}"
+
+
+class MicroBatcher:
+    """
+    Agrupa peticiones concurrentes en lotes para una función de embeddings.
+
+    Cada petición (lista de textos) entra en una cola; un hilo toma la
+    primera, espera hasta max_wait_ms a que lleguen más (sin pasar de
+    max_batch textos), embebe todo en una llamada y reparte los vectores.
+    """
+
+    def __init__(
+        self,
+        embed: Callable[[List[str]], List[List[float]]],
+        max_wait_ms: float = EMBEDDING_SERVICE_MAX_WAIT_MS,
+        max_batch: int = EMBEDDING_SERVICE_MAX_BATCH
+    ):
+        self.embed = embed
+        self.max_wait = max_wait_ms / 1000
+        self.max_batch = max_batch
+        self._pending: List[Tuple[List[str], Future]] = []
+        self._cond = threading.Condition()
+        self._closed = False
+
+        self.requests = 0
+        self.batches = 0
+        self.texts = 0
+        self.max_queue_depth = 0
+        self.histogram: Dict[str, int] = {}
+
+        self._thread = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, texts: List[str]) -> Future:
+        """
+        Encola textos para el siguiente micro-lote.
+
+        Args:
+            texts: Textos a embeber
+
+        Returns:
+            Future con la lista de vectores (en el mismo orden)
+        """
+        future: Future = Future()
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("El servicio de embeddings está detenido")
+            self._pending.append((texts, future))
+            self.requests += 1
+            self.max_queue_depth = max(self.max_queue_depth, len(self._pending))
+            self._cond.notify()
+        return future
+
+    def _take_batch(self) -> List[Tuple[List[str], Future]]:
+        """Espera la primera petición y añade las que lleguen antes del plazo."""
+        with self._cond:
+            while not self._pending and not self._closed:
+                self._cond.wait()
+            if not self._pending:
+                return []
+
+            deadline = time.monotonic() + self.max_wait
+            while sum(len(texts) for texts, _ in self._pending) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or self._closed:
+                    break
+                self._cond.wait(remaining)
+
+            batch, size = [], 0
+            while self._pending and (not batch or size + len(self._pending[0][0]) <= self.max_batch):
+                texts, future = self._pending.pop(0)
+                batch.append((texts, future))
+                size += len(texts)
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._take_batch()
+            if not batch:
+                return
+
+            texts = [text for request_texts, _ in batch for text in request_texts]
+            try:
+                vectors = self.embed(texts) if texts else []
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            with self._cond:
+                self.batches += 1
+                self.texts += len(texts)
+                bucket = _histogram_bucket(max(1, len(texts)))
+                self.histogram[bucket] = self.histogram.get(bucket, 0) + 1
+
+            start = 0
+            for request_texts, future in batch:
+                future.set_result(vectors[start:start + len(request_texts)])
+                start += len(request_texts)
+
+    def close(self):
+        """Detiene el hilo cuando termine la cola pendiente."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+
+    def stats(self) -> Dict[str, object]:
+        """
+        Devuelve cola actual y máxima, peticiones, lotes e histograma de tamaños.
+        """
+        with self._cond:
+            return {
+                "queue_depth": len(self._pending),
+                "max_queue_depth": self.max_queue_depth,
+                "requests": self.requests,
+                "batches": self.batches,
+                "texts": self.texts,
+                "mean_batch_size": self.texts / self.batches if self.batches else 0.0,
+                "batch_size_histogram": dict(self.histogram),
+            }
+
+
+class EmbeddingService:
+    """
+    Servidor HTTP local con un MicroBatcher por modelo.
+
+    POST /embed  {"model": ..., "texts": [...]}  →  {"vectors": [[...], ...]}
+    GET  /info?model=...                          →  dimensión y longitud máxima
+    GET  /stats                                   →  estadísticas por modelo
+    """
+
+    def __init__(
+        self,
+        host: str = EMBEDDING_SERVICE_HOST,
+        port: int = EMBEDDING_SERVICE_PORT,
+        backend: str = EMBEDDING_SERVICE_BACKEND,
+        max_wait_ms: float = EMBEDDING_SERVICE_MAX_WAIT_MS,
+        max_batch: int = EMBEDDING_SERVICE_MAX_BATCH
+    ):
+        if backend == "service":
+            raise ValueError("El servicio de embeddings no puede usar el backend 'service'")
+        self.backend = backend
+        self.max_wait_ms = max_wait_ms
+        self.max_batch = max_batch
+        self._batchers: Dict[str, MicroBatcher] = {}
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _model(self, model_name: str):
+        # Importado aquí para que el cliente no cargue LangChain/sentence-transformers
+        from src.rag_engine import get_embedding_registry
+        return get_embedding_registry().get(model_name, backend=self.backend)
+
+    def _batcher(self, model_name: str) -> MicroBatcher:
+        with self._lock:
+            if model_name not in self._batchers:
+                model = self._model(model_name)
+                self._batchers[model_name] = MicroBatcher(model.embed_documents, self.max_wait_ms, self.max_batch)
+            return self._batchers[model_name]
+
+    def embed(self, model_name: str, texts: List[str]) -> List[List[float]]:
+        """Embebe textos en el micro-lote del modelo (bloquea hasta tener el resultado)."""
+        return self._batcher(model_name).submit(texts).result()
+
+    def info(self, model_name: str) -> Dict[str, object]:
+        """Dimensión y longitud máxima de secuencia del modelo."""
+        from src.rag_engine import get_model_tokenizer, _embedding_dimension
+
+        model = self._model(model_name)
+        _, max_seq_length = get_model_tokenizer(model)
+        return {
+            "model": model_name,
+            "backend": self.backend,
+            "dimension": _embedding_dimension(model),
+            "max_seq_length": max_seq_length,
+        }
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            return {name: batcher.stats() for name, batcher in self._batchers.items()}
+
+    def _make_handler(self):
+        service = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _reply(self, status: int, payload: Dict[str, object]):
+                body = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                if self.path != "/embed":
+                    return self._reply(404, {"error": "Ruta no encontrada"})
+                try:
+                    request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                    vectors = service.embed(request["model"], list(request["texts"]))
+                    self._reply(200, {"vectors": vectors})
+                except (KeyError, ValueError) as e:
+                    self._reply(400, {"error": f"Petición no válida: {e}"})
+                except Exception as e:
+                    self._reply(500, {"error": str(e)})
+
+            def do_GET(self):
+                path, _, query = self.path.partition("?")
+                if path == "/stats":
+                    return self._reply(200, service.stats())
+                if path == "/info":
+                    params = dict(part.split("=", 1) for part in query.split("&") if "=" in part)
+                    model_name = urllib.parse.unquote(params.get("model", ""))
+                    if not model_name:
+                        return self._reply(400, {"error": "Falta el parámetro model"})
+                    try:
+                        return self._reply(200, service.info(model_name))
+                    except Exception as e:
+                        return self._reply(500, {"error": str(e)})
+                self._reply(404, {"error": "Ruta no encontrada"})
+
+            def log_message(self, format, *args):
+                # PRIVACIDAD: no registrar peticiones
+                pass
+
+        return Handler
+
+    def start(self) -> "EmbeddingService":
+        """Atiende peticiones en un hilo en segundo plano."""
+        self._thread = threading.Thread(target=self._server.serve_forever, name="embedding-service", daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        """Atiende peticiones en el hilo actual (hasta Ctrl+C)."""
+        self._server.serve_forever()
+
+    def stop(self):
+        """Detiene el servidor y los micro-lotes."""
+        self._server.shutdown()
+        self._server.server_close()
+        with self._lock:
+            batchers = list(self._batchers.values())
+            self._batchers.clear()
+        for batcher in batchers:
+            batcher.close()
+
+
+class RemoteEmbeddings(Embeddings):
+    """
+    Cliente del servicio local de embeddings (misma interfaz que HuggingFaceEmbeddings).
+
+    Expone `tokenizer`, `max_seq_length` y `get_embedding_dimension()` (también
+    vía `client`); el tokenizador se carga localmente solo si se usa el
+    chunking por tokens.
+    """
+
+    def __init__(self, model_name: str, url: str = EMBEDDING_SERVICE_URL, timeout: float = EMBEDDING_SERVICE_TIMEOUT):
+        self.model_name = model_name
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+        self._info: Optional[Dict[str, object]] = None
+        self._tokenizer = None
+
+    def _request(self, path: str, payload: Optional[Dict[str, object]] = None) -> Dict[str, object]:
+        data = json.dumps(payload).encode("utf-8") if payload is not None else None
+        request = urllib.request.Request(
+            self.url + path, data=data, headers={"Content-Type": "application/json"}
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            raise RuntimeError(f"Error del servicio de embeddings: {json.loads(e.read()).get('error')}") from e
+        except urllib.error.URLError as e:
+            raise ConnectionError(f"Servicio de embeddings no disponible en {self.url}: {e.reason}") from e
+
+    @property
+    def info(self) -> Dict[str, object]:
+        if self._info is None:
+            self._info = self._request(f"/info?model={urllib.parse.quote(self.model_name, safe='')}")
+        return self._info
+
+    @property
+    def client(self) -> "RemoteEmbeddings":
+        """Compatibilidad con HuggingFaceEmbeddings.client (tokenizer, max_seq_length...)."""
+        return self
+
+    @property
+    def tokenizer(self):
+        if self._tokenizer is None:
+            from transformers import AutoTokenizer
+            self._tokenizer = AutoTokenizer.from_pretrained(self.model_name)
+        return self._tokenizer
+
+    @property
+    def max_seq_length(self) -> int:
+        return int(self.info["max_seq_length"])
+
+    def get_embedding_dimension(self) -> Optional[int]:
+        return self.info.get("dimension")
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """
+        Genera los embeddings de una lista de textos en el servicio.
+
+        Args:
+            texts: Textos a embeber
+
+        Returns:
+            Un vector por texto, en el mismo orden
+        """
+        if not texts:
+            return []
+        return self._request("/embed", {"model": self.model_name, "texts": texts})["vectors"]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    def stats(self) -> Dict[str, object]:
+        """Estadísticas del servicio (cola, lotes e histograma por modelo)."""
+        return self._request("/stats")
+
+
+def main():
+    """Arranca el servicio de embeddings y precarga el modelo por defecto."""
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    from src.rag_engine import DEFAULT_MODEL_NAME
+
+    service = EmbeddingService()
+    service._batcher(DEFAULT_MODEL_NAME)
+    logger.info(
+        f"Servicio de embeddings en {service.url} ({DEFAULT_MODEL_NAME}, {service.backend}, "
+        f"lotes de hasta {service.max_batch} textos / {service.max_wait_ms:.0f} ms)"
+    )
+    try:
+        service.serve_forever()
+    except KeyboardInterrupt:
+        logger.info("Deteniendo servicio de embeddings")
+    finally:
+        service.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,267 @@
+"""
+Backend de embeddings con ONNX Runtime para PaperWhisper.
+Exporta una vez el transformer de un modelo de sentence-transformers a ONNX
+(opcionalmente cuantizado a INT8) y genera los embeddings en CPU sin
+PyTorch, aplicando el mismo pooling y normalización que el modelo original
+para que los vectores sean compatibles con los índices existentes.
+
+Requiere los paquetes opcionales `onnx` y `onnxruntime`
+(pip install onnx onnxruntime). La exportación usa PyTorch, que ya instala
+sentence-transformers.
+
+PRIVACIDAD: En disco solo se guardan el modelo exportado y su tokenizador,
+nunca textos de documentos o preguntas.
+"""
+
+import os
+import re
+import json
+import time
+import hashlib
+import logging
+from typing import Dict, List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+logger = logging.getLogger(__name__)
+
+# Directorio donde se guardan los modelos exportados a ONNX
+ONNX_MODEL_DIR = os.getenv("ONNX_MODEL_DIR", os.path.join(os.getenv("DATA_DIR", "./data"), "onnx"))
+
+# Hilos de ONNX Runtime por sesión (0 = los que elija ONNX Runtime)
+ONNX_THREADS = int(os.getenv("ONNX_THREADS", "0"))
+
+# Chunks por lote de inferencia
+ONNX_BATCH_SIZE = int(os.getenv("ONNX_BATCH_SIZE", "32"))
+
+# Fichero con la configuración de pooling del modelo exportado
+_CONFIG_FILE = "paperwhisper_onnx.json"
+_SUPPORTED_POOLING = ("mean", "cls")
+
+
+def _model_dir(model_name: str, base_dir: str) -> str:
+    """Subdirectorio estable para un modelo (nombre legible + hash de la ruta/ID)."""
+    slug = re.sub(r"[^A-Za-z0-9._-]+", "_", os.path.basename(model_name.rstrip("/")))
+    digest = hashlib.sha256(model_name.encode("utf-8")).hexdigest()[:8]
+    return os.path.join(base_dir, f"{slug}-{digest}")
+
+
+def _pooling_mode(module) -> str:
+    """Modo de pooling de un módulo Pooling de sentence-transformers (varias versiones)."""
+    mode = getattr(module, "pooling_mode", None)
+    if isinstance(mode, str):
+        return mode
+    get_mode = getattr(module, "get_pooling_mode_str", None)
+    if get_mode is not None:
+        return get_mode()
+    raise ValueError("No se pudo determinar el pooling del modelo")
+
+
+def _sentence_dimension(model) -> Optional[int]:
+    """Dimensión de los embeddings (sentence-transformers renombró el método)."""
+    for method in ("get_embedding_dimension", "get_sentence_embedding_dimension"):
+        get_dimension = getattr(model, method, None)
+        if get_dimension is not None:
+            return get_dimension()
+    return None
+
+
+def export_onnx_model(model_name: str, base_dir: str = ONNX_MODEL_DIR, quantize: bool = False) -> str:
+    """
+    Exporta el transformer de un modelo de sentence-transformers a ONNX.
+
+    Se guarda el grafo (last_hidden_state con ejes dinámicos), el tokenizador
+    y la configuración de pooling. Si el modelo ya está exportado no se repite.
+
+    Args:
+        model_name: Nombre o ruta del modelo de sentence-transformers
+        base_dir: Directorio base de modelos ONNX
+        quantize: Si True, genera además la versión INT8 (cuantización dinámica)
+
+    Returns:
+        Ruta del fichero .onnx a usar
+    """
+    output_dir = _model_dir(model_name, base_dir)
+    fp32_path = os.path.join(output_dir, "model.onnx")
+    int8_path = os.path.join(output_dir, "model.int8.onnx")
+
+    if not os.path.exists(os.path.join(output_dir, _CONFIG_FILE)):
+        import torch
+        from sentence_transformers import SentenceTransformer
+
+        logger.info(f"Exportando modelo de embeddings a ONNX: {model_name}")
+        start = time.perf_counter()
+        model = SentenceTransformer(model_name, device="cpu")
+        transformer = model[0]
+        pooling = next((m for m in model if type(m).__name__ == "Pooling"), None)
+        mode = _pooling_mode(pooling) if pooling is not None else "mean"
+        if mode not in _SUPPORTED_POOLING:
+            raise ValueError(f"Pooling no soportado por el backend ONNX: {mode}")
+
+        tokenizer = transformer.tokenizer
+        sample = tokenizer(["PaperWhisper"], return_tensors="pt")
+        input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+
+        class _Encoder(torch.nn.Module):
+            def __init__(self, auto_model):
+                super().__init__()
+                self.auto_model = auto_model
+
+            def forward(self, *inputs):
+                return self.auto_model(**dict(zip(input_names, inputs)))[0]
+
+        os.makedirs(output_dir, exist_ok=True)
+        dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+        dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+        export_kwargs = {"dynamo": False} if "dynamo" in torch.onnx.export.__code__.co_varnames else {}
+        with torch.no_grad():
+            torch.onnx.export(
+                _Encoder(transformer.auto_model.eval()),
+                tuple(sample[name] for name in input_names),
+                fp32_path,
+                input_names=input_names,
+                output_names=["last_hidden_state"],
+                dynamic_axes=dynamic_axes,
+                opset_version=17,
+                **export_kwargs
+            )
+        tokenizer.save_pretrained(output_dir)
+
+        config = {
+            "model_name": model_name,
+            "pooling": mode,
+            "max_seq_length": model.max_seq_length,
+            "dimension": _sentence_dimension(model),
+            "input_names": input_names,
+        }
+        with open(os.path.join(output_dir, _CONFIG_FILE), "w", encoding="utf-8") as f:
+            json.dump(config, f, indent=2)
+        logger.info(f"Modelo exportado a ONNX en {time.perf_counter() - start:.2f}s")
+
+    if quantize and not os.path.exists(int8_path):
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+        logger.info("Modelo ONNX cuantizado a INT8")
+
+    return int8_path if quantize else fp32_path
+
+
+class OnnxEmbeddings(Embeddings):
+    """
+    Embeddings de un modelo de sentence-transformers ejecutado con ONNX Runtime.
+
+    Misma interfaz que HuggingFaceEmbeddings. Expone `tokenizer`,
+    `max_seq_length` y `get_embedding_dimension()` (también vía `client`)
+    para el chunking por tokens y el manifest de los índices.
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        quantize: bool = False,
+        normalize: bool = True,
+        base_dir: str = ONNX_MODEL_DIR,
+        threads: int = ONNX_THREADS,
+        batch_size: int = ONNX_BATCH_SIZE,
+        length_bucketing: bool = True
+    ):
+        try:
+            import onnxruntime
+        except ImportError as e:
+            raise ImportError(
+                "El backend ONNX requiere onnx y onnxruntime (pip install onnx onnxruntime)"
+            ) from e
+        from transformers import AutoTokenizer
+
+        self.model_name = model_name
+        self.quantize = quantize
+        self.normalize = normalize
+        self.batch_size = batch_size
+        self.length_bucketing = length_bucketing
+        # Tokens reales y de relleno procesados (instrumentación del batching)
+        self.tokens = 0
+        self.padded_tokens = 0
+
+        self.model_path = export_onnx_model(model_name, base_dir, quantize)
+        model_dir = os.path.dirname(self.model_path)
+        with open(os.path.join(model_dir, _CONFIG_FILE), encoding="utf-8") as f:
+            self._config: Dict[str, object] = json.load(f)
+
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.max_seq_length = int(self._config["max_seq_length"])
+
+        options = onnxruntime.SessionOptions()
+        if threads > 0:
+            options.intra_op_num_threads = threads
+        self._session = onnxruntime.InferenceSession(
+            self.model_path, options, providers=["CPUExecutionProvider"]
+        )
+
+    @property
+    def client(self) -> "OnnxEmbeddings":
+        """Compatibilidad con HuggingFaceEmbeddings.client (tokenizer, max_seq_length...)."""
+        return self
+
+    @property
+    def model_bytes(self) -> int:
+        """Tamaño del modelo ONNX en disco (aproximación de su memoria)."""
+        return os.path.getsize(self.model_path)
+
+    def get_embedding_dimension(self) -> Optional[int]:
+        return self._config.get("dimension")
+
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        """Tokeniza, ejecuta el grafo y aplica pooling (y normalización) a un lote."""
+        encoded = self.tokenizer(
+            texts,
+            padding=True,
+            truncation=True,
+            max_length=self.max_seq_length,
+            return_tensors="np"
+        )
+        feeds = {name: encoded[name].astype(np.int64) for name in self._config["input_names"]}
+        real = int(feeds["attention_mask"].sum())
+        self.tokens += real
+        self.padded_tokens += feeds["attention_mask"].size - real
+        hidden = self._session.run(None, feeds)[0]
+
+        if self._config["pooling"] == "cls":
+            vectors = hidden[:, 0]
+        else:
+            mask = feeds["attention_mask"][..., None].astype(np.float32)
+            vectors = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+
+        if self.normalize:
+            vectors = vectors / np.clip(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12, None)
+        return vectors.astype(np.float32)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """
+        Genera los embeddings de una lista de textos.
+
+        Args:
+            texts: Textos a embeber
+
+        Returns:
+            Un vector por texto, en el mismo orden
+        """
+        if not texts:
+            return []
+        # Mismo preprocesado que HuggingFaceEmbeddings
+        texts = [text.replace("\n", " ") for text in texts]
+        # Lotes de longitud parecida (como sentence-transformers) y vuelta al orden original
+        order = np.arange(len(texts))
+        if self.length_bucketing:
+            order = np.argsort([-len(text) for text in texts], kind="stable")
+        batches = [
+            self._encode([texts[i] for i in order[start:start + self.batch_size]])
+            for start in range(0, len(texts), self.batch_size)
+        ]
+        vectors = np.empty((len(texts), batches[0].shape[1]), dtype=np.float32)
+        vectors[order] = np.concatenate(batches)
+        return vectors.tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
@@ -0,0 +1,202 @@
+"""
+Extracción de texto de PDFs para PaperWhisper.
+Reparte rangos de páginas entre un pool de procesos para aprovechar varios
+núcleos en documentos grandes, con fallback serial para PDFs pequeños.
+
+Este módulo solo depende de pypdf para que los procesos del pool arranquen
+rápido (no importan LangChain ni sentence-transformers).
+
+PRIVACIDAD: Los bytes del PDF se envían a los procesos por memoria (pipes),
+nunca se escriben en disco.
+"""
+
+import os
+import time
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+from typing import Iterator, List, Optional, Tuple
+
+from pypdf import PdfReader
+
+logger = logging.getLogger(__name__)
+
+# Número de procesos para extraer páginas en paralelo (1 = siempre serial).
+# Pocos por defecto: cada subida puede usar el pool a la vez que los embeddings
+PDF_EXTRACTION_WORKERS = int(os.getenv("PDF_EXTRACTION_WORKERS", "2"))
+
+# Por debajo de este número de páginas el coste del pool supera la ganancia
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "24"))
+
+# (texto de la página, segundos de extracción, extracción correcta)
+PageResult = Tuple[str, float, bool]
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+
+def _iter_page_range(pdf_bytes: bytes, start: int, stop: int) -> Iterator[PageResult]:
+    """Genera (texto, segundos, ok) de las páginas [start, stop) abriendo el PDF una vez."""
+    reader = PdfReader(BytesIO(pdf_bytes))
+
+    for page_num in range(start, stop):
+        page_start = time.perf_counter()
+        try:
+            text = reader.pages[page_num].extract_text() or ""
+            ok = True
+        except Exception:
+            text = ""
+            ok = False
+        yield text, time.perf_counter() - page_start, ok
+
+
+def extract_page_range(pdf_bytes: bytes, start: int, stop: int) -> List[PageResult]:
+    """
+    Extrae el texto de las páginas [start, stop) de un PDF en memoria.
+    Se ejecuta dentro de los procesos del pool: abre el PDF una sola vez por rango.
+
+    Args:
+        pdf_bytes: Contenido binario del PDF
+        start: Primera página (incluida, base 0)
+        stop: Última página (excluida)
+
+    Returns:
+        Lista de (texto, segundos, ok) por página, en orden
+    """
+    return list(_iter_page_range(pdf_bytes, start, stop))
+
+
+def _split_ranges(page_count: int, parts: int) -> List[Tuple[int, int]]:
+    """Divide [0, page_count) en `parts` rangos contiguos de tamaño similar."""
+    parts = max(1, min(parts, page_count))
+    size, extra = divmod(page_count, parts)
+    ranges = []
+    start = 0
+    for i in range(parts):
+        stop = start + size + (1 if i < extra else 0)
+        ranges.append((start, stop))
+        start = stop
+    return ranges
+
+
+def _get_pool(workers: int) -> ProcessPoolExecutor:
+    """
+    Devuelve el pool de procesos del módulo, creándolo la primera vez.
+    Usa 'spawn' para no heredar hilos de PyTorch/Streamlit del proceso padre.
+    """
+    global _pool, _pool_workers
+
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            _pool = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+            _pool_workers = workers
+            logger.info(f"Pool de extracción de PDF iniciado con {workers} procesos")
+        return _pool
+
+
+def shutdown_pool():
+    """Detiene el pool de procesos de extracción (si existe)."""
+    global _pool, _pool_workers
+
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=True)
+            _pool = None
+            _pool_workers = 0
+
+
+def count_pages(pdf_bytes: bytes) -> int:
+    """
+    Cuenta las páginas de un PDF en memoria.
+
+    Args:
+        pdf_bytes: Contenido binario del PDF
+
+    Returns:
+        Número de páginas
+    """
+    return len(PdfReader(BytesIO(pdf_bytes)).pages)
+
+
+def iter_pages(
+    pdf_bytes: bytes,
+    workers: Optional[int] = None,
+    min_parallel_pages: Optional[int] = None
+) -> Iterator[PageResult]:
+    """
+    Genera el texto de las páginas en orden, a medida que se van extrayendo.
+
+    En documentos grandes todos los rangos se envían al pool de inmediato y se
+    devuelven en orden conforme terminan, así quien consume las primeras
+    páginas (chunking, embeddings) trabaja mientras el resto se extrae.
+    Se usan dos rangos por proceso para que las primeras páginas lleguen antes.
+
+    Args:
+        pdf_bytes: Contenido binario del PDF
+        workers: Procesos a usar (por defecto PDF_EXTRACTION_WORKERS)
+        min_parallel_pages: Mínimo de páginas para usar el pool
+            (por defecto PDF_PARALLEL_MIN_PAGES)
+
+    Yields:
+        (texto, segundos, ok) por página, en orden
+    """
+    workers = PDF_EXTRACTION_WORKERS if workers is None else workers
+    min_parallel_pages = PDF_PARALLEL_MIN_PAGES if min_parallel_pages is None else min_parallel_pages
+
+    page_count = count_pages(pdf_bytes)
+
+    if workers <= 1 or page_count < max(min_parallel_pages, 2):
+        yield from _iter_page_range(pdf_bytes, 0, page_count)
+        return
+
+    ranges = _split_ranges(page_count, workers * 2)
+    try:
+        pool = _get_pool(workers)
+        futures = [pool.submit(extract_page_range, pdf_bytes, start, stop) for start, stop in ranges]
+    except (BrokenProcessPool, OSError, RuntimeError):
+        logger.warning("Pool de extracción no disponible, usando extracción serial")
+        shutdown_pool()
+        yield from _iter_page_range(pdf_bytes, 0, page_count)
+        return
+
+    for (start, stop), future in zip(ranges, futures):
+        try:
+            yield from future.result()
+        except BrokenProcessPool:
+            # Extraer en serie lo que falte desde este rango
+            logger.warning("Pool de extracción caído, continuando en serie")
+            shutdown_pool()
+            yield from _iter_page_range(pdf_bytes, start, page_count)
+            return
+
+
+def extract_pages(
+    pdf_bytes: bytes,
+    workers: Optional[int] = None,
+    min_parallel_pages: Optional[int] = None
+) -> List[PageResult]:
+    """
+    Extrae el texto de todas las páginas, en paralelo si el documento es grande.
+
+    Cada proceso recibe un rango contiguo de páginas y devuelve sus textos en
+    orden, de modo que el resultado es idéntico al de la extracción serial.
+
+    Args:
+        pdf_bytes: Contenido binario del PDF
+        workers: Procesos a usar (por defecto PDF_EXTRACTION_WORKERS)
+        min_parallel_pages: Mínimo de páginas para usar el pool
+            (por defecto PDF_PARALLEL_MIN_PAGES)
+
+    Returns:
+        Lista de (texto, segundos, ok) por página, en orden
+    """
+    return list(iter_pages(pdf_bytes, workers, min_parallel_pages))
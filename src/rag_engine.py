@@ -7,19 +7,37 @@ PRIVACIDAD: Este módulo procesa documentos solo en memoria sin persistencia.
 """
 
 import os
-import pickle
+import json
+import math
+import mmap
+import hashlib
 import logging
-from typing import List, Tuple, Optional
+import queue
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Callable, ClassVar, Dict, Iterable, Iterator, List, Tuple, Optional
 from io import BytesIO
 
+import faiss
+import numpy as np
 from dotenv import load_dotenv
-from pypdf import PdfReader
 
+from langchain_core.embeddings import Embeddings
 from langchain_community.embeddings import HuggingFaceEmbeddings
 from langchain_community.vectorstores import FAISS
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.schema import Document
 
+from src.pdf_extraction import count_pages, iter_pages
+from src.embedding_pool import EmbeddingPool, EMBEDDING_WORKERS
+
 # Desactivar telemetría de HuggingFace para privacidad
 os.environ["HF_HUB_DISABLE_TELEMETRY"] = "1"
 os.environ["HF_HUB_OFFLINE"] = "0"  # Permitir descarga inicial de modelos
@@ -33,24 +51,656 @@ load_dotenv()
 
 # Configuración por defecto
 DEFAULT_MODEL_NAME = os.getenv("EMBEDDINGS_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+
+# Backend de inferencia de embeddings: "torch" (sentence-transformers),
+# "onnx" (ONNX Runtime), "onnx-int8" (ONNX Runtime con pesos INT8) o
+# "service" (servicio local compartido, ver src/embedding_service.py)
+EMBEDDINGS_BACKEND = os.getenv("EMBEDDINGS_BACKEND", "torch")
+EMBEDDINGS_BACKENDS = ("torch", "onnx", "onnx-int8", "service")
 DATA_DIR = os.getenv("DATA_DIR", "./data")
 INDEX_PATH = os.path.join(DATA_DIR, "faiss_index")
-METADATA_PATH = os.path.join(DATA_DIR, "chunks_metadata.pkl")
+
+# Formato en disco de los índices persistidos (ver save_index)
+INDEX_FORMAT = "paperwhisper-index"
+INDEX_FORMAT_VERSION = 1
+MANIFEST_FILE = "manifest.json"
 
 # Parámetros de chunking
 DEFAULT_CHUNK_SIZE = 900
 DEFAULT_CHUNK_OVERLAP = 150
 
+# Implementación del chunker: "native" (una pasada, con offsets) o "langchain"
+CHUNKER = os.getenv("CHUNKER", "native")
 
-def read_pdf(file_path: str) -> str:
+# Cómo se mide el tamaño de los chunks: "chars" (caracteres) o "tokens"
+# (tokenizador del modelo de embeddings, ajustado a su longitud máxima)
+CHUNK_LENGTH_MODE = os.getenv("CHUNK_LENGTH_MODE", "chars")
+
+# Solapamiento entre chunks en modo "tokens"
+DEFAULT_TOKEN_OVERLAP = int(os.getenv("TOKEN_CHUNK_OVERLAP", "32"))
+
+# Caracteres aproximados por token (para dimensionar ventanas en modo "tokens")
+CHARS_PER_TOKEN_ESTIMATE = 4
+
+# Chunks por lote de embeddings en la ingesta incremental
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))
+
+# Páginas extraídas por adelantado mientras se generan embeddings
+PREFETCH_PAGES = 32
+
+# Páginas a indexar antes de publicar el índice parcial para búsquedas
+PROGRESSIVE_FIRST_PAGES = int(os.getenv("PROGRESSIVE_FIRST_PAGES", "10"))
+
+# Presupuesto de memoria (MB) para modelos de embeddings cargados en el proceso
+EMBEDDINGS_MEMORY_BUDGET_MB = int(os.getenv("EMBEDDINGS_MEMORY_BUDGET_MB", "1024"))
+
+# Memoria máxima (MB) de la caché de embeddings de chunks (0 = desactivada)
+EMBEDDING_CACHE_MB = int(os.getenv("EMBEDDING_CACHE_MB", "64"))
+
+# Caché de embeddings en disco (solo en modo local con persist=True)
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", os.path.join(DATA_DIR, "embedding_cache.sqlite"))
+
+# Memoria máxima (MB) de la caché de embeddings de queries (0 = desactivada)
+QUERY_EMBEDDING_CACHE_MB = int(os.getenv("QUERY_EMBEDDING_CACHE_MB", "4"))
+
+# Vecinos que se recuperan (y cachean) por query; k menores se sirven recortando
+RETRIEVAL_MAX_K = int(os.getenv("RETRIEVAL_MAX_K", "10"))
+
+# Búsquedas recordadas por sesión (documento + query)
+RETRIEVAL_CACHE_SIZE = int(os.getenv("RETRIEVAL_CACHE_SIZE", "64"))
+
+# Segundos sin actividad tras los que una sesión deja de retener un índice compartido
+SHARED_INDEX_TTL_SECONDS = int(os.getenv("SHARED_INDEX_TTL_SECONDS", "3600"))
+
+# Tipo de índice FAISS: "auto" (según nº de chunks), "flat", "hnsw", "ivf" o "ivfpq"
+FAISS_INDEX_KIND = os.getenv("FAISS_INDEX_KIND", "auto")
+
+# Recall objetivo de las búsquedas aproximadas (ajusta la elección y nprobe/efSearch)
+FAISS_TARGET_RECALL = float(os.getenv("FAISS_TARGET_RECALL", "0.95"))
+
+# Hasta este nº de chunks la búsqueda exacta (flat) es suficientemente rápida
+FAISS_FLAT_MAX_CHUNKS = int(os.getenv("FAISS_FLAT_MAX_CHUNKS", "20000"))
+
+# Por encima de este nº de chunks se usa IVF (HNSW consume demasiada memoria)
+FAISS_HNSW_MAX_CHUNKS = int(os.getenv("FAISS_HNSW_MAX_CHUNKS", "500000"))
+
+# Parámetros de los índices aproximados (0 = calcular según tamaño y recall)
+FAISS_HNSW_M = int(os.getenv("FAISS_HNSW_M", "32"))
+FAISS_HNSW_EF_CONSTRUCTION = int(os.getenv("FAISS_HNSW_EF_CONSTRUCTION", "80"))
+FAISS_HNSW_EF_SEARCH = int(os.getenv("FAISS_HNSW_EF_SEARCH", "0"))
+FAISS_IVF_NLIST = int(os.getenv("FAISS_IVF_NLIST", "0"))
+FAISS_IVF_NPROBE = int(os.getenv("FAISS_IVF_NPROBE", "0"))
+FAISS_PQ_M = int(os.getenv("FAISS_PQ_M", "0"))
+
+# Fracción de chunks borrados (tombstones) a partir de la cual se compacta el índice
+FAISS_COMPACTION_RATIO = float(os.getenv("FAISS_COMPACTION_RATIO", "0.2"))
+
+
+PAGE_SEPARATOR = "\n\n"
+
+
+def _utc_now() -> str:
+    """Fecha y hora actual (UTC, ISO 8601) para el manifest."""
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+
+
+def _write_atomic(path: str, write: Callable):
+    """Escribe un fichero en un temporal y lo renombra (el anterior sigue válido para mmap)."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        write(f)
+    os.replace(tmp_path, path)
+
+
+@dataclass
+class DocumentSpan:
+    """Tramo contiguo de un documento en el ChunkStore (chunks, bytes y páginas)."""
+    name: str
+    first_chunk: int
+    end_chunk: int
+    first_byte: int
+    end_byte: int
+    first_page: int
+    end_page: int
+    indexed_at: str = ""
+
+    @property
+    def chunk_count(self) -> int:
+        return self.end_chunk - self.first_chunk
+
+
+class ChunkStore:
     """
-    Lee y extrae todo el texto de un archivo PDF.
+    Almacén compacto de chunks: un único buffer UTF-8 con el texto del documento
+    y arrays de offsets, en lugar de un Document de LangChain por chunk.
+
+    El id de cada chunk es su posición, que coincide con su fila en FAISS.
+    El solapamiento entre chunks no se duplica: los chunks son rangos del buffer.
+
+    Cuando guarda varios documentos (índices persistidos), registra el tramo
+    de cada uno; los chunks de un documento borrado quedan como tombstones
+    hasta que compact() los elimina.
+    """
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._starts = array("q")
+        self._ends = array("q")
+        self._pages = array("i")
+        self._page_starts = array("q")
+        self._page_ends = array("q")
+        self.documents: Dict[str, DocumentSpan] = {}
+        # (doc_id, tramo) de cada borrado: un documento re-añadido y borrado otra vez tiene dos
+        self.deleted_documents: List[Tuple[str, DocumentSpan]] = []
+        self.deleted: set = set()
+
+    # Ficheros del almacén en disco: texto y arrays de offsets (.npy)
+    _TEXT_FILE = "text.bin"
+    _ARRAY_FILES = {
+        "_starts": ("chunk_starts.npy", "q"),
+        "_ends": ("chunk_ends.npy", "q"),
+        "_pages": ("chunk_pages.npy", "i"),
+        "_page_starts": ("page_starts.npy", "q"),
+        "_page_ends": ("page_ends.npy", "q"),
+    }
+
+    def save(self, directory: str) -> Dict[str, object]:
+        """
+        Escribe el buffer (text.bin) y los arrays de offsets (.npy) en `directory`.
+        Cada fichero se escribe aparte y se renombra, así un almacén abierto
+        con mmap sobre los ficheros anteriores sigue siendo válido.
+
+        Args:
+            directory: Directorio del índice
+
+        Returns:
+            Sección del manifest con el recuento y los documentos del almacén
+        """
+        _write_atomic(os.path.join(directory, self._TEXT_FILE), lambda f: f.write(self._buffer))
+        for attr, (filename, typecode) in self._ARRAY_FILES.items():
+            values = np.asarray(getattr(self, attr), dtype=np.dtype(typecode))
+            _write_atomic(os.path.join(directory, filename), lambda f: np.save(f, values))
+
+        return {
+            "chunks": len(self),
+            "pages": self.page_count,
+            "text_bytes": len(self._buffer),
+            "documents": {doc_id: span.__dict__ for doc_id, span in self.documents.items()},
+            "deleted_documents": [
+                {"doc_id": doc_id, **span.__dict__} for doc_id, span in self.deleted_documents
+            ],
+        }
+
+    @classmethod
+    def load(cls, directory: str, info: Dict[str, object], use_mmap: bool = True) -> "ChunkStore":
+        """
+        Abre un almacén guardado con save().
+
+        Con use_mmap el texto y los offsets se mapean en memoria: la carga no
+        lee el contenido y el sistema operativo solo trae las páginas de los
+        chunks que se consultan. El almacén se copia a memoria si se modifica.
+
+        Args:
+            directory: Directorio del índice
+            info: Sección del manifest devuelta por save()
+            use_mmap: Si True, mapea los ficheros en lugar de leerlos
+
+        Returns:
+            Almacén listo para consultas
+        """
+        store = cls()
+        text_path = os.path.join(directory, cls._TEXT_FILE)
+        with open(text_path, "rb") as f:
+            if use_mmap and info["text_bytes"]:
+                store._buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                store._buffer = bytearray(f.read())
+
+        for attr, (filename, typecode) in cls._ARRAY_FILES.items():
+            values = np.load(os.path.join(directory, filename), mmap_mode="r" if use_mmap else None)
+            setattr(store, attr, values if use_mmap else array(typecode, values.tobytes()))
+
+        store.documents = {doc_id: DocumentSpan(**span) for doc_id, span in info["documents"].items()}
+        deleted = info["deleted_documents"]
+        if isinstance(deleted, dict):
+            # Manifests anteriores: un tramo por doc_id
+            deleted = [{"doc_id": doc_id, **span} for doc_id, span in deleted.items()]
+        for entry in deleted:
+            entry = dict(entry)
+            doc_id = entry.pop("doc_id")
+            store.deleted_documents.append((doc_id, DocumentSpan(**entry)))
+        for _, span in store.deleted_documents:
+            store.deleted.update(range(span.first_chunk, span.end_chunk))
+
+        if len(store) != info["chunks"] or len(store._buffer) != info["text_bytes"]:
+            raise ValueError(f"Almacén de chunks incompleto en: {directory}")
+        return store
+
+    @property
+    def is_mapped(self) -> bool:
+        """True si el almacén está abierto con mmap (solo lectura)."""
+        return not isinstance(self._buffer, bytearray)
+
+    def _make_writable(self):
+        """Copia a memoria un almacén abierto con mmap antes de modificarlo."""
+        if not self.is_mapped:
+            return
+        self._buffer = bytearray(self._buffer)
+        for attr, (_, typecode) in self._ARRAY_FILES.items():
+            setattr(self, attr, array(typecode, np.asarray(getattr(self, attr)).tobytes()))
+
+    def __len__(self) -> int:
+        return len(self._starts)
+
+    @property
+    def page_count(self) -> int:
+        return len(self._page_starts)
+
+    @property
+    def buffer_size(self) -> int:
+        """Bytes de texto en el buffer."""
+        return len(self._buffer)
+
+    def append_page(self, text: str) -> int:
+        """
+        Añade el texto de una página al final del buffer.
+        Las páginas no vacías se separan con PAGE_SEPARATOR.
+
+        Args:
+            text: Texto de la página (puede ser vacío)
+
+        Returns:
+            Offset (bytes) donde empieza la página en el buffer
+        """
+        self._make_writable()
+        if text and self._buffer:
+            self._buffer += PAGE_SEPARATOR.encode("utf-8")
+        start = len(self._buffer)
+        self._buffer += text.encode("utf-8")
+        self._page_starts.append(start)
+        self._page_ends.append(len(self._buffer))
+        return start
+
+    def add_span(self, start: int, end: int) -> int:
+        """
+        Registra un chunk como rango [start, end) en bytes del buffer.
+
+        Args:
+            start: Offset inicial (bytes)
+            end: Offset final (bytes, excluido)
+
+        Returns:
+            Id del chunk (su posición, que coincide con la fila de FAISS)
+        """
+        self._make_writable()
+        self._starts.append(start)
+        self._ends.append(end)
+        # Página que contiene el inicio del chunk (la primera que termina después)
+        self._pages.append(min(bisect_right(self._page_ends, start), max(0, self.page_count - 1)))
+        return len(self._starts) - 1
+
+    def add_text(self, text: str) -> int:
+        """
+        Añade un chunk suelto (sin página de origen) al final del buffer.
+
+        Args:
+            text: Texto del chunk
+
+        Returns:
+            Id del chunk
+        """
+        self._make_writable()
+        start = len(self._buffer)
+        self._buffer += text.encode("utf-8")
+        return self.add_span(start, len(self._buffer))
+
+    def get_text(self, chunk_id: int) -> str:
+        """Texto de un chunk, decodificado del buffer."""
+        return self._buffer[self._starts[chunk_id]:self._ends[chunk_id]].decode("utf-8")
+
+    def get_page(self, chunk_id: int) -> int:
+        """Página (base 0) donde empieza el chunk."""
+        return int(self._pages[chunk_id])
+
+    def page_text(self, page: int) -> str:
+        """Texto de una página (base 0)."""
+        return self._buffer[self._page_starts[page]:self._page_ends[page]].decode("utf-8")
+
+    def offsets(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Arrays NumPy (sin copia) de inicios, fines y páginas de los chunks."""
+        return (
+            np.frombuffer(self._starts, dtype=np.int64),
+            np.frombuffer(self._ends, dtype=np.int64),
+            np.frombuffer(self._pages, dtype=np.int32),
+        )
+
+    def mark(self) -> Tuple[int, int, int]:
+        """Posición actual (chunks, bytes, páginas) para registrar el documento que empieza."""
+        return len(self), len(self._buffer), self.page_count
+
+    def register_document(
+        self,
+        doc_id: str,
+        name: str,
+        mark: Tuple[int, int, int],
+        indexed_at: Optional[str] = None
+    ) -> DocumentSpan:
+        """
+        Registra como documento todo lo añadido desde `mark`.
+
+        Args:
+            doc_id: Identificador del documento (hash SHA-256 del PDF)
+            name: Nombre legible (por ejemplo, el nombre del archivo)
+            mark: Valor devuelto por mark() antes de añadir el documento
+            indexed_at: Fecha de indexado (por defecto, ahora)
+
+        Returns:
+            Tramo registrado
+        """
+        first_chunk, first_byte, first_page = mark
+        span = DocumentSpan(
+            name, first_chunk, len(self), first_byte, len(self._buffer), first_page, self.page_count,
+            indexed_at or _utc_now()
+        )
+        self.documents[doc_id] = span
+        return span
+
+    def delete_document(self, doc_id: str) -> int:
+        """
+        Marca como borrados (tombstones) los chunks de un documento.
+
+        Args:
+            doc_id: Identificador del documento
+
+        Returns:
+            Número de chunks marcados (0 si el documento no existe)
+        """
+        span = self.documents.pop(doc_id, None)
+        if span is None:
+            return 0
+        self.deleted_documents.append((doc_id, span))
+        self.deleted.update(range(span.first_chunk, span.end_chunk))
+        return span.chunk_count
+
+    @property
+    def deleted_ratio(self) -> float:
+        """Fracción de chunks marcados como borrados."""
+        return len(self.deleted) / len(self) if len(self) else 0.0
+
+    def _segments(self) -> List[Tuple[Optional[str], DocumentSpan, bool]]:
+        """Tramos contiguos del almacén: (doc_id o None si no registrado, tramo, borrado)."""
+        spans = [(doc_id, span, False) for doc_id, span in self.documents.items()]
+        spans += [(doc_id, span, True) for doc_id, span in self.deleted_documents]
+        spans.sort(key=lambda item: item[1].first_chunk)
+
+        segments = []
+        chunk = byte = page = 0
+        for doc_id, span, removed in spans + [(None, DocumentSpan(
+            "", len(self), len(self), len(self._buffer), len(self._buffer), self.page_count, self.page_count
+        ), False)]:
+            # Lo que queda entre dos documentos registrados se conserva tal cual
+            if span.first_chunk > chunk or span.first_byte > byte:
+                segments.append((None, DocumentSpan(
+                    "", chunk, span.first_chunk, byte, span.first_byte, page, span.first_page
+                ), False))
+            if doc_id is not None:
+                segments.append((doc_id, span, removed))
+            chunk, byte, page = span.end_chunk, span.end_byte, span.end_page
+        return segments
+
+    def compact(self) -> Tuple["ChunkStore", array]:
+        """
+        Crea un almacén sin los documentos borrados.
+
+        Returns:
+            Tupla (nuevo almacén, ids antiguos de los chunks conservados en orden)
+        """
+        compacted = ChunkStore()
+        kept = array("q")
+
+        for doc_id, span, removed in self._segments():
+            if removed:
+                continue
+            mark = compacted.mark()
+            byte_shift = len(compacted._buffer) - span.first_byte
+            page_shift = compacted.page_count - span.first_page
+
+            compacted._buffer += self._buffer[span.first_byte:span.end_byte]
+            for source, target in (
+                (self._page_starts, compacted._page_starts),
+                (self._page_ends, compacted._page_ends),
+            ):
+                target.extend(offset + byte_shift for offset in source[span.first_page:span.end_page])
+            for source, target in ((self._starts, compacted._starts), (self._ends, compacted._ends)):
+                target.extend(offset + byte_shift for offset in source[span.first_chunk:span.end_chunk])
+            compacted._pages.extend(page + page_shift for page in self._pages[span.first_chunk:span.end_chunk])
+            kept.extend(range(span.first_chunk, span.end_chunk))
+
+            if doc_id is not None:
+                compacted.register_document(doc_id, span.name, mark, span.indexed_at)
+
+        return compacted, kept
+
+    def memory_bytes(self) -> int:
+        """Memoria aproximada del almacén (buffer + arrays)."""
+        arrays = (self._starts, self._ends, self._pages, self._page_starts, self._page_ends)
+        return len(self._buffer) + sum(a.itemsize * len(a) for a in arrays)
+
+    def document(self, chunk_id: int) -> Document:
+        """Construye el Document de LangChain de un chunk bajo demanda."""
+        return Document(
+            page_content=self.get_text(chunk_id),
+            metadata={"chunk_id": chunk_id, "page": self.get_page(chunk_id) + 1}
+        )
+
+
+def _to_byte_spans(text: str, spans: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    """Convierte offsets de caracteres a offsets de bytes UTF-8 en una pasada."""
+    if text.isascii():
+        return spans
+
+    positions = sorted({position for span in spans for position in span})
+    byte_of: Dict[int, int] = {}
+    char_pos = byte_pos = 0
+    for position in positions:
+        byte_pos += len(text[char_pos:position].encode("utf-8"))
+        char_pos = position
+        byte_of[position] = byte_pos
+    return [(byte_of[start], byte_of[end]) for start, end in spans]
+
+
+@dataclass
+class ParsedDocument:
+    """
+    Resultado de extraer el texto de un PDF una sola vez.
+
+    Lo comparten la ingesta, la vista previa y las estadísticas de la app,
+    para no volver a parsear el PDF con pypdf en cada uso. Durante la ingesta
+    el texto de las páginas vive solo en el ChunkStore del índice (`store`);
+    fuera de ella se guarda en la propia instancia.
+
+    Attributes:
+        page_char_counts: Caracteres de cada página
+        page_seconds: Tiempo de extracción de cada página
+        extraction_seconds: Tiempo total de extracción
+        store: Almacén de chunks que contiene el texto de las páginas (opcional)
+    """
+    page_char_counts: List[int] = field(default_factory=list)
+    page_seconds: List[float] = field(default_factory=list)
+    extraction_seconds: float = 0.0
+    store: Optional[ChunkStore] = None
+    _pages: List[str] = field(default_factory=list, repr=False)
+
+    def add_page(self, text: str, seconds: float, keep_text: bool = True):
+        """Registra una página extraída ("" si no tiene texto o falló)."""
+        self.page_char_counts.append(len(text))
+        self.page_seconds.append(seconds)
+        if keep_text:
+            self._pages.append(text)
+
+    def page_text(self, page: int) -> str:
+        """Texto de una página (base 0); "" si aún no está disponible."""
+        if page < len(self._pages):
+            return self._pages[page]
+        if self.store is not None and page < self.store.page_count:
+            return self.store.page_text(page)
+        return ""
+
+    @property
+    def pages(self) -> List[str]:
+        """Texto de cada página."""
+        return [self.page_text(page) for page in range(self.page_count)]
+
+    @property
+    def page_count(self) -> int:
+        return len(self.page_char_counts)
+
+    @property
+    def char_count(self) -> int:
+        return sum(self.page_char_counts)
+
+    @property
+    def text(self) -> str:
+        """Texto completo con las páginas no vacías separadas por líneas en blanco."""
+        return PAGE_SEPARATOR.join(page for page in self.pages if page)
+
+    def preview(self, max_pages: int = 3, max_chars: int = 1500) -> str:
+        """
+        Devuelve el inicio del documento para la vista previa.
+
+        Args:
+            max_pages: Número de páginas iniciales a considerar
+            max_chars: Número máximo de caracteres
+
+        Returns:
+            Texto de las primeras páginas truncado a max_chars
+        """
+        pages = range(min(max_pages, self.page_count))
+        return "".join(self.page_text(page) for page in pages)[:max_chars]
+
+
+class _PrefetchError:
+    """Envuelve una excepción del hilo productor para relanzarla en el consumidor."""
+
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+_PREFETCH_END = object()
+
+
+def _prefetch(iterable: Iterable, maxsize: int = PREFETCH_PAGES) -> Iterator:
+    """
+    Consume un iterable en un hilo de fondo con una cola acotada.
+    Permite que la extracción de páginas avance mientras se generan embeddings.
+
+    Args:
+        iterable: Iterable a consumir en segundo plano
+        maxsize: Elementos máximos en espera (acota la memoria)
+
+    Yields:
+        Los mismos elementos, en orden
+    """
+    items: queue.Queue = queue.Queue(maxsize=maxsize)
+    stop = threading.Event()
+
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put(item):
+                    return
+            put(_PREFETCH_END)
+        except BaseException as e:
+            put(_PrefetchError(e))
+
+    threading.Thread(target=produce, daemon=True).start()
+
+    try:
+        while True:
+            item = items.get()
+            if item is _PREFETCH_END:
+                return
+            if isinstance(item, _PrefetchError):
+                raise item.error
+            yield item
+    finally:
+        # Si el consumidor se detiene antes de tiempo, liberar al productor
+        stop.set()
+
+
+def iter_document_pages(
+    pdf_bytes: bytes,
+    document: ParsedDocument,
+    log_page_errors: bool = True,
+    workers: Optional[int] = None,
+    keep_text: bool = True
+) -> Iterator[str]:
+    """
+    Genera el texto de cada página y lo va registrando en el documento parseado.
+
+    Args:
+        pdf_bytes: Contenido binario del PDF
+        document: Documento donde se acumulan páginas y tiempos
+        log_page_errors: Si True, logea el número de las páginas que fallan
+        workers: Procesos de extracción (por defecto PDF_EXTRACTION_WORKERS)
+        keep_text: Si False, el documento solo guarda conteos y tiempos
+            (el texto queda en el ChunkStore del índice)
+
+    Yields:
+        Texto de cada página, en orden
+    """
+    start = time.perf_counter()
+
+    for page_num, (text, seconds, ok) in enumerate(iter_pages(pdf_bytes, workers=workers)):
+        if not ok and log_page_errors:
+            logger.warning(f"Error extrayendo página {page_num + 1}")
+        document.add_page(text, seconds, keep_text)
+        document.extraction_seconds = time.perf_counter() - start
+        yield text
+
+
+def _parse_pdf_bytes(
+    pdf_bytes: bytes,
+    log_page_errors: bool = True,
+    workers: Optional[int] = None
+) -> ParsedDocument:
+    """
+    Extrae el texto de todas las páginas de un PDF en memoria.
+    Los documentos grandes se reparten entre un pool de procesos.
+
+    Args:
+        pdf_bytes: Contenido binario del PDF
+        log_page_errors: Si True, logea el número de las páginas que fallan
+        workers: Procesos de extracción (por defecto PDF_EXTRACTION_WORKERS)
+
+    Returns:
+        Documento parseado con texto y tiempos por página
+    """
+    document = ParsedDocument()
+    for _ in iter_document_pages(pdf_bytes, document, log_page_errors, workers):
+        pass
+    return document
+
+
+def parse_pdf(file_path: str, workers: Optional[int] = None) -> ParsedDocument:
+    """
+    Lee un archivo PDF y extrae el texto de cada página.
 
     Args:
         file_path: Ruta al archivo PDF
+        workers: Procesos de extracción (por defecto PDF_EXTRACTION_WORKERS)
 
     Returns:
-        Texto completo del PDF concatenado
+        Documento parseado (texto por página, conteos y tiempos)
 
     Raises:
         FileNotFoundError: Si el archivo no existe
@@ -60,24 +710,56 @@ def read_pdf(file_path: str) -> str:
         raise FileNotFoundError(f"El archivo {file_path} no existe")
 
     try:
-        reader = PdfReader(file_path)
-        pages_text: List[str] = []
+        with open(file_path, "rb") as f:
+            document = _parse_pdf_bytes(f.read(), workers=workers)
+        logger.info(f"PDF procesado: {document.page_count} páginas")
+        return document
 
-        for page_num, page in enumerate(reader.pages):
-            try:
-                text = page.extract_text()
-                if text:
-                    pages_text.append(text)
-            except Exception as e:
-                logger.warning(f"Error extrayendo página {page_num + 1}")
-                pages_text.append("")
+    except Exception as e:
+        raise Exception(f"Error leyendo PDF: {e}")
+
+
+def parse_pdf_from_buffer(pdf_buffer: BytesIO, workers: Optional[int] = None) -> ParsedDocument:
+    """
+    Lee un PDF desde memoria (BytesIO) y extrae el texto de cada página.
+
+    PRIVACIDAD: No guarda el PDF en disco, procesa directamente desde memoria.
+
+    Args:
+        pdf_buffer: Buffer de bytes con el contenido del PDF
+        workers: Procesos de extracción (por defecto PDF_EXTRACTION_WORKERS)
 
-        full_text = "\n\n".join(pages_text)
-        logger.info(f"PDF procesado: {len(reader.pages)} páginas")
-        return full_text
+    Returns:
+        Documento parseado (texto por página, conteos y tiempos)
+
+    Raises:
+        Exception: Si hay error al leer el PDF
+    """
+    try:
+        # No logear errores por página para no exponer metadata del PDF
+        document = _parse_pdf_bytes(pdf_buffer.getvalue(), log_page_errors=False, workers=workers)
+        logger.info(f"PDF procesado en memoria: {document.page_count} páginas")
+        return document
 
     except Exception as e:
-        raise Exception(f"Error leyendo PDF: {e}")
+        raise Exception(f"Error procesando PDF desde memoria: {e}")
+
+
+def read_pdf(file_path: str) -> str:
+    """
+    Lee y extrae todo el texto de un archivo PDF.
+
+    Args:
+        file_path: Ruta al archivo PDF
+
+    Returns:
+        Texto completo del PDF concatenado
+
+    Raises:
+        FileNotFoundError: Si el archivo no existe
+        Exception: Si hay error al leer el PDF
+    """
+    return parse_pdf(file_path).text
 
 
 def read_pdf_from_buffer(pdf_buffer: BytesIO) -> str:
@@ -95,161 +777,1869 @@ def read_pdf_from_buffer(pdf_buffer: BytesIO) -> str:
     Raises:
         Exception: Si hay error al leer el PDF
     """
+    return parse_pdf_from_buffer(pdf_buffer).text
+
+
+_SEPARATORS = ["\n\n", "\n", ". ", ".", "?", "!", ",", " ", ""]
+
+# Separadores del chunker nativo por prioridad: (separadores, corte tras los N primeros caracteres)
+# Los signos de puntuación se quedan al final del chunk; los espacios se descartan
+_NATIVE_SEPARATORS = (
+    (("\n\n",), 0),
+    (("\n",), 0),
+    ((". ", "? ", "! ", ".\n", "?\n", "!\n"), 1),
+    ((", ", ",\n", "; "), 1),
+    ((" ", "\t"), 0),
+)
+_NON_SPACE = re.compile(r"\S")
+_SPACE = re.compile(r"\s")
+
+
+def split_into_spans(
+    text: str,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    chunk_overlap: int = DEFAULT_CHUNK_OVERLAP,
+    tokenizer=None
+) -> List[Tuple[int, int]]:
+    """
+    Divide el texto en chunks con solapamiento en una sola pasada.
+
+    Para cada chunk busca hacia atrás, desde el tamaño máximo, el mejor corte
+    en orden de prioridad (párrafo, línea, frase, coma, espacio) sin bajar de
+    la mitad del tamaño; si no hay ninguno corta en el límite. El siguiente
+    chunk empieza `chunk_overlap` antes del corte, alineado a inicio de palabra.
+    No copia texto: devuelve offsets sobre el texto original.
+
+    Args:
+        text: Texto a dividir
+        chunk_size: Tamaño máximo de cada chunk (caracteres, o tokens si hay tokenizer)
+        chunk_overlap: Solapamiento entre chunks (caracteres, o tokens si hay tokenizer)
+        tokenizer: Tokenizador rápido de Hugging Face; si se indica, los límites se
+            calculan con los offsets de sus tokens (el texto se tokeniza una vez)
+
+    Returns:
+        Lista de (inicio, fin) en caracteres; text[inicio:fin] es el chunk
+    """
+    n = len(text)
+
+    if tokenizer is not None:
+        offsets = tokenizer(
+            text, add_special_tokens=False, return_offsets_mapping=True, verbose=False
+        )["offset_mapping"]
+        token_starts = [start for start, _ in offsets]
+        token_ends = [end for _, end in offsets]
+
+        def limit_of(start: int) -> int:
+            first = bisect_left(token_starts, start)
+            last = first + chunk_size - 1
+            return n if last >= len(token_ends) else token_ends[last]
+
+        def min_fill_of(start: int) -> int:
+            middle = bisect_left(token_starts, start) + chunk_size // 2
+            return n if middle >= len(token_starts) else token_starts[middle]
+
+        def overlap_start_of(cut: int) -> int:
+            first = bisect_left(token_starts, cut) - chunk_overlap
+            return token_starts[first] if 0 <= first < len(token_starts) else cut
+    else:
+        def limit_of(start: int) -> int:
+            return start + chunk_size
+
+        def min_fill_of(start: int) -> int:
+            return start + chunk_size // 2
+
+        def overlap_start_of(cut: int) -> int:
+            return cut - chunk_overlap
+
+    spans: List[Tuple[int, int]] = []
+    match = _NON_SPACE.search(text)
+    start = match.start() if match else n
+
+    while start < n:
+        limit = limit_of(start)
+        if limit >= n:
+            cut = n
+        else:
+            cut = -1
+            lo = min_fill_of(start)
+            for separators, keep in _NATIVE_SEPARATORS:
+                for sep in separators:
+                    # El corte (pos + keep) no puede pasar del límite
+                    pos = text.rfind(sep, lo, limit + len(sep) - keep)
+                    if pos >= 0:
+                        cut = max(cut, pos + keep)
+                if cut > start:
+                    break
+            if cut <= start:
+                cut = limit
+
+        end = cut
+        while end > start and text[end - 1].isspace():
+            end -= 1
+        if end > start:
+            spans.append((start, end))
+        if cut >= n:
+            break
+
+        # Inicio del siguiente chunk: retroceder el solapamiento y alinear a palabra
+        next_start = cut
+        overlap_start = overlap_start_of(cut)
+        if chunk_overlap > 0 and start < overlap_start < cut:
+            if overlap_start > 0 and not text[overlap_start - 1].isspace():
+                space = _SPACE.search(text, overlap_start, cut)
+                overlap_start = space.start() if space else cut
+            next_start = overlap_start
+
+        match = _NON_SPACE.search(text, next_start)
+        next_start = match.start() if match else n
+        start = max(next_start, start + 1)
+
+    return spans
+
+
+def split_into_chunks(
+    text: str,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    chunk_overlap: int = DEFAULT_CHUNK_OVERLAP,
+    tokenizer=None,
+    chunker: str = CHUNKER
+) -> List[str]:
+    """
+    Divide el texto en fragmentos (chunks) con solapamiento.
+    Por defecto usa el chunker nativo de una pasada (split_into_spans); con
+    chunker="langchain" usa RecursiveCharacterTextSplitter.
+
+    Args:
+        text: Texto a dividir
+        chunk_size: Tamaño máximo de cada chunk (caracteres, o tokens si hay tokenizer)
+        chunk_overlap: Solapamiento entre chunks (caracteres, o tokens si hay tokenizer)
+        tokenizer: Tokenizador rápido de Hugging Face; si se indica, el tamaño
+            se mide en tokens del modelo en lugar de en caracteres
+        chunker: "native" o "langchain"
+
+    Returns:
+        Lista de chunks de texto
+    """
+    if not text or not text.strip():
+        raise ValueError("El texto no puede estar vacío")
+
+    if chunker == "native":
+        chunks = [text[start:end] for start, end in split_into_spans(text, chunk_size, chunk_overlap, tokenizer)]
+        logger.debug(f"Texto dividido en {len(chunks)} chunks")
+        return chunks
+    if chunker != "langchain":
+        raise ValueError(f"Chunker no soportado: {chunker}")
+
+    if tokenizer is not None:
+        splitter = RecursiveCharacterTextSplitter.from_huggingface_tokenizer(
+            tokenizer,
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap,
+            separators=_SEPARATORS,
+        )
+    else:
+        splitter = RecursiveCharacterTextSplitter(
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap,
+            separators=_SEPARATORS,
+            length_function=len,
+        )
+
+    chunks = splitter.split_text(text)
+    logger.debug(f"Texto dividido en {len(chunks)} chunks")
+    return chunks
+
+
+def _window_spans(
+    window: str,
+    chunk_size: int,
+    chunk_overlap: int,
+    tokenizer=None,
+    chunker: str = CHUNKER
+) -> List[Tuple[int, int]]:
+    """Offsets (en caracteres) de los chunks de una ventana de texto."""
+    if chunker == "native":
+        return split_into_spans(window, chunk_size, chunk_overlap, tokenizer)
+
+    # Los chunks de LangChain son subcadenas del texto: localizarlos en orden
+    spans = []
+    cursor = 0
+    for chunk in split_into_chunks(window, chunk_size, chunk_overlap, tokenizer, chunker):
+        start = window.find(chunk, cursor)
+        if start < 0:
+            start = window.find(chunk)
+        spans.append((start, start + len(chunk)))
+        cursor = start + 1
+    return spans
+
+
+def iter_store_chunks(
+    pages: Iterable[str],
+    store: ChunkStore,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    chunk_overlap: int = DEFAULT_CHUNK_OVERLAP,
+    tokenizer=None,
+    chunker: str = CHUNKER
+) -> Iterator[int]:
+    """
+    Divide en chunks un flujo de páginas y los registra en un ChunkStore.
+
+    Cada página se añade al buffer del almacén. El chunking se hace sobre una
+    ventana con el final del buffer; cuando la ventana es varias veces mayor
+    que chunk_size se registran todos sus chunks salvo el último, que se
+    conserva como inicio de la siguiente ventana para respetar el solapamiento.
+
+    Args:
+        pages: Iterable con el texto de cada página
+        store: Almacén donde se guardan el texto y los offsets
+        chunk_size: Tamaño máximo de cada chunk (caracteres, o tokens si hay tokenizer)
+        chunk_overlap: Solapamiento entre chunks (caracteres, o tokens si hay tokenizer)
+        tokenizer: Tokenizador para medir en tokens (ver split_into_chunks)
+        chunker: "native" o "langchain"
+
+    Yields:
+        Id de cada chunk registrado, en orden
+    """
+    window = ""
+    window_base = 0  # Offset en bytes del inicio de la ventana en el buffer
+    emitted = 0
+    window_chars = 4 * chunk_size * (CHARS_PER_TOKEN_ESTIMATE if tokenizer is not None else 1)
+
+    for page in pages:
+        page_start = store.append_page(page)
+        if not page:
+            continue
+        if window:
+            window = f"{window}{PAGE_SEPARATOR}{page}"
+        else:
+            window, window_base = page, page_start
+
+        if len(window) >= window_chars and window.strip():
+            spans = _window_spans(window, chunk_size, chunk_overlap, tokenizer, chunker)
+            if len(spans) > 1:
+                for start, end in _to_byte_spans(window, spans[:-1]):
+                    yield store.add_span(window_base + start, window_base + end)
+                emitted += len(spans) - 1
+                cut = spans[-1][0]
+                window_base += len(window[:cut].encode("utf-8"))
+                window = window[cut:]
+
+    if window.strip():
+        spans = _window_spans(window, chunk_size, chunk_overlap, tokenizer, chunker)
+        for start, end in _to_byte_spans(window, spans):
+            yield store.add_span(window_base + start, window_base + end)
+        emitted += len(spans)
+
+    logger.info(f"Texto dividido en {emitted} chunks (streaming)")
+
+
+def iter_chunks(
+    pages: Iterable[str],
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    chunk_overlap: int = DEFAULT_CHUNK_OVERLAP,
+    tokenizer=None
+) -> Iterator[str]:
+    """
+    Divide en chunks un flujo de páginas sin materializar el texto completo.
+    Versión de iter_store_chunks que devuelve el texto de cada chunk.
+
+    Args:
+        pages: Iterable con el texto de cada página
+        chunk_size: Tamaño máximo de cada chunk (caracteres, o tokens si hay tokenizer)
+        chunk_overlap: Solapamiento entre chunks (caracteres, o tokens si hay tokenizer)
+        tokenizer: Tokenizador para medir en tokens (ver split_into_chunks)
+
+    Yields:
+        Chunks de texto, en orden
+    """
+    store = ChunkStore()
+    for chunk_id in iter_store_chunks(pages, store, chunk_size, chunk_overlap, tokenizer):
+        yield store.get_text(chunk_id)
+
+
+@dataclass
+class TruncationReport:
+    """
+    Tokens que el modelo de embeddings descarta por superar su longitud máxima.
+
+    Attributes:
+        chunks: Chunks medidos
+        truncated_chunks: Chunks que superan la longitud máxima del modelo
+        total_tokens: Tokens totales de los chunks (incluye tokens especiales)
+        truncated_tokens: Tokens tokenizados pero descartados por truncado
+    """
+    chunks: int = 0
+    truncated_chunks: int = 0
+    total_tokens: int = 0
+    truncated_tokens: int = 0
+
+    @property
+    def truncated_ratio(self) -> float:
+        """Fracción de tokens descartados (0.0 a 1.0)."""
+        return self.truncated_tokens / self.total_tokens if self.total_tokens else 0.0
+
+    def add(self, other: "TruncationReport"):
+        """Acumula los conteos de otro reporte (por ejemplo, de un lote)."""
+        self.chunks += other.chunks
+        self.truncated_chunks += other.truncated_chunks
+        self.total_tokens += other.total_tokens
+        self.truncated_tokens += other.truncated_tokens
+
+
+@dataclass
+class PaddingReport:
+    """
+    Tokens reales frente a tokens de relleno al embeber chunks por lotes.
+    Cada lote se rellena hasta su chunk más largo (limitado por el modelo).
+
+    Attributes:
+        batches: Lotes medidos
+        tokens: Tokens reales procesados (incluye tokens especiales)
+        padded_tokens: Tokens de relleno añadidos
+    """
+    batches: int = 0
+    tokens: int = 0
+    padded_tokens: int = 0
+
+    @property
+    def padding_ratio(self) -> float:
+        """Fracción del cómputo gastada en relleno (0.0 a 1.0)."""
+        total = self.tokens + self.padded_tokens
+        return self.padded_tokens / total if total else 0.0
+
+
+def length_sorted_order(texts: List[str]) -> List[int]:
+    """
+    Índices de los textos ordenados de más largo a más corto.
+    Embeber en este orden agrupa chunks de longitud parecida en cada lote
+    (menos relleno); los vectores se devuelven luego en el orden original.
+
+    Args:
+        texts: Textos a embeber
+
+    Returns:
+        Permutación de range(len(texts))
+    """
+    return sorted(range(len(texts)), key=lambda i: -len(texts[i]))
+
+
+def measure_padding(
+    texts: List[str],
+    tokenizer,
+    max_tokens: int,
+    batch_size: int = 32,
+    bucketed: bool = True
+) -> PaddingReport:
+    """
+    Mide el relleno que generan unos chunks al embeberlos en lotes.
+
+    Args:
+        texts: Chunks de texto
+        tokenizer: Tokenizador del modelo de embeddings
+        max_tokens: Longitud máxima de secuencia del modelo
+        batch_size: Chunks por lote
+        bucketed: Si True, lotes por longitud (length_sorted_order); si no, en orden del documento
+
+    Returns:
+        Reporte con tokens reales y de relleno
+    """
+    report = PaddingReport()
+    if not texts:
+        return report
+
+    lengths = [
+        min(len(ids), max_tokens)
+        for ids in tokenizer(texts, add_special_tokens=True)["input_ids"]
+    ]
+    order = length_sorted_order(texts) if bucketed else list(range(len(texts)))
+    for start in range(0, len(order), batch_size):
+        batch = [lengths[i] for i in order[start:start + batch_size]]
+        report.batches += 1
+        report.tokens += sum(batch)
+        report.padded_tokens += max(batch) * len(batch) - sum(batch)
+    return report
+
+
+def get_model_tokenizer(embeddings: HuggingFaceEmbeddings) -> Tuple[object, int]:
+    """
+    Obtiene el tokenizador del modelo de embeddings y su longitud máxima.
+
+    Args:
+        embeddings: Instancia de HuggingFaceEmbeddings
+
+    Returns:
+        Tupla (tokenizador rápido, máximo de tokens por secuencia)
+    """
+    client = embeddings.client
+    return client.tokenizer, client.max_seq_length
+
+
+def measure_truncation(chunks: List[str], tokenizer, max_tokens: int) -> TruncationReport:
+    """
+    Mide cuántos tokens de cada chunk descarta el modelo por truncado.
+
+    Args:
+        chunks: Chunks de texto
+        tokenizer: Tokenizador del modelo de embeddings
+        max_tokens: Longitud máxima de secuencia del modelo
+
+    Returns:
+        Reporte con tokens totales y truncados
+    """
+    report = TruncationReport(chunks=len(chunks))
+    if not chunks:
+        return report
+
+    for ids in tokenizer(chunks, add_special_tokens=True)["input_ids"]:
+        report.total_tokens += len(ids)
+        if len(ids) > max_tokens:
+            report.truncated_chunks += 1
+            report.truncated_tokens += len(ids) - max_tokens
+    return report
+
+
+def _resolve_chunking(
+    embeddings: HuggingFaceEmbeddings,
+    length_mode: str,
+    chunk_size: int,
+    chunk_overlap: int
+) -> Tuple[int, int, object]:
+    """
+    Traduce el modo de chunking a (chunk_size, chunk_overlap, tokenizer).
+
+    En modo "tokens" el tamaño objetivo es la longitud máxima real del modelo
+    (menos los tokens especiales) y el solapamiento es DEFAULT_TOKEN_OVERLAP;
+    chunk_size y chunk_overlap en caracteres se ignoran.
+    """
+    if length_mode == "chars":
+        return chunk_size, chunk_overlap, None
+    if length_mode != "tokens":
+        raise ValueError(f"Modo de chunking no soportado: {length_mode}")
+
+    tokenizer, max_tokens = get_model_tokenizer(embeddings)
+    # [CLS] y [SEP] ocupan dos posiciones de la secuencia
+    token_size = max_tokens - 2
+    return token_size, min(DEFAULT_TOKEN_OVERLAP, token_size // 2), tokenizer
+
+
+def _estimate_model_bytes(embeddings: HuggingFaceEmbeddings) -> int:
+    """
+    Estima la memoria ocupada por los pesos de un modelo de embeddings.
+
+    Args:
+        embeddings: Instancia de HuggingFaceEmbeddings ya cargada
+
+    Returns:
+        Bytes aproximados de los parámetros del modelo (0 si no se pueden medir)
+    """
+    if hasattr(embeddings, "model_bytes"):
+        return embeddings.model_bytes
     try:
-        reader = PdfReader(pdf_buffer)
-        pages_text: List[str] = []
+        return sum(p.numel() * p.element_size() for p in embeddings.client.parameters())
+    except Exception:
+        return 0
 
-        for page in reader.pages:
-            try:
-                text = page.extract_text()
-                if text:
-                    pages_text.append(text)
-            except Exception:
-                # No logear el error para no exponer metadata del PDF
-                pages_text.append("")
 
-        full_text = "\n\n".join(pages_text)
-        logger.info(f"PDF procesado en memoria: {len(reader.pages)} páginas")
-        return full_text
+class EmbeddingModelRegistry:
+    """
+    Registro de modelos de embeddings compartido por todo el proceso.
+
+    Cada modelo se carga una sola vez por combinación de nombre y opciones
+    (dispositivo, normalización, backend) y se reutiliza entre subidas y sesiones.
+    Si la memoria estimada supera el presupuesto, se descargan los modelos
+    usados menos recientemente (LRU). Es seguro usarlo desde varios hilos.
+    """
+
+    def __init__(self, memory_budget_mb: int = EMBEDDINGS_MEMORY_BUDGET_MB):
+        self.memory_budget_bytes = memory_budget_mb * 1024 * 1024
+        self._models: "OrderedDict[Tuple, Tuple[HuggingFaceEmbeddings, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._loading_locks: Dict[Tuple, threading.Lock] = {}
+
+    @staticmethod
+    def _make_key(model_name: str, device: str, normalize: bool, backend: str) -> Tuple:
+        return (model_name, device, normalize, backend)
+
+    def get(
+        self,
+        model_name: str = DEFAULT_MODEL_NAME,
+        device: str = "cpu",
+        normalize: bool = True,
+        backend: str = EMBEDDINGS_BACKEND
+    ) -> HuggingFaceEmbeddings:
+        """
+        Devuelve el modelo de embeddings, cargándolo solo si no está en el registro.
+
+        Args:
+            model_name: Nombre del modelo de sentence-transformers
+            device: Dispositivo de inferencia ('cpu' o 'cuda')
+            normalize: Si True, normaliza los vectores (similaridad coseno)
+            backend: "torch", "onnx", "onnx-int8" o "service" (ver EMBEDDINGS_BACKEND)
+
+        Returns:
+            Instancia compartida de HuggingFaceEmbeddings (u OnnxEmbeddings / RemoteEmbeddings)
+        """
+        if backend not in EMBEDDINGS_BACKENDS:
+            raise ValueError(f"Backend de embeddings no soportado: {backend}")
+        key = self._make_key(model_name, device, normalize, backend)
+
+        with self._lock:
+            if key in self._models:
+                self._models.move_to_end(key)
+                return self._models[key][0]
+            loading_lock = self._loading_locks.setdefault(key, threading.Lock())
+
+        # Cargar fuera del lock global para no bloquear otros modelos;
+        # el lock por clave evita cargar dos veces el mismo modelo
+        with loading_lock:
+            with self._lock:
+                if key in self._models:
+                    self._models.move_to_end(key)
+                    return self._models[key][0]
+
+            logger.info(f"Cargando modelo de embeddings: {model_name} ({backend})")
+            start = time.perf_counter()
+            if backend == "torch":
+                embeddings = HuggingFaceEmbeddings(
+                    model_name=model_name,
+                    model_kwargs={'device': device},  # Cambiar a 'cuda' si tienes GPU
+                    encode_kwargs={'normalize_embeddings': normalize}  # Normalizar para mejor similaridad coseno
+                )
+            elif backend == "service":
+                # El modelo vive en el proceso del servicio; aquí solo hay un cliente HTTP
+                from src.embedding_service import RemoteEmbeddings
+                embeddings = RemoteEmbeddings(model_name)
+            else:
+                # ONNX Runtime solo en CPU; se importa aquí porque es una dependencia opcional
+                from src.onnx_embeddings import OnnxEmbeddings
+                embeddings = OnnxEmbeddings(model_name, quantize=backend == "onnx-int8", normalize=normalize)
+            size_bytes = _estimate_model_bytes(embeddings)
+            logger.info(
+                f"Modelo de embeddings cargado en {time.perf_counter() - start:.2f}s "
+                f"(~{size_bytes / 1024 / 1024:.0f} MB)"
+            )
+
+            with self._lock:
+                self._models[key] = (embeddings, size_bytes)
+                self._evict_over_budget(keep=key)
+                self._loading_locks.pop(key, None)
+
+        return embeddings
+
+    def _evict_over_budget(self, keep: Tuple):
+        """Descarga modelos LRU hasta respetar el presupuesto (requiere self._lock)."""
+        total = sum(size for _, size in self._models.values())
+        for key in list(self._models.keys()):
+            if total <= self.memory_budget_bytes:
+                break
+            if key == keep:
+                continue
+            _, size = self._models.pop(key)
+            total -= size
+            logger.info(f"Modelo de embeddings descargado del registro: {key[0]}")
+
+    def warmup(self, model_names: Iterable[str]):
+        """
+        Precarga modelos para que la primera subida no pague el tiempo de carga.
+
+        Args:
+            model_names: Nombres de modelos a precargar
+        """
+        for model_name in model_names:
+            self.get(model_name)
+
+    def clear(self):
+        """Descarga todos los modelos del registro."""
+        with self._lock:
+            self._models.clear()
+
+    def stats(self) -> Dict[str, object]:
+        """
+        Devuelve el estado del registro (modelos cargados y memoria estimada).
+        """
+        with self._lock:
+            return {
+                "models": [key[0] for key in self._models],
+                "memory_mb": sum(size for _, size in self._models.values()) / 1024 / 1024,
+                "budget_mb": self.memory_budget_bytes / 1024 / 1024,
+            }
+
+
+_embedding_registry = EmbeddingModelRegistry()
+
+
+def get_embedding_registry() -> EmbeddingModelRegistry:
+    """
+    Devuelve el registro de modelos de embeddings del proceso.
+    """
+    return _embedding_registry
+
+
+def warmup_embeddings(model_names: Optional[Iterable[str]] = None):
+    """
+    Precarga los modelos de embeddings (pensado para el arranque del servidor).
+
+    Args:
+        model_names: Modelos a precargar (por defecto, DEFAULT_MODEL_NAME)
+    """
+    _embedding_registry.warmup(model_names or [DEFAULT_MODEL_NAME])
+
+
+def _normalize_text(text: str) -> str:
+    """Normaliza un texto para la clave de caché (Unicode NFC y espacios colapsados)."""
+    return unicodedata.normalize("NFC", " ".join(text.split()))
+
+
+class EmbeddingCache:
+    """
+    Caché en memoria de embeddings direccionada por contenido.
+
+    La clave es el hash SHA-256 del modelo y del texto normalizado, así un
+    chunk idéntico (re-ingesta con otro solapamiento, PDF revisado, texto
+    repetido entre papers) no vuelve a pasar por el modelo. La memoria está
+    acotada y se descartan las entradas usadas menos recientemente (LRU).
+    """
+
+    # Coste aproximado por entrada además del vector (clave y estructura)
+    _ENTRY_OVERHEAD_BYTES = 200
+
+    def __init__(self, max_mb: int = EMBEDDING_CACHE_MB):
+        self.max_bytes = max_mb * 1024 * 1024
+        self._entries: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(namespace: str, text: str) -> str:
+        """
+        Clave de caché de un texto.
+
+        Args:
+            namespace: Identifica el modelo y sus opciones
+            text: Texto del chunk
+
+        Returns:
+            Hash SHA-256 (hexadecimal)
+        """
+        return hashlib.sha256(f"{namespace}\0{_normalize_text(text)}".encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is not None:
+                self._entries.move_to_end(key)
+            return vector
+
+    def put(self, key: str, vector: np.ndarray):
+        size = vector.nbytes + self._ENTRY_OVERHEAD_BYTES
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return
+            self._entries[key] = vector
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.nbytes + self._ENTRY_OVERHEAD_BYTES
+                self.evictions += 1
+
+    def record(self, hits: int = 0, disk_hits: int = 0, misses: int = 0):
+        """Actualiza los contadores de aciertos y fallos."""
+        with self._lock:
+            self.hits += hits
+            self.disk_hits += disk_hits
+            self.misses += misses
+
+    def clear(self):
+        """Vacía la caché (los contadores se conservan)."""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, object]:
+        """
+        Devuelve el estado de la caché (entradas, memoria y contadores).
+        """
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "memory_mb": self._bytes / 1024 / 1024,
+                "budget_mb": self.max_bytes / 1024 / 1024,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+            }
+
+
+class DiskEmbeddingStore:
+    """
+    Caché de embeddings en disco (SQLite) para el modo local con persist=True.
+    Guarda solo la clave (hash) y el vector, nunca el texto del chunk.
+    """
+
+    # Máximo de parámetros por consulta IN (límite de SQLite)
+    _QUERY_BATCH = 500
+
+    def __init__(self, path: str = EMBEDDING_CACHE_PATH):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)"
+            )
+            self._conn.commit()
+
+    def get_many(self, keys: List[str]) -> Dict[str, np.ndarray]:
+        """Vectores guardados para las claves dadas (las que no están se omiten)."""
+        found: Dict[str, np.ndarray] = {}
+        with self._lock:
+            for start in range(0, len(keys), self._QUERY_BATCH):
+                batch = keys[start:start + self._QUERY_BATCH]
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(batch))})",
+                    batch
+                )
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32)
+        return found
+
+    def put_many(self, vectors: Dict[str, np.ndarray]):
+        """Guarda vectores (float32) por clave."""
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                [(key, np.asarray(vector, dtype=np.float32).tobytes()) for key, vector in vectors.items()]
+            )
+            self._conn.commit()
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddings del registro con caché de chunks delante de embed_documents.
+
+    Solo se pasan al modelo los textos que no están en la caché en memoria
+    (ni en disco, si se configuró); los repetidos dentro de un mismo lote se
+    embeben una vez, ordenados por longitud para que cada lote tenga poco
+    relleno, y repartidos entre procesos si hay un pool (EMBEDDING_WORKERS).
+    Las queries usan su propia caché (query_cache), así una
+    pregunta repetida no vuelve a pasar por el modelo. El resto de atributos
+    (client, model_name...) se delegan en el HuggingFaceEmbeddings del registro.
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        cache: EmbeddingCache,
+        disk: Optional[DiskEmbeddingStore] = None,
+        device: str = "cpu",
+        normalize: bool = True,
+        query_cache: Optional[EmbeddingCache] = None,
+        pool: Optional[EmbeddingPool] = None,
+        backend: str = EMBEDDINGS_BACKEND
+    ):
+        self.model_name = model_name
+        self.cache = cache
+        self.disk = disk
+        self.query_cache = query_cache
+        self.pool = pool
+        self.device = device
+        self.normalize = normalize
+        self.backend = backend
+        self._namespace = f"{model_name}|{device}|{normalize}|{backend}"
+
+    @property
+    def embeddings(self) -> HuggingFaceEmbeddings:
+        """Modelo del registro (se resuelve en cada uso para respetar sus descargas LRU)."""
+        return _embedding_registry.get(self.model_name, self.device, self.normalize, self.backend)
+
+    def __getattr__(self, name: str):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        return getattr(self.embeddings, name)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """
+        Genera los embeddings de una lista de chunks usando la caché.
+
+        Args:
+            texts: Textos de los chunks
+
+        Returns:
+            Un vector por texto, en el mismo orden
+        """
+        keys = [EmbeddingCache.make_key(self._namespace, text) for text in texts]
+        resolved: Dict[str, np.ndarray] = {}
+        missing: Dict[str, str] = {}
+        for key, text in zip(keys, texts):
+            if key in resolved or key in missing:
+                continue
+            vector = self.cache.get(key)
+            if vector is not None:
+                resolved[key] = vector
+            else:
+                missing[key] = text
+
+        disk_hits = 0
+        if missing and self.disk is not None:
+            for key, vector in self.disk.get_many(list(missing)).items():
+                resolved[key] = vector
+                self.cache.put(key, vector)
+                del missing[key]
+                disk_hits += 1
+
+        if missing:
+            encoder = self.pool if self.pool is not None else self.embeddings
+            # Orden por longitud: lotes homogéneos (menos relleno) también en el pool y en ONNX
+            items = list(missing.items())
+            order = length_sorted_order([text for _, text in items])
+            computed = encoder.embed_documents([items[i][1] for i in order])
+            new = {items[i][0]: np.asarray(vector, dtype=np.float32) for i, vector in zip(order, computed)}
+            for key, vector in new.items():
+                self.cache.put(key, vector)
+            if self.disk is not None:
+                self.disk.put_many(new)
+            resolved.update(new)
+
+        self.cache.record(
+            hits=len(texts) - len(missing) - disk_hits, disk_hits=disk_hits, misses=len(missing)
+        )
+        return [resolved[key].tolist() for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        """
+        Genera el embedding de una query usando la caché de queries.
+
+        Args:
+            text: Texto de la query
+
+        Returns:
+            Vector de la query
+        """
+        if self.query_cache is None:
+            return self.embeddings.embed_query(text)
+
+        key = EmbeddingCache.make_key(self._namespace, text)
+        vector = self.query_cache.get(key)
+        if vector is not None:
+            self.query_cache.record(hits=1)
+            return vector.tolist()
+
+        vector = np.asarray(self.embeddings.embed_query(text), dtype=np.float32)
+        self.query_cache.put(key, vector)
+        self.query_cache.record(misses=1)
+        return vector.tolist()
+
+
+_embedding_cache = EmbeddingCache()
+_query_embedding_cache = EmbeddingCache(QUERY_EMBEDDING_CACHE_MB)
+_embedding_pools: Dict[str, EmbeddingPool] = {}
+_disk_embedding_stores: Dict[str, DiskEmbeddingStore] = {}
+_cached_embeddings: Dict[Tuple[str, Optional[str]], CachedEmbeddings] = {}
+_cached_embeddings_lock = threading.Lock()
+
+
+def get_embedding_cache() -> EmbeddingCache:
+    """
+    Devuelve la caché de embeddings de chunks del proceso (ver stats()).
+    """
+    return _embedding_cache
+
+
+def get_query_embedding_cache() -> EmbeddingCache:
+    """
+    Devuelve la caché de embeddings de queries del proceso (ver stats()).
+    """
+    return _query_embedding_cache
+
+
+def get_embedding_pool(model_name: str = DEFAULT_MODEL_NAME) -> Optional[EmbeddingPool]:
+    """
+    Devuelve el pool de procesos de embeddings del modelo
+    (None si EMBEDDING_WORKERS <= 1 o el backend no es "torch").
+    Los procesos se crean en el primer lote grande, no al llamar a esta función.
+
+    Args:
+        model_name: Nombre del modelo de sentence-transformers
+
+    Returns:
+        EmbeddingPool compartido por el proceso, o None
+    """
+    # El pool carga modelos de PyTorch; ONNX Runtime ya usa todos los núcleos
+    if EMBEDDING_WORKERS <= 1 or EMBEDDINGS_BACKEND != "torch":
+        return None
+    with _cached_embeddings_lock:
+        if model_name not in _embedding_pools:
+            _embedding_pools[model_name] = EmbeddingPool(
+                model_name,
+                fallback=lambda texts: _embedding_registry.get(model_name).embed_documents(texts)
+            )
+        return _embedding_pools[model_name]
+
+
+def shutdown_embedding_pools():
+    """Detiene los procesos de todos los pools de embeddings."""
+    with _cached_embeddings_lock:
+        pools = list(_embedding_pools.values())
+    for pool in pools:
+        pool.shutdown()
+
+
+def generate_embeddings(model_name: str = DEFAULT_MODEL_NAME, disk_cache: bool = False) -> CachedEmbeddings:
+    """
+    Obtiene el objeto de embeddings de Hugging Face desde el registro del proceso.
+    Este objeto se usa para generar vectores tanto de chunks como de queries.
+    El modelo se carga solo la primera vez; las llamadas siguientes lo reutilizan.
+    Los embeddings de chunks y de queries pasan por las cachés del proceso
+    (EMBEDDING_CACHE_MB y QUERY_EMBEDDING_CACHE_MB) y, con EMBEDDING_WORKERS > 1,
+    los chunks nuevos se reparten entre un pool de procesos.
+
+    Args:
+        model_name: Nombre del modelo de sentence-transformers
+        disk_cache: Si True, usa además la caché en disco (solo modo local persistido)
+
+    Returns:
+        Instancia compartida de CachedEmbeddings (misma interfaz que HuggingFaceEmbeddings)
+    """
+    pool = get_embedding_pool(model_name)
+    with _cached_embeddings_lock:
+        # La ruta de la caché en disco se lee en cada llamada (se puede cambiar, p. ej. en pruebas)
+        disk_path = EMBEDDING_CACHE_PATH if disk_cache else None
+        key = (model_name, disk_path)
+        if key not in _cached_embeddings:
+            disk = None
+            if disk_path:
+                disk = _disk_embedding_stores.get(disk_path)
+                if disk is None:
+                    disk = _disk_embedding_stores[disk_path] = DiskEmbeddingStore(disk_path)
+            _cached_embeddings[key] = CachedEmbeddings(
+                model_name, _embedding_cache, disk, query_cache=_query_embedding_cache, pool=pool
+            )
+        embeddings = _cached_embeddings[key]
+
+    # Cargar el modelo en el registro ahora (no en el primer embed), como antes de la caché
+    _embedding_registry.get(embeddings.model_name, embeddings.device, embeddings.normalize, embeddings.backend)
+    return embeddings
+
+
+@dataclass
+class IndexSpec:
+    """Tipo de índice FAISS elegido y sus parámetros (se guarda con el índice)."""
+    kind: str = "flat"
+    target_recall: float = 1.0
+    hnsw_m: int = 0
+    ef_construction: int = 0
+    ef_search: int = 0
+    nlist: int = 0
+    nprobe: int = 0
+    pq_m: int = 0
+
+    def to_dict(self) -> Dict[str, object]:
+        return dict(self.__dict__)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, object]) -> "IndexSpec":
+        return cls(**{key: value for key, value in data.items() if key in cls.__dataclass_fields__})
+
+
+@dataclass
+class IndexSettings:
+    """
+    Parámetros de ingesta con los que se construyó un índice persistido.
+    Si cambian, los vectores o los chunks guardados dejan de ser válidos.
+    (nprobe, efSearch o k son de consulta y se aplican sin reconstruir.)
+    """
+    model_name: str = DEFAULT_MODEL_NAME
+    chunk_size: int = DEFAULT_CHUNK_SIZE
+    chunk_overlap: int = DEFAULT_CHUNK_OVERLAP
+    length_mode: str = CHUNK_LENGTH_MODE
+    chunker: str = CHUNKER
+
+    # Campos que obligan a volver a dividir en chunks (no solo a re-embeber)
+    CHUNKING_FIELDS: ClassVar[Tuple[str, ...]] = ("chunk_size", "chunk_overlap", "length_mode", "chunker")
+
+    def diff(self, other: "IndexSettings") -> Dict[str, Tuple[object, object]]:
+        """Campos distintos entre dos configuraciones: {campo: (este, otro)}."""
+        return {
+            name: (getattr(self, name), getattr(other, name))
+            for name in self.__dataclass_fields__
+            if getattr(self, name) != getattr(other, name)
+        }
+
+
+class IndexCompatibilityError(ValueError):
+    """El índice guardado no es compatible con el modelo de embeddings o la configuración actual."""
+
+    def __init__(self, message: str, changes: Optional[Dict[str, Tuple[object, object]]] = None):
+        super().__init__(message)
+        self.changes = changes or {}
+
+
+def _recall_tier(target_recall: float) -> int:
+    """Escalón de exigencia (0-3) para recall ≤0.9, ≤0.95, ≤0.99 y superior."""
+    return sum(target_recall > threshold for threshold in (0.9, 0.95, 0.99))
+
+
+def _auto_ef_search(target_recall: float) -> int:
+    return (32, 64, 128, 256)[_recall_tier(target_recall)]
+
+
+def _auto_nprobe(nlist: int, target_recall: float) -> int:
+    return max(1, nlist // (32, 16, 8, 4)[_recall_tier(target_recall)])
+
+
+def _auto_nlist(n_chunks: int) -> int:
+    # ~4·√n listas, con al menos 39 vectores de entrenamiento por lista
+    return max(1, min(int(4 * math.sqrt(n_chunks)), n_chunks // 39))
+
 
-    except Exception as e:
-        raise Exception(f"Error procesando PDF desde memoria: {e}")
+def _auto_pq_m(dimension: int) -> int:
+    # Subcuantizadores de ~4 dimensiones (8 bits cada uno); debe dividir la dimensión
+    pq_m = max(1, dimension // 4)
+    while dimension % pq_m:
+        pq_m -= 1
+    return pq_m
 
 
-def split_into_chunks(
-    text: str,
-    chunk_size: int = DEFAULT_CHUNK_SIZE,
-    chunk_overlap: int = DEFAULT_CHUNK_OVERLAP
-) -> List[str]:
+def choose_index_spec(
+    n_chunks: int,
+    dimension: int,
+    kind: str = FAISS_INDEX_KIND,
+    target_recall: float = FAISS_TARGET_RECALL
+) -> IndexSpec:
     """
-    Divide el texto en fragmentos (chunks) con solapamiento.
-    Usa RecursiveCharacterTextSplitter para mantener coherencia semántica.
+    Elige el tipo de índice FAISS según el tamaño del corpus y el recall objetivo.
+
+    - flat: búsqueda exacta; hasta FAISS_FLAT_MAX_CHUNKS o si se pide recall ~1.0
+    - hnsw: grafo, recall alto y latencia baja; hasta FAISS_HNSW_MAX_CHUNKS
+    - ivf / ivfpq: listas invertidas para corpus mayores; PQ comprime los
+      vectores cuando el recall objetivo lo permite (≤ 0.9)
 
     Args:
-        text: Texto a dividir
-        chunk_size: Tamaño máximo de cada chunk en caracteres
-        chunk_overlap: Número de caracteres solapados entre chunks
+        n_chunks: Número de vectores a indexar
+        dimension: Dimensión de los embeddings
+        kind: Tipo forzado o "auto" (por defecto FAISS_INDEX_KIND)
+        target_recall: Recall objetivo (por defecto FAISS_TARGET_RECALL)
 
     Returns:
-        Lista de chunks de texto
+        IndexSpec con el tipo y sus parámetros
     """
-    if not text or not text.strip():
-        raise ValueError("El texto no puede estar vacío")
+    if kind == "auto":
+        if n_chunks <= FAISS_FLAT_MAX_CHUNKS or target_recall >= 0.999:
+            kind = "flat"
+        elif n_chunks <= FAISS_HNSW_MAX_CHUNKS:
+            kind = "hnsw"
+        else:
+            kind = "ivf" if target_recall > 0.9 else "ivfpq"
+
+    if kind not in ("flat", "hnsw", "ivf", "ivfpq"):
+        raise ValueError(f"Tipo de índice FAISS desconocido: {kind}")
+
+    spec = IndexSpec(kind=kind, target_recall=1.0 if kind == "flat" else target_recall)
+    if kind == "hnsw":
+        spec.hnsw_m = FAISS_HNSW_M
+        spec.ef_construction = FAISS_HNSW_EF_CONSTRUCTION
+        spec.ef_search = FAISS_HNSW_EF_SEARCH or _auto_ef_search(target_recall)
+    elif kind in ("ivf", "ivfpq"):
+        spec.nlist = FAISS_IVF_NLIST or _auto_nlist(n_chunks)
+        spec.nprobe = FAISS_IVF_NPROBE or _auto_nprobe(spec.nlist, target_recall)
+        if kind == "ivfpq":
+            spec.pq_m = FAISS_PQ_M or _auto_pq_m(dimension)
+    return spec
+
+
+def _create_faiss_index(spec: IndexSpec, dimension: int) -> faiss.Index:
+    """Crea un índice FAISS vacío de producto interno según el IndexSpec."""
+    if spec.kind == "hnsw":
+        index = faiss.IndexHNSWFlat(dimension, spec.hnsw_m, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = spec.ef_construction
+    elif spec.kind in ("ivf", "ivfpq"):
+        quantizer = faiss.IndexFlatIP(dimension)
+        if spec.kind == "ivf":
+            index = faiss.IndexIVFFlat(quantizer, dimension, spec.nlist, faiss.METRIC_INNER_PRODUCT)
+        else:
+            index = faiss.IndexIVFPQ(quantizer, dimension, spec.nlist, spec.pq_m, 8, faiss.METRIC_INNER_PRODUCT)
+    else:
+        index = faiss.IndexFlatIP(dimension)
+    apply_search_params(index, spec)
+    return index
 
-    splitter = RecursiveCharacterTextSplitter(
-        chunk_size=chunk_size,
-        chunk_overlap=chunk_overlap,
-        separators=["\n\n", "\n", ". ", ".", "?", "!", ",", " ", ""],
-        length_function=len,
-    )
 
-    chunks = splitter.split_text(text)
-    logger.info(f"Texto dividido en {len(chunks)} chunks")
-    return chunks
+def apply_search_params(index: faiss.Index, spec: IndexSpec):
+    """Aplica los parámetros de búsqueda (efSearch, nprobe) del IndexSpec al índice."""
+    if spec.kind == "hnsw":
+        index.hnsw.efSearch = spec.ef_search
+    elif spec.kind in ("ivf", "ivfpq"):
+        faiss.extract_index_ivf(index).nprobe = spec.nprobe
 
 
-def generate_embeddings(model_name: str = DEFAULT_MODEL_NAME) -> HuggingFaceEmbeddings:
-    """
-    Crea el objeto de embeddings de Hugging Face.
-    Este objeto se usa para generar vectores tanto de chunks como de queries.
+def _reconstruct_vectors(index: faiss.Index, spec: IndexSpec) -> np.ndarray:
+    """Recupera todos los vectores de un índice (aproximados si usa PQ)."""
+    if spec.kind in ("ivf", "ivfpq"):
+        ivf = faiss.extract_index_ivf(index)
+        if ivf.direct_map.type == faiss.DirectMap.NoMap:
+            ivf.make_direct_map()
+    return index.reconstruct_n(0, index.ntotal)
 
-    Args:
-        model_name: Nombre del modelo de sentence-transformers
 
-    Returns:
-        Instancia de HuggingFaceEmbeddings
+class VectorIndex:
     """
-    logger.info(f"Cargando modelo de embeddings: {model_name}")
-    embeddings = HuggingFaceEmbeddings(
-        model_name=model_name,
-        model_kwargs={'device': 'cpu'},  # Cambiar a 'cuda' si tienes GPU
-        encode_kwargs={'normalize_embeddings': True}  # Normalizar para mejor similaridad coseno
-    )
-    logger.info("Modelo de embeddings cargado")
-    return embeddings
+    Motor de búsqueda nativo sobre FAISS, sin el wrapper de LangChain.
 
+    Guarda los vectores normalizados en un IndexFlatIP, de modo que el score
+    es la similitud coseno (1.0 = idéntico, mayor = más relevante). Las filas
+    del índice son los ids del ChunkStore: una búsqueda devuelve texto y score
+    directamente, sin construir un Document por resultado.
 
-def build_faiss_index(chunks: List[str], embeddings: HuggingFaceEmbeddings) -> FAISS:
+    Los vectores se añaden a un índice exacto (flat); optimize() lo reconstruye
+    como HNSW o IVF cuando el corpus crece lo suficiente.
+    """
+
+    def __init__(
+        self,
+        embeddings: HuggingFaceEmbeddings,
+        store: Optional[ChunkStore] = None,
+        index: Optional[faiss.Index] = None,
+        spec: Optional[IndexSpec] = None
+    ):
+        self.embeddings = embeddings
+        self.store = store if store is not None else ChunkStore()
+        self.index = index
+        self.spec = spec if spec is not None else IndexSpec()
+        # Parámetros de ingesta (solo en índices persistidos, ver IndexSettings)
+        self.settings: Optional[IndexSettings] = None
+        self.created_at: Optional[str] = None
+        # True si el índice FAISS está mapeado desde disco (no admite cambios)
+        self.mapped = False
+
+    def _make_writable(self):
+        """Copia a memoria un índice abierto con mmap antes de modificarlo."""
+        if self.mapped:
+            self.index = faiss.deserialize_index(faiss.serialize_index(self.index))
+            self.mapped = False
+
+    def __len__(self) -> int:
+        return self.index.ntotal if self.index is not None else 0
+
+    def add(self, vectors) -> None:
+        """
+        Añade los embeddings de los siguientes chunks del almacén.
+        Los vectores deben llegar en el mismo orden que los ids del ChunkStore.
+
+        Args:
+            vectors: Matriz (n, dim) o lista de embeddings
+        """
+        matrix = np.ascontiguousarray(vectors, dtype=np.float32)
+        if matrix.size == 0:
+            return
+        self._make_writable()
+        faiss.normalize_L2(matrix)
+        if self.index is None:
+            self.index = _create_faiss_index(self.spec, matrix.shape[1])
+        self.index.add(matrix)
+
+    def optimize(
+        self,
+        kind: str = FAISS_INDEX_KIND,
+        target_recall: float = FAISS_TARGET_RECALL
+    ) -> IndexSpec:
+        """
+        Reconstruye el índice con el tipo adecuado al número de chunks.
+        Solo actúa si el índice actual es flat y la elección es otra.
+
+        Args:
+            kind: Tipo forzado o "auto"
+            target_recall: Recall objetivo
+
+        Returns:
+            IndexSpec vigente tras la optimización
+        """
+        if self.index is None or self.spec.kind != "flat":
+            return self.spec
+
+        spec = choose_index_spec(self.index.ntotal, self.index.d, kind, target_recall)
+        if spec.kind == "flat":
+            return self.spec
+
+        self._make_writable()
+        start = time.perf_counter()
+        vectors = _reconstruct_vectors(self.index, self.spec)
+        index = _create_faiss_index(spec, self.index.d)
+        if not index.is_trained:
+            index.train(vectors)
+        index.add(vectors)
+        self.index, self.spec = index, spec
+        logger.info(
+            f"Índice FAISS reconstruido como {spec.kind} con {index.ntotal} vectores "
+            f"en {time.perf_counter() - start:.1f}s"
+        )
+        return spec
+
+    def delete_document(self, doc_id: str) -> int:
+        """
+        Borra un documento del índice marcando sus chunks como tombstones.
+        Las búsquedas los descartan; compact() libera su espacio.
+
+        Args:
+            doc_id: Identificador del documento (hash SHA-256 del PDF)
+
+        Returns:
+            Número de chunks borrados
+        """
+        return self.store.delete_document(doc_id)
+
+    def compact(self) -> int:
+        """
+        Reconstruye almacén e índice sin los chunks borrados.
+        El tipo de índice se vuelve a elegir según el nuevo número de chunks.
+
+        Returns:
+            Número de chunks eliminados
+        """
+        removed = len(self.store.deleted)
+        if not removed:
+            return 0
+
+        self._make_writable()
+        store, kept = self.store.compact()
+        vectors = _reconstruct_vectors(self.index, self.spec)
+        vectors = vectors[np.frombuffer(kept, dtype=np.int64)] if len(kept) else vectors[:0]
+
+        dimension, target_recall = self.index.d, self.spec.target_recall
+        self.store, self.spec = store, IndexSpec()
+        self.index = _create_faiss_index(self.spec, dimension)
+        self.add(vectors)
+        self.optimize(target_recall=target_recall if target_recall < 1.0 else FAISS_TARGET_RECALL)
+        logger.info(f"Índice compactado: {removed} chunks borrados eliminados, {len(store)} conservados")
+        return removed
+
+    def search_by_vector(self, vector, k: int = 4) -> List[Tuple[int, float]]:
+        """
+        Busca los k chunks más similares a un embedding.
+
+        Args:
+            vector: Embedding de la query
+            k: Número de resultados
+
+        Returns:
+            Lista de (id del chunk, similitud coseno), de mayor a menor
+        """
+        if self.index is None or self.index.ntotal == 0:
+            return []
+        query = np.array(vector, dtype=np.float32).reshape(1, -1)
+        faiss.normalize_L2(query)
+
+        # Con tombstones se piden más resultados y se descartan los borrados
+        deleted = self.store.deleted
+        fetch = min(k * 2 if deleted else k, self.index.ntotal)
+        while True:
+            scores, ids = self.index.search(query, fetch)
+            hits = [
+                (int(i), float(score)) for i, score in zip(ids[0], scores[0])
+                if i >= 0 and int(i) not in deleted
+            ]
+            if len(hits) >= k or fetch >= min(self.index.ntotal, k + len(deleted)):
+                return hits[:k]
+            fetch = min(fetch * 4, self.index.ntotal)
+
+    def search(self, query: str, k: int = 4) -> List[Tuple[str, float]]:
+        """
+        Busca los k chunks más similares a una query.
+
+        Args:
+            query: Texto de la búsqueda
+            k: Número de resultados
+
+        Returns:
+            Lista de (chunk_text, similitud coseno), de mayor a menor
+        """
+        hits = self.search_by_vector(self.embeddings.embed_query(query), k)
+        return [(self.store.get_text(chunk_id), score) for chunk_id, score in hits]
+
+    def similarity_search_with_score(self, query: str, k: int = 4) -> List[Tuple[Document, float]]:
+        """
+        Misma interfaz que FAISS.similarity_search_with_score (compatibilidad).
+        El score es similitud coseno: mayor = más relevante.
+        """
+        hits = self.search_by_vector(self.embeddings.embed_query(query), k)
+        return [(self.store.document(chunk_id), score) for chunk_id, score in hits]
+
+
+def build_faiss_index(chunks: List[str], embeddings: HuggingFaceEmbeddings) -> VectorIndex:
     """
     Construye un índice FAISS a partir de una lista de chunks.
-    FAISS genera automáticamente los embeddings usando el objeto embeddings.
 
     Args:
         chunks: Lista de textos (chunks del documento)
         embeddings: Objeto de embeddings de Hugging Face
 
     Returns:
-        Índice FAISS listo para búsquedas
+        Índice listo para búsquedas (similitud coseno)
     """
     if not chunks:
         raise ValueError("La lista de chunks no puede estar vacía")
 
     logger.info(f"Construyendo índice FAISS con {len(chunks)} chunks")
 
-    # Crear documentos de LangChain (FAISS los necesita en este formato)
-    documents = [Document(page_content=chunk) for chunk in chunks]
+    db = VectorIndex(embeddings)
+    for chunk in chunks:
+        db.store.add_text(chunk)
+    db.add(embeddings.embed_documents(chunks))
+    db.optimize()
+
+    logger.info(f"Índice FAISS ({db.spec.kind}) construido exitosamente")
+    return db
+
+
+def iter_embedded_batches(
+    chunks: Iterable[str],
+    embeddings: HuggingFaceEmbeddings,
+    batch_size: int = EMBEDDING_BATCH_SIZE
+) -> Iterator[Tuple[List[str], List[List[float]]]]:
+    """
+    Agrupa chunks en lotes y genera sus embeddings lote a lote.
+
+    Args:
+        chunks: Iterable de chunks de texto
+        embeddings: Objeto de embeddings de Hugging Face
+        batch_size: Número de chunks por lote
+
+    Yields:
+        Tuplas (textos del lote, vectores del lote)
+    """
+    batch: List[str] = []
+    for chunk in chunks:
+        batch.append(chunk)
+        if len(batch) >= batch_size:
+            yield batch, embeddings.embed_documents(batch)
+            batch = []
+    if batch:
+        yield batch, embeddings.embed_documents(batch)
+
+
+def build_faiss_index_streaming(
+    chunks: Iterable[str],
+    embeddings: HuggingFaceEmbeddings,
+    batch_size: int = EMBEDDING_BATCH_SIZE
+) -> VectorIndex:
+    """
+    Construye un índice FAISS añadiendo los chunks por lotes a medida que llegan.
+    La memoria pico queda acotada por un lote en lugar de por el documento entero.
+
+    Args:
+        chunks: Iterable de chunks (puede ser un generador)
+        embeddings: Objeto de embeddings de Hugging Face
+        batch_size: Número de chunks por lote
 
-    # FAISS.from_documents genera embeddings automáticamente y construye el índice
-    db = FAISS.from_documents(documents=documents, embedding=embeddings)
+    Returns:
+        Índice listo para búsquedas (similitud coseno)
+    """
+    db = VectorIndex(embeddings)
+
+    def register(chunk_stream: Iterable[str]) -> Iterator[str]:
+        for chunk in chunk_stream:
+            db.store.add_text(chunk)
+            yield chunk
+
+    for _, vectors in iter_embedded_batches(register(chunks), embeddings, batch_size):
+        db.add(vectors)
 
-    logger.info("Índice FAISS construido exitosamente")
+    if len(db) == 0:
+        raise ValueError("La lista de chunks no puede estar vacía")
+    db.optimize()
+
+    logger.info(f"Índice FAISS ({db.spec.kind}) construido de forma incremental con {len(db)} chunks")
     return db
 
 
-def save_index(db: FAISS, chunks: List[str], index_path: str = INDEX_PATH):
+class ProgressiveIndex:
+    """
+    Índice FAISS que se construye en segundo plano y admite búsquedas parciales.
+
+    Se publica en cuanto están indexadas las primeras páginas; desde ese
+    momento similarity_search_with_score responde con lo indexado hasta ahora
+    mientras el resto del documento se sigue añadiendo. Expone el progreso
+    (páginas indexadas sobre el total) para mostrarlo en la interfaz.
+    El texto de los chunks vive en un ChunkStore cuyos ids son las filas de FAISS.
+    """
+
+    def __init__(self, embeddings: HuggingFaceEmbeddings, total_pages: int, store: Optional[ChunkStore] = None):
+        self.embeddings = embeddings
+        self.total_pages = total_pages
+        self.store = store if store is not None else ChunkStore()
+        self.pages_indexed = 0
+        self.chunks_indexed = 0
+        self.truncation = TruncationReport()
+        self.error: Optional[BaseException] = None
+        self._db: Optional[VectorIndex] = None
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._done = threading.Event()
+        self._done_callbacks: List[Callable[["ProgressiveIndex"], None]] = []
+
+    @property
+    def coverage(self) -> float:
+        """Fracción del documento indexada (0.0 a 1.0)."""
+        if self.is_complete:
+            return 1.0
+        return self.pages_indexed / self.total_pages if self.total_pages else 0.0
+
+    @property
+    def is_complete(self) -> bool:
+        return self._done.is_set() and self.error is None
+
+    @property
+    def is_building(self) -> bool:
+        return not self._done.is_set()
+
+    @property
+    def db(self) -> Optional[VectorIndex]:
+        """Índice subyacente (None si aún no se publicó)."""
+        return self._db
+
+    def wait_until_ready(self, timeout: Optional[float] = None) -> bool:
+        """Espera a que haya un índice parcial publicado (o a que termine)."""
+        return self._ready.wait(timeout)
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Espera a que termine la construcción del índice."""
+        return self._done.wait(timeout)
+
+    def add_batch(self, vectors: List[List[float]], pages_indexed: int):
+        """
+        Añade los embeddings de los siguientes chunks del almacén y actualiza el progreso.
+        Los vectores deben llegar en el mismo orden que los ids del ChunkStore.
+
+        Args:
+            vectors: Embeddings de los chunks del lote
+            pages_indexed: Páginas completamente indexadas tras este lote
+        """
+        with self._lock:
+            if self._db is None:
+                self._db = VectorIndex(self.embeddings, self.store)
+            self._db.add(vectors)
+            self.chunks_indexed += len(vectors)
+            self.pages_indexed = pages_indexed
+
+    def publish(self):
+        """Marca el índice parcial como disponible para búsquedas."""
+        self._ready.set()
+
+    def add_done_callback(self, callback: Callable[["ProgressiveIndex"], None]):
+        """
+        Registra una función que se llama con el índice al terminar la construcción.
+        Si ya terminó, se llama inmediatamente.
+        """
+        with self._lock:
+            if not self._done.is_set():
+                self._done_callbacks.append(callback)
+                return
+        callback(self)
+
+    def finish(self, error: Optional[BaseException] = None):
+        """Marca el final de la construcción (con o sin error)."""
+        self.error = error
+        if error is None:
+            self.pages_indexed = self.total_pages
+        with self._lock:
+            self._ready.set()
+            self._done.set()
+            callbacks, self._done_callbacks = self._done_callbacks, []
+        for callback in callbacks:
+            try:
+                callback(self)
+            except Exception as e:
+                logger.warning(f"Error en callback de fin de indexado: {e}")
+
+    def search(self, query: str, k: int = 4) -> List[Tuple[str, float]]:
+        """
+        Busca los k chunks más similares entre los indexados hasta ahora.
+
+        Returns:
+            Lista de (chunk_text, similitud coseno), de mayor a menor
+        """
+        # El embedding de la query se calcula fuera del lock para no frenar la ingesta
+        vector = self.embeddings.embed_query(query)
+        with self._lock:
+            if self._db is None:
+                return []
+            hits = self._db.search_by_vector(vector, k)
+        return [(self.store.get_text(chunk_id), score) for chunk_id, score in hits]
+
+    def similarity_search_with_score(self, query: str, k: int = 4) -> List[Tuple[Document, float]]:
+        """
+        Misma interfaz que FAISS.similarity_search_with_score (compatibilidad).
+        El score es similitud coseno: mayor = más relevante.
+        """
+        vector = self.embeddings.embed_query(query)
+        with self._lock:
+            if self._db is None:
+                return []
+            hits = self._db.search_by_vector(vector, k)
+        return [(self.store.document(chunk_id), score) for chunk_id, score in hits]
+
+
+def _build_progressively(
+    index: ProgressiveIndex,
+    pages: Iterable[str],
+    chunk_size: int,
+    chunk_overlap: int,
+    batch_size: int,
+    first_pages: int,
+    tokenizer=None
+):
+    """
+    Construye el índice lote a lote y lo publica al cubrir las primeras páginas.
+    Se ejecuta en un hilo de fondo; los errores quedan registrados en el índice.
+    """
+    pages_read = 0
+
+    # Tokenizador del modelo para medir los tokens que se pierden por truncado
+    # (sobre todo en modo "chars", donde los chunks pueden superar la longitud máxima)
+    try:
+        model_tokenizer, max_tokens = get_model_tokenizer(index.embeddings)
+    except Exception:
+        model_tokenizer, max_tokens = None, 0
+
+    def embed(batch_ids: List[int]) -> List[List[float]]:
+        texts = [index.store.get_text(chunk_id) for chunk_id in batch_ids]
+        if model_tokenizer is not None:
+            index.truncation.add(measure_truncation(texts, model_tokenizer, max_tokens))
+        return index.embeddings.embed_documents(texts)
+
+    def count(page_stream: Iterable[str]) -> Iterator[str]:
+        nonlocal pages_read
+        for page in page_stream:
+            pages_read += 1
+            yield page
+
+    try:
+        batch: List[int] = []
+        for chunk_id in iter_store_chunks(count(pages), index.store, chunk_size, chunk_overlap, tokenizer):
+            batch.append(chunk_id)
+            # Antes de publicar, vaciar el lote en cuanto se alcanzan las primeras páginas
+            early_flush = not index.wait_until_ready(0) and pages_read > first_pages
+            if len(batch) >= batch_size or early_flush:
+                # La última página leída puede seguir en la ventana del chunker
+                index.add_batch(embed(batch), max(0, pages_read - 1))
+                batch = []
+                if pages_read > first_pages:
+                    index.publish()
+        if batch:
+            index.add_batch(embed(batch), pages_read)
+
+        if index.chunks_indexed == 0:
+            raise ValueError("La lista de chunks no puede estar vacía")
+        index.finish()
+        logger.info(
+            f"Índice progresivo completado con {index.chunks_indexed} chunks "
+            f"({index.store.memory_bytes() / 1024:.0f} KB de texto y offsets, "
+            f"{index.truncation.truncated_ratio:.1%} de tokens truncados por el modelo, "
+            f"{_embedding_cache.stats()['hit_rate']:.0%} de aciertos en la caché de embeddings)"
+        )
+    except BaseException as e:
+        logger.warning("Error construyendo el índice progresivo")
+        index.finish(error=e)
+
+
+def save_index(db: VectorIndex, index_path: str = INDEX_PATH):
     """
-    Guarda el índice FAISS y los chunks originales en disco.
+    Guarda el índice en disco en un formato versionado, sin pickle:
+
+    - index.faiss: índice FAISS (faiss.write_index)
+    - text.bin: texto de los documentos (UTF-8)
+    - chunk_*.npy / page_*.npy: offsets de chunks y páginas
+    - manifest.json: versión del formato, modelo y dimensión de los embeddings,
+      parámetros de chunking, tipo de índice, documentos (hash, fecha) y fechas
+
+    El manifest se escribe al final: un índice sin manifest está incompleto.
 
     Args:
-        db: Índice FAISS a guardar
-        chunks: Lista de chunks originales (para referencia)
-        index_path: Ruta donde guardar el índice
+        db: Índice a guardar
+        index_path: Directorio donde guardar el índice
     """
-    os.makedirs(os.path.dirname(index_path), exist_ok=True)
+    os.makedirs(index_path, exist_ok=True)
+
+    _write_atomic(
+        os.path.join(index_path, "index.faiss"),
+        lambda f: f.write(faiss.serialize_index(db.index).tobytes())
+    )
+    db.created_at = db.created_at or _utc_now()
+    settings = db.settings
+    manifest = {
+        "format": INDEX_FORMAT,
+        "version": INDEX_FORMAT_VERSION,
+        "created_at": db.created_at,
+        "updated_at": _utc_now(),
+        "embeddings": {
+            "model": settings.model_name if settings else getattr(db.embeddings, "model_name", None),
+            "dimension": db.index.d,
+            # Informativo: los backends producen vectores compatibles entre sí
+            "backend": getattr(db.embeddings, "backend", "torch"),
+            "normalized": True,
+            "metric": "inner_product",
+        },
+        "chunking": (
+            {name: getattr(settings, name) for name in IndexSettings.CHUNKING_FIELDS}
+            if settings else None
+        ),
+        "index": db.spec.to_dict(),
+        "store": db.store.save(index_path),
+    }
+    _write_atomic(
+        os.path.join(index_path, MANIFEST_FILE),
+        lambda f: f.write(json.dumps(manifest, indent=2).encode("utf-8"))
+    )
+    logger.info(f"Índice FAISS ({db.spec.kind}) guardado en: {index_path}")
+
 
-    # Guardar índice FAISS
-    db.save_local(index_path)
-    logger.info(f"Índice FAISS guardado en: {index_path}")
+def _convert_langchain_index(db: FAISS, embeddings: HuggingFaceEmbeddings) -> VectorIndex:
+    """Convierte un índice guardado con FAISS.save_local (IndexFlatL2) al motor nativo."""
+    store = ChunkStore()
+    for row in range(db.index.ntotal):
+        store.add_text(db.docstore.search(db.index_to_docstore_id[row]).page_content)
 
-    # Guardar metadata (chunks originales) por si necesitamos reconstruir
-    metadata_path = index_path.replace("faiss_index", "chunks_metadata.pkl")
-    with open(metadata_path, "wb") as f:
-        pickle.dump(chunks, f)
-    logger.info(f"Metadata guardada")
+    converted = VectorIndex(embeddings, store)
+    converted.add(db.index.reconstruct_n(0, db.index.ntotal))
+    return converted
 
 
-def load_index(index_path: str = INDEX_PATH, embeddings: Optional[HuggingFaceEmbeddings] = None) -> FAISS:
+def _read_faiss_index(path: str, use_mmap: bool) -> Tuple[faiss.Index, bool]:
+    """Lee un índice FAISS, mapeado en memoria si es posible. Devuelve (índice, mapeado)."""
+    if use_mmap:
+        try:
+            return faiss.read_index(path, faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_READ_ONLY), True
+        except (AttributeError, RuntimeError):
+            logger.debug("FAISS no admite mmap para este índice, leyéndolo completo")
+    return faiss.read_index(path), False
+
+
+def _embedding_dimension(embeddings: HuggingFaceEmbeddings) -> Optional[int]:
+    """Dimensión de los vectores del modelo (None si no se puede saber sin embeber)."""
+    client = getattr(embeddings, "client", None)
+    # sentence-transformers renombró get_sentence_embedding_dimension en versiones recientes
+    for method in ("get_embedding_dimension", "get_sentence_embedding_dimension"):
+        get_dimension = getattr(client, method, None)
+        if get_dimension is not None:
+            return get_dimension()
+    return None
+
+
+def _read_manifest(index_path: str) -> Optional[Dict[str, object]]:
+    """Lee y valida el manifest de un índice (None si es un índice antiguo de LangChain)."""
+    manifest_path = os.path.join(index_path, MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        if not os.path.exists(os.path.join(index_path, "index.pkl")):
+            raise FileNotFoundError(f"Índice incompleto (sin {MANIFEST_FILE}) en: {index_path}")
+        return None
+
+    with open(manifest_path, encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("format") != INDEX_FORMAT or manifest.get("version", 0) > INDEX_FORMAT_VERSION:
+        raise IndexCompatibilityError(
+            f"Formato de índice no soportado: {manifest.get('format')} v{manifest.get('version')}",
+            {"version": (manifest.get("version"), INDEX_FORMAT_VERSION)}
+        )
+    return manifest
+
+
+def _manifest_settings(manifest: Dict[str, object]) -> Optional[IndexSettings]:
+    """Parámetros de ingesta guardados en el manifest (None si no constan)."""
+    model_name = (manifest.get("embeddings") or {}).get("model")
+    if not model_name or not manifest.get("chunking"):
+        return None
+    return IndexSettings(model_name=model_name, **manifest["chunking"])
+
+
+def _check_embeddings(manifest: Dict[str, object], embeddings: HuggingFaceEmbeddings):
+    """Comprueba que el modelo de embeddings es el mismo con el que se construyó el índice."""
+    stored = manifest.get("embeddings") or {}
+    changes = {}
+
+    model_name = getattr(embeddings, "model_name", None)
+    if stored.get("model") and model_name and stored["model"] != model_name:
+        changes["model_name"] = (stored["model"], model_name)
+    dimension = _embedding_dimension(embeddings)
+    if dimension is not None and dimension != stored.get("dimension"):
+        changes["dimension"] = (stored.get("dimension"), dimension)
+
+    if changes:
+        raise IndexCompatibilityError(
+            "El índice se construyó con otro modelo de embeddings: "
+            + ", ".join(f"{name} {old} → {new}" for name, (old, new) in changes.items()),
+            changes
+        )
+
+
+def load_index(
+    index_path: str = INDEX_PATH,
+    embeddings: Optional[HuggingFaceEmbeddings] = None,
+    use_mmap: bool = True,
+    check_compatibility: bool = True
+) -> VectorIndex:
     """
     Carga un índice FAISS previamente guardado desde disco.
 
+    Con use_mmap el índice, el texto y los offsets se mapean en memoria: la
+    carga tarda milisegundos y solo se leen de disco los chunks consultados.
+    Los índices guardados por versiones anteriores (LangChain) se convierten al cargarlos.
+
     Args:
         index_path: Ruta del índice guardado
-        embeddings: Objeto de embeddings (si no se provee, se crea uno nuevo)
+        embeddings: Objeto de embeddings (si no se provee, se crea el del manifest)
+        use_mmap: Si True, mapea los ficheros en lugar de leerlos
+        check_compatibility: Si True, exige el mismo modelo y dimensión que el manifest
 
     Returns:
-        Índice FAISS cargado
+        Índice cargado
 
     Raises:
         FileNotFoundError: Si el índice no existe
+        ValueError: Si el formato o la versión del índice no son compatibles
+        IndexCompatibilityError: Si el modelo de embeddings no coincide con el del índice
     """
     if not os.path.exists(index_path):
         raise FileNotFoundError(f"No se encontró índice en: {index_path}")
 
+    manifest = _read_manifest(index_path)
+    settings = _manifest_settings(manifest) if manifest else None
     if embeddings is None:
-        embeddings = generate_embeddings()
+        embeddings = generate_embeddings(settings.model_name if settings else DEFAULT_MODEL_NAME)
 
     logger.info("Cargando índice FAISS desde disco")
-    db = FAISS.load_local(
-        index_path,
-        embeddings,
-        allow_dangerous_deserialization=True
+    if manifest is None:
+        # Formato antiguo de LangChain (pickle): solo se lee para convertirlo
+        logger.info("Índice en formato LangChain, convirtiendo a similitud coseno")
+        legacy = FAISS.load_local(index_path, embeddings, allow_dangerous_deserialization=True)
+        return _convert_langchain_index(legacy, embeddings)
+
+    if check_compatibility:
+        _check_embeddings(manifest, embeddings)
+
+    start = time.perf_counter()
+    index, mapped = _read_faiss_index(os.path.join(index_path, "index.faiss"), use_mmap)
+    store = ChunkStore.load(index_path, manifest["store"], use_mmap)
+    if index.ntotal != len(store):
+        raise ValueError(f"Índice y almacén de chunks no coinciden en: {index_path}")
+
+    # Parámetros de búsqueda guardados; FAISS_IVF_NPROBE / FAISS_HNSW_EF_SEARCH los sustituyen
+    spec = IndexSpec.from_dict(manifest.get("index", {}))
+    spec.nprobe = FAISS_IVF_NPROBE or spec.nprobe
+    spec.ef_search = FAISS_HNSW_EF_SEARCH or spec.ef_search
+    apply_search_params(index, spec)
+
+    db = VectorIndex(embeddings, store, index, spec)
+    db.mapped = mapped
+    db.settings = settings
+    db.created_at = manifest.get("created_at")
+    logger.info(
+        f"Índice FAISS ({spec.kind}, {len(store)} chunks) cargado en "
+        f"{(time.perf_counter() - start) * 1000:.0f}ms{' con mmap' if mapped else ''}"
+    )
+    return db
+
+
+def _embed_store(db: VectorIndex, batch_size: int = EMBEDDING_BATCH_SIZE):
+    """Genera de nuevo los vectores de todos los chunks del almacén (sin releer PDFs)."""
+    db.index, db.spec, db.mapped = None, IndexSpec(), False
+    chunk_texts = (db.store.get_text(chunk_id) for chunk_id in range(len(db.store)))
+    for _, vectors in iter_embedded_batches(chunk_texts, db.embeddings, batch_size):
+        db.add(vectors)
+    db.optimize()
+
+
+def _rechunk_store(store: ChunkStore, chunk_size: int, chunk_overlap: int, tokenizer=None) -> ChunkStore:
+    """
+    Vuelve a dividir en chunks el texto de las páginas guardadas en el almacén.
+    Los chunks sin documento registrado (índices antiguos) se conservan tal cual.
+    """
+    rechunked = ChunkStore()
+    for doc_id, span, removed in store._segments():
+        if removed:
+            continue
+        if doc_id is None:
+            for chunk_id in range(span.first_chunk, span.end_chunk):
+                rechunked.add_text(store.get_text(chunk_id))
+            continue
+
+        mark = rechunked.mark()
+        pages = (store.page_text(page) for page in range(span.first_page, span.end_page))
+        for _ in iter_store_chunks(pages, rechunked, chunk_size, chunk_overlap, tokenizer):
+            pass
+        rechunked.register_document(doc_id, span.name, mark, span.indexed_at)
+    return rechunked
+
+
+def open_index(
+    index_path: str = INDEX_PATH,
+    settings: Optional[IndexSettings] = None,
+    use_mmap: bool = True
+) -> VectorIndex:
+    """
+    Abre un índice persistido comprobando que sigue siendo válido para `settings`.
+
+    - Misma configuración de ingesta: se reutiliza tal cual (con mmap, sin
+      reconstruir); los parámetros de consulta (nprobe, efSearch) se aplican al cargar.
+    - Otro modelo de embeddings: se vuelven a generar los vectores a partir
+      del texto guardado, sin releer ni volver a dividir los PDFs.
+    - Otro chunking: se vuelven a dividir las páginas guardadas y se generan
+      sus vectores.
+
+    Si hubo que reconstruir, el índice actualizado se guarda en disco.
+
+    Args:
+        index_path: Ruta del índice persistido
+        settings: Configuración de ingesta actual (por defecto la de las variables de entorno)
+        use_mmap: Si True, mapea los ficheros cuando no hace falta reconstruir
+
+    Returns:
+        Índice listo para búsquedas y compatible con `settings`
+    """
+    settings = settings or IndexSettings()
+    embeddings = generate_embeddings(settings.model_name, disk_cache=True)
+    db = load_index(index_path, embeddings, use_mmap, check_compatibility=False)
+
+    changes = db.settings.diff(settings) if db.settings else {}
+    dimension = _embedding_dimension(embeddings)
+    if db.index is not None and dimension is not None and dimension != db.index.d:
+        changes["dimension"] = (db.index.d, dimension)
+    if db.settings is None:
+        logger.warning("Índice sin parámetros de ingesta en el manifest; se asumen los actuales")
+
+    if not changes:
+        db.settings = settings
+        return db
+
+    logger.info(
+        "Configuración de ingesta distinta, reconstruyendo índice: "
+        + ", ".join(f"{name} {old} → {new}" for name, (old, new) in changes.items())
     )
-    logger.info("Índice FAISS cargado exitosamente")
+    db.compact()
+    if any(name in IndexSettings.CHUNKING_FIELDS for name in changes):
+        chunk_size, chunk_overlap, tokenizer = _resolve_chunking(
+            embeddings, settings.length_mode, settings.chunk_size, settings.chunk_overlap
+        )
+        db.store = _rechunk_store(db.store, chunk_size, chunk_overlap, tokenizer)
+    _embed_store(db)
+
+    db.settings = settings
+    save_index(db, index_path=index_path)
     return db
 
 
 def retrieve_relevant_chunks(
-    db: FAISS,
+    db: VectorIndex,
     query: str,
     k: int = 4
 ) -> List[Tuple[str, float]]:
@@ -257,13 +2647,16 @@ def retrieve_relevant_chunks(
     Busca los k chunks más relevantes para una query dada.
 
     Args:
-        db: Índice FAISS
+        db: Índice (VectorIndex, ProgressiveIndex o FAISS de LangChain)
         query: Pregunta del usuario
         k: Número de chunks a recuperar
 
     Returns:
-        Lista de tuplas (chunk_text, similarity_score)
-        Score más bajo = mayor similaridad
+        Lista de tuplas (chunk_text, similarity_score), de mayor a menor
+        Score = similitud coseno (1.0 = idéntico, mayor = más relevante)
+
+    El embedding de la query sale de la caché de queries si la misma pregunta
+    (normalizada) ya se hizo con el mismo modelo.
     """
     if not query or not query.strip():
         raise ValueError("La query no puede estar vacía")
@@ -271,16 +2664,97 @@ def retrieve_relevant_chunks(
     # PRIVACIDAD: No logear la query del usuario
     logger.debug(f"Buscando {k} chunks relevantes")
 
-    # similarity_search_with_score devuelve (Document, score)
-    docs_and_scores = db.similarity_search_with_score(query, k=k)
-
-    # Extraer contenido y scores
-    results = [(doc.page_content, score) for doc, score in docs_and_scores]
+    if isinstance(db, (VectorIndex, ProgressiveIndex)):
+        results = db.search(query, k=k)
+    else:
+        # FAISS de LangChain (IndexFlatL2): con vectores normalizados la
+        # distancia L2 al cuadrado es 2 - 2·coseno
+        docs_and_scores = db.similarity_search_with_score(query, k=k)
+        results = [(doc.page_content, 1.0 - float(score) / 2.0) for doc, score in docs_and_scores]
 
     logger.debug(f"Encontrados {len(results)} chunks")
     return results
 
 
+def _index_version(db) -> Tuple[int, ...]:
+    """Identifica el contenido actual de un índice (cambia al añadir o borrar chunks)."""
+    if isinstance(db, ProgressiveIndex):
+        return (db.pages_indexed, db.chunks_indexed, int(db.is_complete))
+    if isinstance(db, VectorIndex):
+        return (len(db), len(db.store.deleted))
+    return (db.index.ntotal,)
+
+
+class RetrievalCache:
+    """
+    Resultados de búsqueda recordados por (documento, versión del índice, query).
+
+    Cada búsqueda se hace una vez con max_k vecinos y los k menores se sirven
+    recortando esa lista, así mover el slider de fragmentos o repetir la
+    pregunta con otro nivel de detalle o modelo de Mistral no vuelve a
+    consultar FAISS. Si el índice cambia (ingesta progresiva, documentos
+    añadidos o borrados) la versión cambia y la búsqueda se repite.
+    """
+
+    def __init__(self, max_entries: int = RETRIEVAL_CACHE_SIZE, max_k: int = RETRIEVAL_MAX_K):
+        self.max_entries = max_entries
+        self.max_k = max_k
+        self._entries: "OrderedDict[tuple, List[Tuple[str, float]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def search(self, db, query: str, k: int = 4, doc_key: str = "") -> List[Tuple[str, float]]:
+        """
+        Busca los k chunks más relevantes reutilizando búsquedas anteriores.
+
+        Args:
+            db: Índice (VectorIndex, ProgressiveIndex o FAISS de LangChain)
+            query: Pregunta del usuario
+            k: Número de chunks a devolver
+            doc_key: Identificador del documento (p. ej. su hash)
+
+        Returns:
+            Lista de tuplas (chunk_text, similarity_score), de mayor a menor
+        """
+        if k > self.max_k:
+            return retrieve_relevant_chunks(db, query, k)
+
+        # PRIVACIDAD: la query solo se guarda como hash
+        query_hash = hashlib.sha256(_normalize_text(query).encode("utf-8")).hexdigest()
+        key = (doc_key or id(db), _index_version(db), query_hash)
+        with self._lock:
+            results = self._entries.get(key)
+            if results is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return results[:k]
+
+        results = retrieve_relevant_chunks(db, query, self.max_k)
+        with self._lock:
+            self.misses += 1
+            self._entries[key] = results
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return results[:k]
+
+    def clear(self):
+        """Olvida todas las búsquedas guardadas."""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, object]:
+        """Entradas, aciertos, fallos y tasa de aciertos."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
 def ingest_pdf_to_index(
     pdf_path: str,
     index_path: str = INDEX_PATH,
@@ -288,8 +2762,9 @@ def ingest_pdf_to_index(
     chunk_size: int = DEFAULT_CHUNK_SIZE,
     chunk_overlap: int = DEFAULT_CHUNK_OVERLAP,
     force_rebuild: bool = False,
-    persist: bool = False
-) -> FAISS:
+    persist: bool = False,
+    length_mode: str = CHUNK_LENGTH_MODE
+) -> VectorIndex:
     """
     Pipeline completo: lee PDF, chunking, embeddings, indexado FAISS.
 
@@ -304,29 +2779,53 @@ def ingest_pdf_to_index(
         chunk_overlap: Solapamiento entre chunks
         force_rebuild: Si True, reconstruye el índice aunque exista
         persist: Si True, guarda el índice en disco (uso local). Si False, solo en memoria (deploy)
+        length_mode: "chars" o "tokens" (ajustado a la longitud máxima del modelo)
 
     Returns:
         Índice FAISS listo para búsquedas (en memoria)
+
+    Raises:
+        IndexCompatibilityError: Si el índice guardado tiene un formato no soportado
+            (no se sobrescribe; usar force_rebuild=True para reconstruirlo)
     """
-    embeddings = generate_embeddings(model_name)
+    settings = IndexSettings(model_name, chunk_size, chunk_overlap, length_mode)
+    embeddings = generate_embeddings(model_name, disk_cache=persist)
+    chunk_size, chunk_overlap, tokenizer = _resolve_chunking(
+        embeddings, length_mode, chunk_size, chunk_overlap
+    )
 
     # Solo intentar cargar índice si persist=True y existe
     if persist and os.path.exists(index_path) and not force_rebuild:
         try:
             logger.info("Índice existente encontrado, cargando...")
-            return load_index(index_path, embeddings)
+            return open_index(index_path, settings)
+        except IndexCompatibilityError:
+            # Reconstruir desde un solo PDF sobrescribiría un índice con varios documentos
+            raise
         except Exception as e:
-            logger.warning(f"Error cargando índice: reconstruyendo")
+            logger.warning(f"Error cargando índice ({type(e).__name__}: {e}), reconstruyendo")
 
-    # Pipeline completo: leer → chunkear → indexar
+    if not os.path.exists(pdf_path):
+        raise FileNotFoundError(f"El archivo {pdf_path} no existe")
+
+    # Pipeline en streaming: páginas → chunks → lotes de embeddings → FAISS
     logger.info("Iniciando pipeline de ingesta")
-    text = read_pdf(pdf_path)
-    chunks = split_into_chunks(text, chunk_size, chunk_overlap)
-    db = build_faiss_index(chunks, embeddings)
+    with open(pdf_path, "rb") as f:
+        pdf_bytes = f.read()
+
+    db = VectorIndex(embeddings)
+    db.settings = settings
+    _add_pdf_to_index(
+        db, pdf_bytes, os.path.basename(pdf_path), chunk_size, chunk_overlap, tokenizer
+    )
+
+    if len(db) == 0:
+        raise ValueError("La lista de chunks no puede estar vacía")
+    db.optimize()
 
     # Solo guardar en disco si persist=True
     if persist:
-        save_index(db, chunks, index_path)
+        save_index(db, index_path=index_path)
         logger.info("Índice guardado en disco")
     else:
         logger.info("Índice creado en memoria (no persistido)")
@@ -335,12 +2834,243 @@ def ingest_pdf_to_index(
     return db
 
 
+def _add_pdf_to_index(
+    db: VectorIndex,
+    pdf_bytes: bytes,
+    name: str,
+    chunk_size: int,
+    chunk_overlap: int,
+    tokenizer=None
+) -> int:
+    """
+    Añade un PDF al final del índice y lo registra como documento.
+    Solo se generan embeddings para los chunks de este PDF.
+
+    Returns:
+        Número de chunks añadidos
+    """
+    store = db.store
+    mark = store.mark()
+    pages = _prefetch(
+        iter_document_pages(pdf_bytes, ParsedDocument(store=store), keep_text=False)
+    )
+    chunk_ids = iter_store_chunks(pages, store, chunk_size, chunk_overlap, tokenizer)
+    chunk_texts = (store.get_text(chunk_id) for chunk_id in chunk_ids)
+    for _, vectors in iter_embedded_batches(chunk_texts, db.embeddings):
+        db.add(vectors)
+
+    span = store.register_document(compute_document_hash(pdf_bytes), name, mark)
+    return span.chunk_count
+
+
+def append_pdfs_to_index(
+    pdf_paths: Iterable[str],
+    index_path: str = INDEX_PATH,
+    model_name: str = DEFAULT_MODEL_NAME,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    chunk_overlap: int = DEFAULT_CHUNK_OVERLAP,
+    length_mode: str = CHUNK_LENGTH_MODE
+) -> VectorIndex:
+    """
+    Añade PDFs a un índice persistido generando embeddings solo de los nuevos.
+
+    Los documentos se identifican por el hash de su contenido: un PDF ya
+    indexado se omite. Si el índice no existe, se crea. Uso local (persiste en disco).
+
+    Args:
+        pdf_paths: Rutas de los PDFs a añadir
+        index_path: Ruta del índice persistido
+        model_name: Modelo de embeddings a usar (el mismo con el que se creó el índice)
+        chunk_size: Tamaño de cada chunk
+        chunk_overlap: Solapamiento entre chunks
+        length_mode: "chars" o "tokens"
+
+    Returns:
+        Índice actualizado (ya guardado en disco)
+    """
+    settings = IndexSettings(model_name, chunk_size, chunk_overlap, length_mode)
+    embeddings = generate_embeddings(model_name, disk_cache=True)
+    chunk_size, chunk_overlap, tokenizer = _resolve_chunking(
+        embeddings, length_mode, chunk_size, chunk_overlap
+    )
+
+    # Si la configuración cambió, open_index reconstruye antes de añadir
+    if os.path.exists(index_path):
+        db = open_index(index_path, settings)
+    else:
+        db = VectorIndex(embeddings)
+        db.settings = settings
+
+    added = 0
+    for pdf_path in pdf_paths:
+        with open(pdf_path, "rb") as f:
+            pdf_bytes = f.read()
+
+        doc_hash = compute_document_hash(pdf_bytes)
+        if doc_hash in db.store.documents:
+            logger.info(f"Documento ya indexado, se omite: {os.path.basename(pdf_path)}")
+            continue
+
+        chunks = _add_pdf_to_index(
+            db, pdf_bytes, os.path.basename(pdf_path), chunk_size, chunk_overlap, tokenizer
+        )
+        added += chunks
+        logger.info(f"Añadido {os.path.basename(pdf_path)} ({chunks} chunks)")
+
+    if len(db) == 0:
+        raise ValueError("La lista de chunks no puede estar vacía")
+
+    if added:
+        db.optimize()
+        save_index(db, index_path=index_path)
+    logger.info(f"{added} chunks nuevos; índice con {len(db.store.documents)} documentos")
+    return db
+
+
+def delete_documents_from_index(
+    doc_hashes: Iterable[str],
+    index_path: str = INDEX_PATH,
+    compaction_ratio: float = FAISS_COMPACTION_RATIO,
+    embeddings: Optional[HuggingFaceEmbeddings] = None
+) -> VectorIndex:
+    """
+    Borra documentos de un índice persistido sin volver a generar embeddings.
+
+    Los chunks se marcan como tombstones (las búsquedas los descartan); cuando
+    superan `compaction_ratio` del total, el índice se compacta.
+
+    Args:
+        doc_hashes: Hashes SHA-256 de los documentos a borrar (ver compute_document_hash)
+        index_path: Ruta del índice persistido
+        compaction_ratio: Fracción de chunks borrados que dispara la compactación
+        embeddings: Objeto de embeddings (si no se provee, se crea uno nuevo)
+
+    Returns:
+        Índice actualizado (ya guardado en disco)
+    """
+    db = load_index(index_path, embeddings)
+
+    removed = sum(db.delete_document(doc_hash) for doc_hash in doc_hashes)
+    if not removed:
+        logger.info("Ningún documento a borrar en el índice")
+        return db
+
+    logger.info(f"{removed} chunks marcados como borrados ({db.store.deleted_ratio:.1%} del índice)")
+    if db.store.deleted_ratio > compaction_ratio:
+        db.compact()
+
+    save_index(db, index_path=index_path)
+    return db
+
+
+def start_progressive_ingestion(
+    pdf_bytes: bytes,
+    model_name: str = DEFAULT_MODEL_NAME,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    chunk_overlap: int = DEFAULT_CHUNK_OVERLAP,
+    first_pages: int = PROGRESSIVE_FIRST_PAGES,
+    batch_size: int = EMBEDDING_BATCH_SIZE,
+    length_mode: str = CHUNK_LENGTH_MODE
+) -> Tuple[ProgressiveIndex, ParsedDocument]:
+    """
+    Inicia la ingesta en segundo plano y vuelve en cuanto hay un índice parcial.
+
+    Las primeras `first_pages` páginas se indexan antes de devolver el control;
+    el resto se añade en un hilo de fondo mientras el índice ya responde
+    consultas sobre lo indexado hasta el momento.
+
+    PRIVACIDAD: No guarda NADA en disco. Todo el procesamiento es en memoria.
+
+    Args:
+        pdf_bytes: Contenido binario del PDF
+        model_name: Modelo de embeddings a usar
+        chunk_size: Tamaño de cada chunk
+        chunk_overlap: Solapamiento entre chunks
+        first_pages: Páginas a indexar antes de publicar el índice parcial
+        batch_size: Chunks por lote de embeddings
+        length_mode: "chars" o "tokens" (ajustado a la longitud máxima del modelo)
+
+    Returns:
+        Tupla (índice progresivo, documento parseado que se completa en paralelo)
+
+    Raises:
+        Exception: Si el PDF no se puede leer o no se pudo indexar nada
+    """
+    embeddings = generate_embeddings(model_name)
+    chunk_size, chunk_overlap, tokenizer = _resolve_chunking(
+        embeddings, length_mode, chunk_size, chunk_overlap
+    )
+
+    try:
+        total_pages = count_pages(pdf_bytes)
+    except Exception as e:
+        raise Exception(f"Error procesando PDF desde memoria: {e}")
+
+    logger.info("Procesando PDF desde memoria")
+    # El texto de las páginas se guarda una sola vez, en el ChunkStore del índice
+    store = ChunkStore()
+    document = ParsedDocument(store=store)
+    index = ProgressiveIndex(embeddings, total_pages, store)
+
+    # La extracción avanza en segundo plano mientras se generan los embeddings
+    pages = _prefetch(
+        iter_document_pages(pdf_bytes, document, log_page_errors=False, keep_text=False)
+    )
+    threading.Thread(
+        target=_build_progressively,
+        args=(index, pages, chunk_size, chunk_overlap, batch_size, first_pages, tokenizer),
+        daemon=True
+    ).start()
+
+    index.wait_until_ready()
+    if index.error is not None and index.chunks_indexed == 0:
+        if isinstance(index.error, ValueError):
+            raise index.error
+        raise Exception(f"Error procesando PDF desde memoria: {index.error}")
+
+    logger.info(f"Índice parcial publicado: {index.pages_indexed}/{total_pages} páginas")
+    return index, document
+
+
+def ingest_document_from_buffer(
+    pdf_buffer: BytesIO,
+    model_name: str = DEFAULT_MODEL_NAME,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    chunk_overlap: int = DEFAULT_CHUNK_OVERLAP
+) -> Tuple[VectorIndex, ParsedDocument]:
+    """
+    Pipeline completo desde buffer en memoria que además devuelve el documento parseado.
+    El PDF se extrae una sola vez; el documento sirve para vista previa y estadísticas.
+
+    PRIVACIDAD: No guarda NADA en disco. Todo el procesamiento es en memoria.
+
+    Args:
+        pdf_buffer: Buffer de bytes con el contenido del PDF
+        model_name: Modelo de embeddings a usar
+        chunk_size: Tamaño de cada chunk
+        chunk_overlap: Solapamiento entre chunks
+
+    Returns:
+        Tupla (índice FAISS en memoria, documento parseado)
+    """
+    index, document = start_progressive_ingestion(
+        pdf_buffer.getvalue(), model_name, chunk_size, chunk_overlap
+    )
+    index.wait()
+    if index.error is not None:
+        raise Exception(f"Error procesando PDF desde memoria: {index.error}")
+
+    logger.info(f"PDF procesado en memoria: {document.page_count} páginas")
+    logger.info("Pipeline completado en memoria (100% privado)")
+    return index.db, document
+
+
 def ingest_pdf_from_buffer(
     pdf_buffer: BytesIO,
     model_name: str = DEFAULT_MODEL_NAME,
     chunk_size: int = DEFAULT_CHUNK_SIZE,
     chunk_overlap: int = DEFAULT_CHUNK_OVERLAP
-) -> FAISS:
+) -> VectorIndex:
     """
     Pipeline completo desde buffer en memoria: lee PDF, chunking, embeddings, indexado FAISS.
 
@@ -356,20 +3086,256 @@ def ingest_pdf_from_buffer(
     Returns:
         Índice FAISS en memoria (no persistido)
     """
-    embeddings = generate_embeddings(model_name)
+    db, _ = ingest_document_from_buffer(pdf_buffer, model_name, chunk_size, chunk_overlap)
+    return db
 
-    # Pipeline completo en memoria: leer → chunkear → indexar
-    logger.info("Procesando PDF desde memoria")
-    text = read_pdf_from_buffer(pdf_buffer)
-    chunks = split_into_chunks(text, chunk_size, chunk_overlap)
-    db = build_faiss_index(chunks, embeddings)
 
-    logger.info("Pipeline completado en memoria (100% privado)")
-    return db
+def compute_document_hash(pdf_bytes: bytes) -> str:
+    """
+    Calcula el hash SHA-256 del contenido de un PDF.
+    Identifica el documento por su contenido, no por su nombre de archivo.
+
+    Args:
+        pdf_bytes: Contenido binario del PDF
+
+    Returns:
+        Hash hexadecimal del contenido
+    """
+    return hashlib.sha256(pdf_bytes).hexdigest()
+
+
+class _SharedEntry:
+    """Entrada del caché de índices: valor construido y sesiones que lo usan."""
+
+    def __init__(self):
+        self.value = None
+        self.ready = threading.Event()
+        self.error: Optional[BaseException] = None
+        self.sessions: Dict[str, float] = {}
+
+
+class SharedIndexCache:
+    """
+    Caché en memoria de índices FAISS compartidos entre sesiones.
+
+    Las entradas se identifican por el hash del contenido del PDF (más los
+    parámetros de ingesta), de modo que el mismo documento subido por varias
+    sesiones se procesa una sola vez. Cada entrada lleva la cuenta de las
+    sesiones que la referencian y se elimina cuando la última la libera o
+    expira por inactividad.
+
+    PRIVACIDAD: Nada se escribe en disco; los índices viven solo en RAM.
+    """
+
+    def __init__(self, session_ttl_seconds: int = SHARED_INDEX_TTL_SECONDS):
+        self.session_ttl_seconds = session_ttl_seconds
+        self._entries: Dict[Tuple, _SharedEntry] = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, key: Tuple, session_id: str, builder: Callable[[], object]) -> object:
+        """
+        Devuelve el valor de la entrada, construyéndolo si es la primera sesión.
+        Si otra sesión ya está construyendo la misma entrada, espera su resultado.
+
+        Args:
+            key: Clave de la entrada (el primer elemento es el hash del documento)
+            session_id: Identificador de la sesión que lo usará
+            builder: Función que construye el valor si no existe
+
+        Returns:
+            Valor compartido (por ejemplo, el índice FAISS)
+        """
+        self.purge_expired()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            is_builder = entry is None
+            if is_builder:
+                entry = _SharedEntry()
+                self._entries[key] = entry
+            entry.sessions[session_id] = time.monotonic()
+
+        if is_builder:
+            try:
+                entry.value = builder()
+            except BaseException as e:
+                entry.error = e
+                with self._lock:
+                    self._entries.pop(key, None)
+                raise
+            finally:
+                entry.ready.set()
+            logger.info(f"Índice compartido construido ({len(self._entries)} en caché)")
+        else:
+            entry.ready.wait()
+            if entry.error is not None:
+                raise entry.error
+            logger.info("Índice compartido reutilizado")
+
+        return entry.value
+
+    def discard(self, key: Tuple, value: object):
+        """
+        Elimina una entrada aunque tenga sesiones (por ejemplo, si su índice falló),
+        para que la siguiente sesión vuelva a construirla.
+
+        Args:
+            key: Clave de la entrada
+            value: Valor construido; no se elimina una entrada más reciente con otro valor
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (entry.value is value or entry.value is None):
+                del self._entries[key]
+                logger.info("Índice compartido descartado")
+
+    def touch(self, doc_hash: str, session_id: str):
+        """
+        Renueva la actividad de una sesión sobre las entradas de un documento.
+
+        Args:
+            doc_hash: Hash del documento
+            session_id: Identificador de la sesión
+        """
+        now = time.monotonic()
+        with self._lock:
+            for key, entry in self._entries.items():
+                if key[0] == doc_hash and session_id in entry.sessions:
+                    entry.sessions[session_id] = now
+
+    def release(self, doc_hash: str, session_id: str):
+        """
+        Libera las entradas de un documento usadas por una sesión.
+        Las entradas sin sesiones restantes se eliminan de memoria.
+
+        Args:
+            doc_hash: Hash del documento
+            session_id: Identificador de la sesión
+        """
+        with self._lock:
+            for key in list(self._entries.keys()):
+                entry = self._entries[key]
+                if key[0] == doc_hash:
+                    entry.sessions.pop(session_id, None)
+                    if not entry.sessions and entry.ready.is_set():
+                        del self._entries[key]
+
+    def purge_expired(self) -> int:
+        """
+        Elimina referencias de sesiones inactivas y las entradas que quedan sin uso.
+
+        Returns:
+            Número de entradas eliminadas
+        """
+        cutoff = time.monotonic() - self.session_ttl_seconds
+        removed = 0
+        with self._lock:
+            for key in list(self._entries.keys()):
+                entry = self._entries[key]
+                for session_id, last_seen in list(entry.sessions.items()):
+                    if last_seen < cutoff:
+                        del entry.sessions[session_id]
+                if not entry.sessions and entry.ready.is_set():
+                    del self._entries[key]
+                    removed += 1
+        if removed:
+            logger.info(f"{removed} índices compartidos expirados eliminados")
+        return removed
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Devuelve el número de índices en caché y de referencias de sesión.
+        """
+        with self._lock:
+            return {
+                "indexes": len(self._entries),
+                "sessions": sum(len(e.sessions) for e in self._entries.values()),
+            }
+
+
+_shared_index_cache = SharedIndexCache()
+
+
+def get_shared_index_cache() -> SharedIndexCache:
+    """
+    Devuelve el caché de índices compartidos del proceso.
+    """
+    return _shared_index_cache
+
+
+def ingest_pdf_shared(
+    pdf_bytes: bytes,
+    session_id: str,
+    model_name: str = DEFAULT_MODEL_NAME,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    chunk_overlap: int = DEFAULT_CHUNK_OVERLAP,
+    length_mode: str = CHUNK_LENGTH_MODE
+) -> Tuple[str, ProgressiveIndex, ParsedDocument]:
+    """
+    Ingesta en memoria identificada por el contenido del PDF.
+
+    Si otra sesión ya procesó un PDF con el mismo contenido (mismo SHA-256) y
+    los mismos parámetros, reutiliza su índice en lugar de volver a leer,
+    chunkear y generar embeddings. El índice se devuelve en cuanto cubre las
+    primeras páginas y sigue creciendo en segundo plano.
+
+    PRIVACIDAD: No guarda NADA en disco. El índice compartido solo vive en RAM.
+
+    Args:
+        pdf_bytes: Contenido binario del PDF
+        session_id: Identificador de la sesión que usa el índice
+        model_name: Modelo de embeddings a usar
+        chunk_size: Tamaño de cada chunk
+        chunk_overlap: Solapamiento entre chunks
+        length_mode: "chars" o "tokens" (ajustado a la longitud máxima del modelo)
+
+    Returns:
+        Tupla (hash del documento, índice progresivo en memoria, documento parseado)
+    """
+    doc_hash = compute_document_hash(pdf_bytes)
+    key = (doc_hash, model_name, chunk_size, chunk_overlap, length_mode)
+
+    def build() -> Tuple[ProgressiveIndex, ParsedDocument]:
+        result = start_progressive_ingestion(
+            pdf_bytes, model_name, chunk_size, chunk_overlap, length_mode=length_mode
+        )
+
+        def discard_on_error(index: ProgressiveIndex):
+            # Si la construcción en segundo plano falla, la siguiente sesión reintenta la ingesta
+            if index.error is not None:
+                _shared_index_cache.discard(key, result)
+
+        result[0].add_done_callback(discard_on_error)
+        return result
+
+    index, document = _shared_index_cache.acquire(key, session_id, build)
+    return doc_hash, index, document
+
+
+def release_shared_index(doc_hash: str, session_id: str):
+    """
+    Indica que una sesión ya no usa el índice de un documento.
+
+    Args:
+        doc_hash: Hash del documento
+        session_id: Identificador de la sesión
+    """
+    _shared_index_cache.release(doc_hash, session_id)
+
+
+def touch_shared_index(doc_hash: str, session_id: str):
+    """
+    Marca actividad de una sesión sobre su índice para que no expire.
+
+    Args:
+        doc_hash: Hash del documento
+        session_id: Identificador de la sesión
+    """
+    _shared_index_cache.touch(doc_hash, session_id)
 
 
 # Función de conveniencia para búsqueda (alias más semántico)
-def similarity_search(db: FAISS, query: str, k: int = 4) -> List[Tuple[str, float]]:
+def similarity_search(db: VectorIndex, query: str, k: int = 4) -> List[Tuple[str, float]]:
     """
     Alias de retrieve_relevant_chunks para mantener compatibilidad.
     """
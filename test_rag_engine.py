@@ -10,6 +10,32 @@ from dotenv import load_dotenv
 # Cargar variables de entorno
 load_dotenv()
 
+def make_pdf(page_texts):
+    """Genera un PDF mínimo (una línea de texto por página) sin dependencias extra"""
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None, "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for text in page_texts:
+        stream = f"BT /F1 10 Tf 20 750 Td ({text}) Tj ET"
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objects)} 0 R >>"
+        )
+        kids.append(f"{len(objects)} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(kids)} >>"
+
+    pdf = b"%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(pdf))
+        pdf += f"{number} 0 obj\n{body}\nendobj\n".encode("latin-1")
+    xref = len(pdf)
+    pdf += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    pdf += "".join(f"{offset:010d} 00000 n \n" for offset in offsets).encode()
+    pdf += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    return pdf
+
+
 def test_imports():
     """Prueba que todas las dependencias se puedan importar"""
     print("🔍 Probando imports...")
@@ -46,6 +72,71 @@ def test_embeddings():
         return False
 
 
+def test_embedding_registry():
+    """Prueba que el modelo de embeddings se carga una sola vez por proceso"""
+    print("\n🔍 Probando registro de modelos de embeddings...")
+    try:
+        from src.rag_engine import generate_embeddings, get_embedding_registry
+
+        first = generate_embeddings()
+        second = generate_embeddings()
+        assert first is second, "El modelo se recargó en la segunda llamada"
+
+        stats = get_embedding_registry().stats()
+        print(f"✅ Modelo reutilizado ({len(stats['models'])} en registro, ~{stats['memory_mb']:.0f} MB)")
+        return True
+    except Exception as e:
+        print(f"❌ Error en registro de embeddings: {e}")
+        return False
+
+
+def test_parsed_document():
+    """Prueba el documento parseado (páginas, caracteres y vista previa)"""
+    print("\n🔍 Probando documento parseado (vista previa y estadísticas)...")
+    try:
+        from io import BytesIO
+        from src.rag_engine import parse_pdf_from_buffer
+
+        page_texts = [f"Pagina {n}: los embeddings representan texto como vectores" for n in range(3)]
+        document = parse_pdf_from_buffer(BytesIO(make_pdf(page_texts)), workers=1)
+
+        assert document.page_count == 3, f"Páginas incorrectas: {document.page_count}"
+        assert document.char_count == sum(len(page) for page in document.pages) > 0, \
+            "El conteo de caracteres no coincide con las páginas"
+        assert document.pages[0].startswith("Pagina 0"), "Texto de la página incorrecto"
+
+        preview = document.preview(max_pages=2, max_chars=70)
+        assert len(preview) == 70 and preview.startswith(document.pages[0]), "Vista previa mal truncada"
+        assert "Pagina 2" not in document.preview(max_pages=2), "La vista previa incluyó páginas de más"
+
+        print(f"✅ {document.page_count} páginas, {document.char_count} caracteres, vista previa de {len(preview)}")
+        return True
+    except Exception as e:
+        print(f"❌ Error en documento parseado: {e}")
+        return False
+
+
+def test_parallel_extraction():
+    """Prueba que la extracción con pool devuelve las mismas páginas que la serial"""
+    print("\n🔍 Probando extracción de PDF en paralelo...")
+    try:
+        from src.pdf_extraction import extract_pages, shutdown_pool
+
+        pdf_bytes = make_pdf([f"Pagina {n} del documento de prueba" for n in range(12)])
+        serial = [text for text, _, _ in extract_pages(pdf_bytes, workers=1)]
+        parallel = [text for text, _, _ in extract_pages(pdf_bytes, workers=2, min_parallel_pages=2)]
+        shutdown_pool()
+
+        assert len(serial) == 12 and serial[5].startswith("Pagina 5"), "Extracción serial incorrecta"
+        assert parallel == serial, "El pool devolvió páginas distintas o en otro orden"
+
+        print(f"✅ {len(parallel)} páginas idénticas con 1 y 2 procesos")
+        return True
+    except Exception as e:
+        print(f"❌ Error en extracción paralela: {e}")
+        return False
+
+
 def test_text_splitting():
     """Prueba el chunking de texto"""
     print("\n🔍 Probando división de texto...")
@@ -68,11 +159,131 @@ def test_text_splitting():
         return False
 
 
+def test_native_chunker():
+    """Prueba el chunker nativo de una pasada con offsets"""
+    print("\n🔍 Probando chunker nativo...")
+    try:
+        from src.rag_engine import split_into_spans
+
+        test_text = """
+        Este es un documento de prueba muy largo que necesita ser dividido en chunks.
+        El proceso de chunking es fundamental para RAG porque permite buscar información
+        de manera más granular. Cada chunk debe mantener coherencia semántica.
+
+        """ * 20
+
+        spans = split_into_spans(test_text, chunk_size=200, chunk_overlap=50)
+
+        assert all(0 < end - start <= 200 for start, end in spans), "Chunk fuera de tamaño"
+        assert all(b[0] > a[0] and a[1] - b[0] <= 50 for a, b in zip(spans, spans[1:])), \
+            "Solapamiento mayor que chunk_overlap"
+        covered = set()
+        for start, end in spans:
+            covered.update(range(start, end))
+        missing = [i for i, c in enumerate(test_text) if not c.isspace() and i not in covered]
+        assert not missing, "Texto sin cubrir por ningún chunk"
+
+        print(f"✅ {len(spans)} chunks con offsets, todo el texto cubierto")
+        return True
+    except Exception as e:
+        print(f"❌ Error en chunker nativo: {e}")
+        return False
+
+
+def test_token_chunking():
+    """Prueba el chunking medido en tokens del modelo de embeddings"""
+    print("\n🔍 Probando chunking por tokens...")
+    try:
+        from src.rag_engine import (
+            generate_embeddings, get_model_tokenizer, measure_truncation, split_into_chunks,
+            start_progressive_ingestion
+        )
+
+        tokenizer, max_tokens = get_model_tokenizer(generate_embeddings())
+        test_text = """
+        El proceso de chunking es fundamental para RAG porque permite buscar información
+        de manera más granular. Cada chunk debe mantener coherencia semántica.
+        """ * 60
+
+        char_chunks = split_into_chunks(test_text, chunk_size=3000, chunk_overlap=150)
+        token_chunks = split_into_chunks(test_text, max_tokens - 2, 32, tokenizer=tokenizer)
+
+        before = measure_truncation(char_chunks, tokenizer, max_tokens)
+        after = measure_truncation(token_chunks, tokenizer, max_tokens)
+        assert after.truncated_tokens == 0, "Chunks por tokens exceden el límite del modelo"
+
+        # La ingesta en modo "chars" registra lo que el modelo trunca
+        page = "Los embeddings representan texto como vectores densos y comparables. " * 45
+        index, _ = start_progressive_ingestion(
+            make_pdf([page, page]), chunk_size=3000, chunk_overlap=150, length_mode="chars"
+        )
+        index.wait()
+        assert index.truncation.truncated_tokens > 0, "No se midió el truncado en modo chars"
+
+        print(f"✅ Tokens truncados: {before.truncated_ratio:.1%} (caracteres) → {after.truncated_ratio:.1%} (tokens)")
+        return True
+    except Exception as e:
+        print(f"❌ Error en chunking por tokens: {e}")
+        return False
+
+
+def test_streaming_chunks():
+    """Prueba el chunking en streaming sobre un flujo de páginas"""
+    print("\n🔍 Probando chunking en streaming...")
+    try:
+        from src.rag_engine import iter_chunks, split_into_chunks
+
+        pages = [
+            f"Página {n}. El proceso de chunking es fundamental para RAG porque permite "
+            f"buscar información de manera más granular. " * 8
+            for n in range(1, 11)
+        ]
+
+        streamed = list(iter_chunks(iter(pages), chunk_size=300, chunk_overlap=50))
+        full = split_into_chunks("\n\n".join(pages), chunk_size=300, chunk_overlap=50)
+
+        assert all(len(chunk) <= 300 for chunk in streamed), "Chunk mayor que chunk_size"
+        assert abs(len(streamed) - len(full)) <= len(full) // 10 + 1, "Número de chunks muy distinto"
+
+        print(f"✅ {len(streamed)} chunks en streaming ({len(full)} con texto completo)")
+        return True
+    except Exception as e:
+        print(f"❌ Error en chunking en streaming: {e}")
+        return False
+
+
+def test_chunk_store():
+    """Prueba el almacén compacto de chunks (buffer de texto + offsets)"""
+    print("\n🔍 Probando almacén de chunks...")
+    try:
+        from src.rag_engine import ChunkStore, iter_store_chunks
+
+        pages = [f"Página {n} con acentos: análisis, índice y señal. " * 20 for n in range(1, 6)]
+        store = ChunkStore()
+        chunk_ids = list(iter_store_chunks(iter(pages), store, chunk_size=200, chunk_overlap=40))
+
+        assert chunk_ids == list(range(len(store))), "Ids de chunk no consecutivos"
+        assert store.page_count == len(pages), "Número de páginas incorrecto"
+        for chunk_id in chunk_ids:
+            text = store.get_text(chunk_id)
+            assert 0 < len(text) <= 200, "Chunk vacío o mayor que chunk_size"
+            assert text[:30] in store.page_text(store.get_page(chunk_id)), "Página de chunk incorrecta"
+
+        doc = store.document(0)
+        assert doc.metadata["page"] == 1, "Metadata de página incorrecta"
+
+        print(f"✅ {len(store)} chunks en {store.memory_bytes()} bytes")
+        return True
+    except Exception as e:
+        print(f"❌ Error en almacén de chunks: {e}")
+        return False
+
+
 def test_faiss_index():
     """Prueba la creación de un índice FAISS simple"""
     print("\n🔍 Probando creación de índice FAISS...")
     try:
-        from src.rag_engine import generate_embeddings, build_faiss_index
+        from src.rag_engine import generate_embeddings, build_faiss_index, similarity_search
 
         # Crear chunks de prueba
         test_chunks = [
@@ -85,17 +296,671 @@ def test_faiss_index():
         embeddings = generate_embeddings()
         db = build_faiss_index(test_chunks, embeddings)
 
-        # Probar búsqueda
-        results = db.similarity_search_with_score("¿Qué es Python?", k=2)
+        # Probar búsqueda (score = similitud coseno, mayor = más relevante)
+        results = similarity_search(db, "¿Qué es Python?", k=2)
+        scores = [score for _, score in results]
+        assert scores == sorted(scores, reverse=True), "Resultados no ordenados por similitud"
+        assert all(-1.0 <= score <= 1.0 + 1e-5 for score in scores), "Score fuera del rango coseno"
 
         print(f"✅ Índice FAISS creado con {len(test_chunks)} documentos")
-        print(f"   Resultado de búsqueda: '{results[0][0].page_content}' (score: {results[0][1]:.4f})")
+        print(f"   Resultado de búsqueda: '{results[0][0]}' (score: {results[0][1]:.4f})")
         return True
     except Exception as e:
         print(f"❌ Error en FAISS: {e}")
         return False
 
 
+def test_adaptive_index():
+    """Prueba la elección automática del tipo de índice FAISS"""
+    print("\n🔍 Probando selección adaptativa de índice...")
+    try:
+        import faiss
+        import numpy as np
+        from src.rag_engine import VectorIndex, choose_index_spec
+
+        assert choose_index_spec(1_000, 384).kind == "flat", "Un paper debería usar flat"
+        assert choose_index_spec(100_000, 384).kind == "hnsw", "Colección media debería usar HNSW"
+        spec = choose_index_spec(2_000_000, 384)
+        assert spec.kind == "ivf" and spec.nprobe <= spec.nlist, "Colección grande debería usar IVF"
+
+        # Recall de HNSW frente a la búsqueda exacta sobre vectores aleatorios
+        rng = np.random.default_rng(0)
+        vectors = rng.normal(size=(3000, 32)).astype(np.float32)
+        queries = rng.normal(size=(50, 32)).astype(np.float32)
+        faiss.normalize_L2(vectors)
+        faiss.normalize_L2(queries)
+
+        exact = faiss.IndexFlatIP(32)
+        exact.add(vectors)
+        _, expected = exact.search(queries, 10)
+
+        db = VectorIndex(embeddings=None)
+        db.add(vectors)
+        db.optimize(kind="hnsw", target_recall=0.95)
+        _, found = db.index.search(queries, 10)
+        recall = np.mean([len(set(a) & set(b)) / 10 for a, b in zip(found, expected)])
+        assert db.spec.kind == "hnsw" and recall >= 0.9, f"Recall insuficiente: {recall:.2f}"
+
+        print(f"✅ flat/hnsw/ivf según tamaño (recall HNSW@10: {recall:.2f})")
+        return True
+    except Exception as e:
+        print(f"❌ Error en selección de índice: {e}")
+        return False
+
+
+def test_incremental_index():
+    """Prueba añadir y borrar documentos de un índice sin reconstruirlo"""
+    print("\n🔍 Probando índice incremental (añadir / borrar documentos)...")
+    try:
+        import tempfile
+        import numpy as np
+        from src.rag_engine import VectorIndex, load_index, save_index
+
+        rng = np.random.default_rng(0)
+        db = VectorIndex(embeddings=None)
+
+        # Chunks sin documento registrado (índices antiguos) y dos documentos
+        db.store.add_text("chunk suelto")
+        db.add(rng.normal(size=(1, 16)))
+        for doc_id in ("doc-a", "doc-b"):
+            mark = db.store.mark()
+            for n in range(5):
+                start = db.store.append_page(f"{doc_id} página {n}")
+                db.store.add_span(start, db.store.buffer_size)
+            db.add(rng.normal(size=(5, 16)))
+            db.store.register_document(doc_id, f"{doc_id}.pdf", mark)
+
+        query = db.index.reconstruct(1)  # primer chunk de doc-a
+        assert db.search_by_vector(query, k=1)[0][0] == 1, "Búsqueda previa incorrecta"
+
+        assert db.delete_document("doc-a") == 5, "No se borraron los chunks del documento"
+        hits = db.search_by_vector(query, k=6)
+        assert len(hits) == 6 and all(not 1 <= i <= 5 for i, _ in hits), "Se devolvió un chunk borrado"
+
+        assert db.compact() == 5 and len(db) == 6, "La compactación no eliminó los tombstones"
+        texts = [db.store.get_text(i) for i in range(len(db.store))]
+        assert texts[0] == "chunk suelto" and texts[1] == "doc-b página 0", "Texto desplazado al compactar"
+        assert db.store.documents["doc-b"].first_chunk == 1, "Tramo del documento incorrecto"
+
+        # Añadir, borrar, volver a añadir y borrar el mismo documento: los dos tramos
+        # siguen borrados tras guardar y cargar el índice
+        again = VectorIndex(embeddings=None)
+        for _ in range(2):
+            mark = again.store.mark()
+            for n in range(4):
+                start = again.store.append_page(f"doc-a página {n}")
+                again.store.add_span(start, again.store.buffer_size)
+            again.add(rng.normal(size=(4, 16)))
+            again.store.register_document("doc-a", "doc-a.pdf", mark)
+            again.delete_document("doc-a")
+        assert len(again.store.deleted) == 8
+
+        with tempfile.TemporaryDirectory() as tmp:
+            save_index(again, index_path=tmp)
+            loaded = load_index(tmp, embeddings=object())
+            assert len(loaded.store.deleted) == 8, "Se perdió un tramo borrado al cargar"
+            assert loaded.search_by_vector(again.index.reconstruct(0), k=4) == [], \
+                "Un chunk borrado volvió a aparecer tras cargar"
+
+        print(f"✅ Documento borrado con tombstones y compactado ({len(db)} chunks vivos)")
+        return True
+    except Exception as e:
+        print(f"❌ Error en índice incremental: {e}")
+        return False
+
+
+def test_index_persistence():
+    """Prueba el formato en disco (sin pickle) y la carga con mmap"""
+    print("\n🔍 Probando persistencia del índice con mmap...")
+    try:
+        import os
+        import tempfile
+        import numpy as np
+        from src.rag_engine import VectorIndex, save_index, load_index
+
+        rng = np.random.default_rng(0)
+        db = VectorIndex(embeddings=None)
+        for n in range(50):
+            db.store.add_text(f"Chunk {n} con acentos: índice, señal")
+        vectors = rng.normal(size=(50, 16)).astype(np.float32)
+        db.add(vectors)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            index_path = os.path.join(tmp, "faiss_index")
+            save_index(db, index_path=index_path)
+            assert not any(name.endswith(".pkl") for name in os.listdir(index_path)), "Se usó pickle"
+
+            loaded = load_index(index_path, embeddings=object())
+            assert loaded.store.is_mapped, "El almacén no se abrió con mmap"
+            assert loaded.search_by_vector(vectors[7], k=1)[0][0] == 7, "Búsqueda incorrecta tras cargar"
+            assert loaded.store.get_text(7) == db.store.get_text(7), "Texto distinto tras cargar"
+
+            # Modificar un índice mapeado lo copia a memoria sin tocar los ficheros
+            loaded.store.add_text("Chunk nuevo")
+            loaded.add(rng.normal(size=(1, 16)))
+            assert len(loaded) == 51 and len(load_index(index_path, embeddings=object())) == 50
+
+        print("✅ Índice guardado sin pickle y abierto con mmap")
+        return True
+    except Exception as e:
+        print(f"❌ Error en persistencia del índice: {e}")
+        return False
+
+
+def test_index_manifest():
+    """Prueba la validación del manifest y la reconstrucción selectiva"""
+    print("\n🔍 Probando manifest del índice (modelo y chunking)...")
+    import os
+    import json
+    import tempfile
+    from src import rag_engine
+
+    # open_index e ingest_pdf_to_index usan la caché en disco: apuntarla a un directorio temporal
+    cache_dir = tempfile.TemporaryDirectory()
+    default_cache_path = rag_engine.EMBEDDING_CACHE_PATH
+    rag_engine.EMBEDDING_CACHE_PATH = os.path.join(cache_dir.name, "embedding_cache.sqlite")
+    try:
+        from src.rag_engine import (
+            VectorIndex, IndexSettings, IndexCompatibilityError, generate_embeddings,
+            ingest_pdf_to_index, iter_store_chunks, save_index, load_index, open_index
+        )
+
+        settings = IndexSettings(chunk_size=300, chunk_overlap=50)
+        db = VectorIndex(generate_embeddings(settings.model_name))
+        db.settings = settings
+
+        pages = [f"Página {n}. Los embeddings representan texto como vectores densos. " * 10 for n in range(4)]
+        mark = db.store.mark()
+        ids = list(iter_store_chunks(iter(pages), db.store, settings.chunk_size, settings.chunk_overlap))
+        db.add(db.embeddings.embed_documents([db.store.get_text(i) for i in ids]))
+        db.store.register_document("doc-hash", "doc.pdf", mark)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            index_path = os.path.join(tmp, "faiss_index")
+            save_index(db, index_path=index_path)
+
+            # Misma configuración: se reutiliza sin reconstruir
+            reused = open_index(index_path, settings)
+            assert reused.mapped and len(reused) == len(db), "Se reconstruyó sin cambios"
+
+            # Otro chunking: se vuelve a dividir desde las páginas guardadas
+            smaller = IndexSettings(chunk_size=150, chunk_overlap=30)
+            rebuilt = open_index(index_path, smaller)
+            assert len(rebuilt) > len(db), "No se volvió a dividir en chunks"
+            assert load_index(index_path).settings == smaller, "El manifest no se actualizó"
+
+            class OtherModel:
+                model_name = "otro-modelo"
+
+            try:
+                load_index(index_path, OtherModel())
+                raise AssertionError("Se cargó el índice con otro modelo")
+            except IndexCompatibilityError as e:
+                assert "model_name" in e.changes
+
+            # Un índice incompatible no se sobrescribe al ingerir otro PDF
+            manifest_path = os.path.join(index_path, "manifest.json")
+            with open(manifest_path, encoding="utf-8") as f:
+                manifest = json.load(f)
+            manifest["version"] = 99
+            with open(manifest_path, "w", encoding="utf-8") as f:
+                json.dump(manifest, f)
+            pdf_path = os.path.join(tmp, "otro.pdf")
+            with open(pdf_path, "wb") as f:
+                f.write(make_pdf(["Otro documento distinto"]))
+            try:
+                ingest_pdf_to_index(pdf_path, index_path, settings.model_name, persist=True)
+                raise AssertionError("Se reconstruyó un índice incompatible")
+            except IndexCompatibilityError:
+                with open(manifest_path, encoding="utf-8") as f:
+                    assert json.load(f)["version"] == 99, "Se sobrescribió el índice guardado"
+        assert os.path.exists(rag_engine.EMBEDDING_CACHE_PATH), "No se usó la caché en disco temporal"
+
+        print(f"✅ Manifest validado ({len(db)} → {len(rebuilt)} chunks al cambiar chunk_size)")
+        return True
+    except Exception as e:
+        print(f"❌ Error en manifest del índice: {e}")
+        return False
+    finally:
+        rag_engine.EMBEDDING_CACHE_PATH = default_cache_path
+        cache_dir.cleanup()
+
+
+def test_embedding_cache():
+    """Prueba la caché de embeddings de chunks (memoria, disco y LRU)"""
+    print("\n🔍 Probando caché de embeddings de chunks...")
+    try:
+        import os
+        import tempfile
+        import numpy as np
+        from src.rag_engine import (
+            CachedEmbeddings, DiskEmbeddingStore, EmbeddingCache, DEFAULT_MODEL_NAME
+        )
+
+        cache = EmbeddingCache(max_mb=1)
+        embeddings = CachedEmbeddings(DEFAULT_MODEL_NAME, cache)
+
+        texts = ["Los transformers usan atención.", "FAISS indexa vectores.", "Los transformers usan atención."]
+        first = embeddings.embed_documents(texts)
+        assert cache.misses == 2 and cache.hits == 1, "El lote no se deduplicó"
+        assert first[0] == first[2], "Textos iguales con vectores distintos"
+
+        # Mismo texto con otros espacios: acierto sin volver al modelo
+        again = embeddings.embed_documents(["Los  transformers usan\natención."])
+        assert cache.hits == 2 and np.allclose(again[0], first[0]), "No se normalizó el texto"
+
+        with tempfile.TemporaryDirectory() as tmp:
+            disk = DiskEmbeddingStore(os.path.join(tmp, "cache.sqlite"))
+            CachedEmbeddings(DEFAULT_MODEL_NAME, EmbeddingCache(), disk).embed_documents(texts)
+            fresh = EmbeddingCache()
+            CachedEmbeddings(DEFAULT_MODEL_NAME, fresh, disk).embed_documents(texts)
+            assert fresh.disk_hits == 2 and fresh.misses == 0, "No se leyó la caché en disco"
+
+        # Presupuesto mínimo: se descartan las entradas más antiguas
+        vector = np.zeros(len(first[0]), dtype=np.float32)
+        tiny = EmbeddingCache(max_mb=1)
+        tiny.max_bytes = 2 * (vector.nbytes + EmbeddingCache._ENTRY_OVERHEAD_BYTES)
+        for n in range(4):
+            tiny.put(str(n), vector)
+        assert tiny.get("0") is None and tiny.get("3") is not None, "No se aplicó el LRU"
+        assert tiny.stats()["entries"] == 2 and tiny.evictions == 2
+
+        print(f"✅ Caché de embeddings correcta ({cache.stats()['hit_rate']:.0%} de aciertos)")
+        return True
+    except Exception as e:
+        print(f"❌ Error en caché de embeddings: {e}")
+        return False
+
+
+def test_query_embedding_cache():
+    """Prueba que una pregunta repetida no vuelve a pasar por el modelo"""
+    print("\n🔍 Probando caché de embeddings de queries...")
+    try:
+        from src.rag_engine import (
+            VectorIndex, CachedEmbeddings, EmbeddingCache, DEFAULT_MODEL_NAME, retrieve_relevant_chunks
+        )
+
+        queries = EmbeddingCache(max_mb=1)
+        embeddings = CachedEmbeddings(DEFAULT_MODEL_NAME, EmbeddingCache(), query_cache=queries)
+        db = VectorIndex(embeddings)
+        for text in ("La atención escala cuadráticamente.", "FAISS busca vecinos cercanos."):
+            db.store.add_text(text)
+        db.add(embeddings.embed_documents([db.store.get_text(i) for i in range(2)]))
+
+        first = retrieve_relevant_chunks(db, "¿Cómo escala la atención?", k=2)
+        again = retrieve_relevant_chunks(db, "  ¿Cómo escala   la atención? ", k=2)
+        assert queries.misses == 1 and queries.hits == 1, "La query se volvió a embeber"
+        assert first == again, "Resultados distintos para la misma pregunta"
+
+        print(f"✅ Query repetida servida desde caché ({queries.stats()['entries']} entrada)")
+        return True
+    except Exception as e:
+        print(f"❌ Error en caché de queries: {e}")
+        return False
+
+
+def test_retrieval_cache():
+    """Prueba que la búsqueda se hace una vez a max_k y se recorta para k menores"""
+    print("\n🔍 Probando caché de búsquedas por documento y query...")
+    try:
+        from src.rag_engine import VectorIndex, RetrievalCache, generate_embeddings, retrieve_relevant_chunks
+
+        db = VectorIndex(generate_embeddings())
+        texts = [f"Sección {n}: resultados del experimento número {n}." for n in range(12)]
+        for text in texts:
+            db.store.add_text(text)
+        db.add(db.embeddings.embed_documents(texts))
+
+        cache = RetrievalCache(max_k=10)
+        top10 = cache.search(db, "resultados del experimento", k=10, doc_key="doc")
+        top3 = cache.search(db, "resultados del experimento", k=3, doc_key="doc")
+        assert cache.misses == 1 and cache.hits == 1, "Se repitió la búsqueda al cambiar k"
+        assert top3 == top10[:3] == retrieve_relevant_chunks(db, "resultados del experimento", k=3)
+
+        # Si el índice cambia, la búsqueda se repite
+        db.store.add_text("Sección nueva: resultados del experimento final.")
+        db.add(db.embeddings.embed_documents([db.store.get_text(len(db))]))
+        cache.search(db, "resultados del experimento", k=3, doc_key="doc")
+        assert cache.misses == 2, "Se usaron resultados de un índice desactualizado"
+
+        print(f"✅ Búsqueda reutilizada para k=10 y k=3 ({cache.stats()['hit_rate']:.0%} de aciertos)")
+        return True
+    except Exception as e:
+        print(f"❌ Error en caché de búsquedas: {e}")
+        return False
+
+
+def test_embedding_pool():
+    """Prueba que el pool de procesos genera los mismos vectores que el modelo local"""
+    print("\n🔍 Probando pool de procesos de embeddings...")
+    try:
+        import numpy as np
+        from src.embedding_pool import EmbeddingPool
+        from src.rag_engine import generate_embeddings, DEFAULT_MODEL_NAME
+
+        local = generate_embeddings().embeddings
+        pool = EmbeddingPool(DEFAULT_MODEL_NAME, fallback=local.embed_documents, workers=2, min_texts=1)
+        texts = [f"Chunk {n} del documento\ncon saltos de línea." for n in range(10)]
+        try:
+            pooled = pool.embed_documents(texts)
+        finally:
+            pool.shutdown()
+
+        assert len(pooled) == len(texts), "Faltan vectores"
+        assert np.allclose(pooled, local.embed_documents(texts), atol=1e-5), "Vectores distintos al modelo local"
+
+        print(f"✅ {len(texts)} chunks embebidos en 2 procesos con los mismos vectores")
+        return True
+    except Exception as e:
+        print(f"❌ Error en pool de embeddings: {e}")
+        return False
+
+
+def test_onnx_backend():
+    """Prueba que el backend ONNX genera vectores compatibles con los de PyTorch"""
+    print("\n🔍 Probando backend de embeddings ONNX...")
+
+    try:
+        import onnxruntime  # noqa: F401
+    except ImportError:
+        print("⚠️  onnxruntime no instalado, saltando prueba del backend ONNX")
+        return True
+
+    try:
+        import tempfile
+        import numpy as np
+        from src.onnx_embeddings import OnnxEmbeddings
+        from src.rag_engine import generate_embeddings, DEFAULT_MODEL_NAME
+
+        texts = ["Los embeddings representan\ntexto como vectores.", "FAISS busca vecinos. " * 60]
+        expected = np.array(generate_embeddings().embeddings.embed_documents(texts))
+
+        with tempfile.TemporaryDirectory() as tmp:
+            fp32 = np.array(OnnxEmbeddings(DEFAULT_MODEL_NAME, base_dir=tmp).embed_documents(texts))
+            int8 = np.array(OnnxEmbeddings(DEFAULT_MODEL_NAME, quantize=True, base_dir=tmp).embed_documents(texts))
+
+        assert np.abs(fp32 - expected).max() < 1e-4, "ONNX FP32 difiere de PyTorch"
+        assert (int8 * expected).sum(axis=1).min() > 0.98, "ONNX INT8 demasiado lejos de PyTorch"
+
+        print(f"✅ ONNX compatible (FP32 Δ={np.abs(fp32 - expected).max():.1e}, "
+              f"INT8 coseno={(int8 * expected).sum(axis=1).min():.4f})")
+        return True
+    except Exception as e:
+        print(f"❌ Error en backend ONNX: {e}")
+        return False
+
+
+def test_embedding_service():
+    """Prueba que el servicio local agrupa peticiones concurrentes en micro-lotes"""
+    print("\n🔍 Probando servicio local de embeddings...")
+    try:
+        import threading
+        import numpy as np
+        from src.embedding_service import EmbeddingService, RemoteEmbeddings
+        from src.rag_engine import generate_embeddings, DEFAULT_MODEL_NAME
+
+        service = EmbeddingService(port=0, max_wait_ms=50).start()
+        try:
+            client = RemoteEmbeddings(DEFAULT_MODEL_NAME, url=service.url)
+            vectors = {}
+
+            def ask(n):
+                vectors[n] = client.embed_query(f"¿Qué dice la sección {n}?")
+
+            threads = [threading.Thread(target=ask, args=(n,)) for n in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            stats = client.stats()[DEFAULT_MODEL_NAME]
+        finally:
+            service.stop()
+
+        local = generate_embeddings().embeddings
+        for n, vector in vectors.items():
+            assert np.allclose(vector, local.embed_query(f"¿Qué dice la sección {n}?"), atol=1e-5)
+        assert stats["requests"] == 8 and stats["batches"] < 8, "No se agruparon las peticiones"
+
+        print(f"✅ 8 peticiones concurrentes en {stats['batches']} micro-lote(s) "
+              f"(histograma {stats['batch_size_histogram']})")
+        return True
+    except Exception as e:
+        print(f"❌ Error en servicio de embeddings: {e}")
+        return False
+
+
+def test_length_bucketing():
+    """Prueba que ordenar por longitud reduce el relleno sin cambiar los vectores"""
+    print("\n🔍 Probando batching por longitud...")
+    try:
+        import numpy as np
+        from src.rag_engine import (
+            CachedEmbeddings, EmbeddingCache, DEFAULT_MODEL_NAME, generate_embeddings,
+            get_model_tokenizer, measure_padding
+        )
+
+        # Chunks completos mezclados con colas de página y títulos
+        texts = []
+        for n in range(40):
+            texts.append(f"Sección {n}" if n % 3 else "Los resultados del experimento muestran mejoras. " * 12)
+
+        model = generate_embeddings().embeddings
+        tokenizer, max_tokens = get_model_tokenizer(model)
+        before = measure_padding(texts, tokenizer, max_tokens, batch_size=8, bucketed=False)
+        after = measure_padding(texts, tokenizer, max_tokens, batch_size=8, bucketed=True)
+        assert before.tokens == after.tokens, "Distinto número de tokens reales"
+        assert after.padded_tokens < before.padded_tokens, "El orden por longitud no redujo el relleno"
+
+        vectors = CachedEmbeddings(DEFAULT_MODEL_NAME, EmbeddingCache()).embed_documents(texts)
+        assert np.allclose(vectors, model.embed_documents(texts), atol=1e-5), "Se perdió el orden original"
+
+        print(f"✅ Relleno {before.padding_ratio:.0%} → {after.padding_ratio:.0%} con los mismos vectores")
+        return True
+    except Exception as e:
+        print(f"❌ Error en batching por longitud: {e}")
+        return False
+
+
+def test_answer_streaming():
+    """Prueba el streaming de respuestas y la vuelta a la llamada bloqueante"""
+    print("\n🔍 Probando streaming de respuestas...")
+    try:
+        from types import SimpleNamespace
+        from src.answer_streaming import AnswerTiming, stream_answer
+
+        class StreamingModel:
+            def stream(self, messages):
+                for token in ("La ", "respuesta ", "completa."):
+                    yield SimpleNamespace(content=token)
+
+            def invoke(self, messages):
+                raise AssertionError("No debería usar la llamada bloqueante")
+
+        class BrokenStreamModel:
+            def stream(self, messages):
+                yield SimpleNamespace(content="La ")
+                raise ConnectionError("conexión cortada")
+
+            def invoke(self, messages):
+                return SimpleNamespace(content="La respuesta completa.")
+
+        messages = [{"role": "user", "content": "¿Qué dice el documento?"}]
+        timing = AnswerTiming()
+        snapshots = list(stream_answer(StreamingModel(), messages, timing))
+        assert snapshots == ["La ", "La respuesta ", "La respuesta completa."], "Tokens mal acumulados"
+        assert timing.streamed and timing.chunks == 3 and timing.time_to_first_token is not None
+
+        fallback = AnswerTiming()
+        answer = list(stream_answer(BrokenStreamModel(), messages, fallback))[-1]
+        assert answer == "La respuesta completa." and not fallback.streamed, "No se usó la llamada bloqueante"
+        assert "ConnectionError" in fallback.fallback_reason
+
+        print("✅ Respuesta acumulada por tokens y fallback bloqueante si el streaming falla")
+        return True
+    except Exception as e:
+        print(f"❌ Error en streaming de respuestas: {e}")
+        return False
+
+
+def test_context_assembler():
+    """Prueba el presupuesto de tokens y la eliminación de solapamientos del contexto"""
+    print("\n🔍 Probando ensamblado del contexto para Mistral...")
+    try:
+        from src.rag_engine import split_into_chunks
+        from src.context_assembler import assemble_context, estimate_tokens
+
+        text = " ".join(f"La frase número {n} describe un resultado distinto del experimento." for n in range(60))
+        chunks = split_into_chunks(text, chunk_size=300, chunk_overlap=80)
+        # Fragmentos contiguos recuperados con scores decrecientes
+        retrieved = [(chunk, 0.9 - i * 0.05) for i, chunk in enumerate(chunks[:4])]
+
+        full = assemble_context(retrieved, budget=10_000)
+        assert full.overlap_chars > 0, "No se eliminó el solapamiento entre fragmentos contiguos"
+        assert len(full.fragments) == 4 and full.dropped == 0
+        joined = " ".join(fragment for fragment, _ in full.fragments)
+        assert all(f"número {n} " in joined for n in range(10)), "Se perdió texto al quitar solapamientos"
+
+        prompt = "Eres un asistente experto. " * 20
+        budget = estimate_tokens(prompt) + 150
+        tight = assemble_context(retrieved, fixed_prompt=prompt, budget=budget)
+        assert tight.tokens <= budget and tight.dropped > 0, "No se respetó el presupuesto"
+        assert tight.fragments[0][1] == 0.9, "No se priorizó el fragmento más relevante"
+
+        # Un fragmento que no cabe se recorta con el contador de tokens indicado
+        def count_chars(text):
+            return len(text)
+
+        cut = assemble_context([("x" * 500, 0.9)], budget=100, count_tokens=count_chars)
+        assert cut.fragments and cut.tokens <= 100, "El recorte superó el presupuesto"
+
+        print(f"✅ {full.overlap_chars} caracteres de solapamiento eliminados; "
+              f"{len(tight.fragments)}/4 fragmentos en {budget} tokens")
+        return True
+    except Exception as e:
+        print(f"❌ Error en ensamblado del contexto: {e}")
+        return False
+
+
+def test_answer_cache():
+    """Prueba la caché de respuestas (clave, TTL, límite y tasa de aciertos)"""
+    print("\n🔍 Probando caché de respuestas...")
+    try:
+        import time
+        from src.answer_cache import AnswerCache
+
+        fragments = [("Los transformers usan atención.", 0.9)]
+        key = AnswerCache.make_key("doc", "¿De qué trata?", fragments, "mistral-small-latest", "Balanceado")
+        assert key == AnswerCache.make_key("doc", "  ¿de QUÉ trata? ", fragments, "mistral-small-latest", "Balanceado")
+        for other in (
+            AnswerCache.make_key("otro-doc", "¿De qué trata?", fragments, "mistral-small-latest", "Balanceado"),
+            AnswerCache.make_key("doc", "¿De qué trata?", fragments, "mistral-large-latest", "Balanceado"),
+            AnswerCache.make_key("doc", "¿De qué trata?", fragments, "mistral-small-latest", "Conciso"),
+            AnswerCache.make_key("doc", "¿De qué trata?", fragments + [("Otro fragmento.", 0.5)],
+                                 "mistral-small-latest", "Balanceado"),
+        ):
+            assert other != key, "La clave no distingue documento, modelo, detalle o fragmentos"
+
+        cache = AnswerCache(ttl_seconds=60, max_entries=2)
+        assert cache.get(key) is None
+        cache.put(key, "Trata sobre transformers.")
+        assert cache.get(key) == "Trata sobre transformers."
+        cache.put("b", "B")
+        cache.put("c", "C")
+        assert cache.get(key) is None and cache.stats()["entries"] == 2, "No se aplicó el límite de entradas"
+
+        short = AnswerCache(ttl_seconds=0)
+        short.put(key, "Respuesta")
+        time.sleep(0.01)
+        assert short.get(key) is None and short.expired == 1, "No caducó la respuesta"
+
+        print(f"✅ Caché de respuestas correcta ({cache.stats()['hit_rate']:.0%} de aciertos)")
+        return True
+    except Exception as e:
+        print(f"❌ Error en caché de respuestas: {e}")
+        return False
+
+
+def test_semantic_answer_cache():
+    """Prueba la caché semántica de respuestas (paráfrasis, umbral y documento)"""
+    print("\n🔍 Probando caché semántica de respuestas...")
+    try:
+        import numpy as np
+        from src.answer_cache import SemanticAnswerCache
+
+        rng = np.random.default_rng(0)
+        question = rng.normal(size=32)
+        paraphrase = question + rng.normal(scale=0.1, size=32)
+        unrelated = rng.normal(size=32)
+
+        model, detail = "mistral-small-latest", "Balanceado"
+        cache = SemanticAnswerCache(threshold=0.9, max_per_document=2)
+        assert cache.get("doc", "¿De qué trata?", question, model, detail, 4) is None
+        cache.put("doc", "¿De qué trata?", question, "Trata sobre transformers.", model, detail, 4)
+
+        hit = cache.get("doc", "¿Cuál es el tema?", paraphrase, model, detail, 4)
+        assert hit is not None and hit[0] == "Trata sobre transformers.", "No se reutilizó la paráfrasis"
+        assert hit[1] >= 0.9
+        assert cache.get("doc", "¿Quién lo firma?", unrelated, model, detail, 4) is None, \
+            "Se reutilizó la respuesta de una pregunta distinta"
+        assert cache.get("otro-doc", "¿Cuál es el tema?", paraphrase, model, detail, 4) is None
+        assert cache.get("doc", "¿Cuál es el tema?", paraphrase, model, "Conciso", 4) is None
+        # Otro top_k o la misma pregunta (su contexto cambió): se vuelve a generar
+        assert cache.get("doc", "¿Cuál es el tema?", paraphrase, model, detail, 8) is None
+        assert cache.get("doc", " ¿de qué TRATA? ", question, model, detail, 4) is None, \
+            "Se reutilizó la misma pregunta con otro contexto"
+
+        cache.put("doc", "¿Quién lo firma?", unrelated, "Otra respuesta.", model, detail, 4)
+        cache.put("doc", "¿Y el año?", rng.normal(size=32), "Tercera respuesta.", model, detail, 4)
+        assert cache.stats()["entries"] == 2, "No se aplicó el límite por documento"
+        assert cache.get("doc", "¿Cuál es el tema?", paraphrase, model, detail, 4) is None, \
+            "No se descartó la pregunta más antigua"
+
+        print(f"✅ Caché semántica correcta (similitud de la paráfrasis: {hit[1]:.0%})")
+        return True
+    except Exception as e:
+        print(f"❌ Error en caché semántica de respuestas: {e}")
+        return False
+
+
+def test_shared_index_cache():
+    """Prueba que el mismo contenido se construye una vez y se libera al final"""
+    print("\n🔍 Probando caché de índices compartidos...")
+    try:
+        from src.rag_engine import ProgressiveIndex, SharedIndexCache, compute_document_hash
+
+        cache = SharedIndexCache(session_ttl_seconds=3600)
+        doc_hash = compute_document_hash(b"%PDF-1.4 contenido de prueba")
+        key = (doc_hash, "modelo", 900, 150)
+        builds = []
+
+        def builder():
+            builds.append(1)
+            return object()
+
+        first = cache.acquire(key, "sesion-a", builder)
+        second = cache.acquire(key, "sesion-b", builder)
+        assert first is second and len(builds) == 1, "El índice se construyó dos veces"
+
+        cache.release(doc_hash, "sesion-a")
+        assert cache.stats()["indexes"] == 1, "Se eliminó un índice aún en uso"
+        cache.release(doc_hash, "sesion-b")
+        assert cache.stats()["indexes"] == 0, "El índice no se liberó"
+
+        # Un índice cuya construcción en segundo plano falla se descarta aunque tenga sesiones
+        failed = ProgressiveIndex(embeddings=None, total_pages=1)
+        failed.add_done_callback(lambda index: cache.discard(key, failed))
+        assert cache.acquire(key, "sesion-a", lambda: failed) is failed
+        failed.finish(error=RuntimeError("fallo de prueba"))
+        assert cache.stats()["indexes"] == 0, "El índice fallido siguió en caché"
+        assert cache.acquire(key, "sesion-b", builder) is not failed, "No se reintentó la ingesta"
+
+        print("✅ Índice compartido entre sesiones y liberado al final")
+        return True
+    except Exception as e:
+        print(f"❌ Error en caché de índices: {e}")
+        return False
+
+
 def test_mistral_connection():
     """Prueba la conexión con Mistral AI"""
     print("\n🔍 Probando conexión con Mistral AI...")
@@ -135,8 +1000,31 @@ def main():
     tests = [
         ("Imports", test_imports),
         ("Embeddings", test_embeddings),
+        ("Embedding Registry", test_embedding_registry),
+        ("Parsed Document", test_parsed_document),
+        ("Parallel Extraction", test_parallel_extraction),
         ("Text Splitting", test_text_splitting),
+        ("Native Chunker", test_native_chunker),
+        ("Token Chunking", test_token_chunking),
+        ("Streaming Chunks", test_streaming_chunks),
+        ("Chunk Store", test_chunk_store),
         ("FAISS Index", test_faiss_index),
+        ("Adaptive Index", test_adaptive_index),
+        ("Incremental Index", test_incremental_index),
+        ("Index Persistence", test_index_persistence),
+        ("Index Manifest", test_index_manifest),
+        ("Embedding Cache", test_embedding_cache),
+        ("Query Embedding Cache", test_query_embedding_cache),
+        ("Retrieval Cache", test_retrieval_cache),
+        ("Embedding Pool", test_embedding_pool),
+        ("ONNX Backend", test_onnx_backend),
+        ("Embedding Service", test_embedding_service),
+        ("Length Bucketing", test_length_bucketing),
+        ("Answer Streaming", test_answer_streaming),
+        ("Context Assembler", test_context_assembler),
+        ("Answer Cache", test_answer_cache),
+        ("Semantic Answer Cache", test_semantic_answer_cache),
+        ("Shared Index Cache", test_shared_index_cache),
         ("Mistral Connection", test_mistral_connection)
     ]
 